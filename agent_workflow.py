@@ -1,34 +1,59 @@
-from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.graph import StateGraph, START, END
 
-from agents.fundamental_analysis_agent import fundamental_agent_node
-from agents.prediction_agent import final_analysis_node
-from agents.supervisor_agent import supervisor_node
-from agents.technical_analysis_agent import technical_agent_node
 from models.agent_state import AgentState
+from utils.checkpointer import SQLiteCheckpointSaver
+from utils.metrics import timed
+from utils.resilience import with_request_deadline
 
 from typing import Optional
 from datetime import datetime
-from typing import Any, Dict, AsyncGenerator
+from typing import Any, Dict, AsyncGenerator, Tuple
 from langchain_core.messages import HumanMessage
+from threading import Lock
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
+# supervisor - serial hub-and-spoke routing, parallel - fan-out of both analyses
+WORKFLOW_MODE = os.getenv("WORKFLOW_MODE", "supervisor")
+# node deltas and LLM tokens instead of full state snapshots
+STREAM_MODES = ["updates", "messages"]
+
 class AgentWorkflow():
-    def __init__(self, agent_memory: InMemorySaver):
+    def __init__(self, agent_memory: BaseCheckpointSaver, mode: str = WORKFLOW_MODE):
         self.workflow = None
         self.memory = agent_memory
+        self.mode = mode
         self.compiled_workflow = None
 
+    def add_node(self, name: str, node):
+        """Add a node whose duration is recorded in the metrics and whose calls keep the request deadline"""
+        self.workflow.add_node(name, timed("node", name)(with_request_deadline(node)))
+
     def create_workflow(self):
+        # The agents pull in the tool libraries and model clients, so they are imported when
+        # the graph is built rather than when this module is
+        if self.mode == "parallel":
+            self.create_parallel_workflow()
+        else:
+            self.create_supervisor_workflow()
+
+    def create_supervisor_workflow(self):
+        from agents.fundamental_analysis_agent import fundamental_agent_node
+        from agents.prediction_agent import final_analysis_node
+        from agents.supervisor_agent import supervisor_node
+        from agents.technical_analysis_agent import technical_agent_node
+
+        logger.info("Creating supervisor workflow...")
         self.workflow = StateGraph(AgentState)
     
         # Add nodes
-        self.workflow.add_node("supervisor", supervisor_node)
-        self.workflow.add_node("fundamental_analysis", fundamental_agent_node)
-        self.workflow.add_node("technical_analysis", technical_agent_node)
-        self.workflow.add_node("final_analysis", final_analysis_node)
+        self.add_node("supervisor", supervisor_node)
+        self.add_node("fundamental_analysis", fundamental_agent_node)
+        self.add_node("technical_analysis", technical_agent_node)
+        self.add_node("final_analysis", final_analysis_node)
         
         
         self.workflow.add_edge(START, "supervisor")
@@ -48,24 +73,54 @@ class AgentWorkflow():
         self.workflow.add_edge("final_analysis", "supervisor")
         
         self.compiled_workflow = self.workflow.compile(checkpointer=self.memory)
+
+    def create_parallel_workflow(self):
+        """Run fundamental and technical analysis concurrently and join them before the final analysis"""
+        from agents.fundamental_analysis_agent import fundamental_agent_node
+        from agents.prediction_agent import final_analysis_node
+        from agents.technical_analysis_agent import technical_agent_node
+
+        logger.info("Creating parallel workflow...")
+        self.workflow = StateGraph(AgentState)
+
+        self.add_node("fundamental_analysis", fundamental_agent_node)
+        self.add_node("technical_analysis", technical_agent_node)
+        self.add_node("final_analysis", final_analysis_node)
+
+        # Fan out: both analyses are scheduled in the same superstep
+        self.workflow.add_edge(START, "fundamental_analysis")
+        self.workflow.add_edge(START, "technical_analysis")
+
+        # Join: final analysis waits for both branches, results are merged by the state reducer
+        self.workflow.add_edge(["fundamental_analysis", "technical_analysis"], "final_analysis")
+        self.workflow.add_edge("final_analysis", END)
+
+        self.compiled_workflow = self.workflow.compile(checkpointer=self.memory)
     
-    def execute_workflow(self, state: AgentState, config):
-        return self.compiled_workflow.invoke(state, config=config)
+    async def execute_workflow(self, state: AgentState, config):
+        return await self.compiled_workflow.ainvoke(state, config=config)
     
     async def execute_workflow_streaming(
         self, 
         state: AgentState, 
         config: dict
-    ) -> AsyncGenerator[Dict[str, Any], None]:
-        """Execute workflow with streaming using astream"""
+    ) -> AsyncGenerator[Tuple[str, Any], None]:
+        """
+        Execute workflow with streaming using astream.
+
+        Yields (mode, chunk) pairs: ("updates", {node: delta}) after each node and
+        ("messages", (message_chunk, metadata)) for each LLM token.
+        """
         
         try:
-            async for chunk in self.compiled_workflow.astream(state, config=config, stream_mode="values"):
-                yield chunk
+            async for mode, chunk in self.compiled_workflow.astream(
+                state, config=config, stream_mode=STREAM_MODES
+            ):
+                yield mode, chunk
                 
         except Exception as e:
-            logger.error(f"Streaming workflow error: {str(e)}")
-            yield {
+            logger.error("Streaming workflow error: %s", e)
+            yield "error", {
                 "error": str(e),
                 "timestamp": datetime.now().isoformat(),
                 "type": "error"
@@ -85,5 +140,18 @@ class AgentWorkflow():
             return "FINISH"
         
         
-agent_workflow = AgentWorkflow(InMemorySaver())
-agent_workflow.create_workflow()
+_agent_workflow: Optional[AgentWorkflow] = None
+_agent_workflow_lock = Lock()
+
+
+def get_agent_workflow() -> AgentWorkflow:
+    """Build and compile the workflow on first use"""
+    global _agent_workflow
+    if _agent_workflow is None:
+        with _agent_workflow_lock:
+            if _agent_workflow is None:
+                workflow = AgentWorkflow(SQLiteCheckpointSaver())
+                workflow.create_workflow()
+                _agent_workflow = workflow
+    return _agent_workflow
+
@@ -1,18 +1,26 @@
+import asyncio
 import logging
+import os
+from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.tools import BaseTool
 from langgraph.prebuilt import create_react_agent
 
-from typing import List
-from utils.agent_prompts import FUNDAMENTAL_AGENT_PROMPT
+from typing import Dict, List
+from utils.agent_prompts import FUNDAMENTAL_AGENT_PROMPT, FUNDAMENTAL_PREFETCH_PROMPT
 from models.agent_state import AgentState
 from tools.fundamental_analysis_tools import fundamental_tools
 from utils.llm_connection import LLMConnection
+from utils.compaction import build_digest, compact_messages, message_text
+from utils.resilience import within_deadline
+from agents.routing import unavailable_analysis
 import datetime
 from typing import Any
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
-llm_model = LLMConnection().get_llm()
+
+# prefetch - run all tools concurrently then reason once, react - tool calling agent loop
+FUNDAMENTAL_AGENT_MODE = os.getenv("FUNDAMENTAL_AGENT_MODE", "prefetch")
 
 class FundamentalAnalysisAgent():
     def __init__(self):
@@ -29,32 +37,80 @@ class FundamentalAnalysisAgent():
                 prompt=self.prompt
             )
         
-    def ask_agent(self, state: AgentState) -> dict[str, Any] | Any:
+    async def ask_agent(self, state: AgentState) -> dict[str, Any] | Any:
         logger.info("Invoking Fundamental Analysis Agent...")
-        return self.agent.invoke(state)
+        return await self.agent.ainvoke(state)
+
+    async def prefetch_tool_results(self, ticker: str) -> Dict[str, str]:
+        """
+        Run every fundamental tool concurrently for the ticker. Tools still running when only
+        the reasoning and final analysis reserves of the deadline are left are reported as errors.
+        """
+        logger.info("Prefetching fundamental tool results for %s...", ticker)
+        results = await asyncio.gather(
+            *[within_deadline(tool.ainvoke({"ticker": ticker}), reserve_steps=2) for tool in fundamental_tools],
+            return_exceptions=True
+        )
+
+        tool_results = {}
+        for tool, result in zip(fundamental_tools, results):
+            if isinstance(result, Exception):
+                logger.error("Tool %s failed for %s: %s", tool.name, ticker, result)
+                result = f"Error: {str(result)}"
+            tool_results[tool.name] = result
+        return tool_results
+
+    async def ask_with_prefetch(self, model, state: dict, ticker: str) -> dict[str, Any]:
+        """Answer in a single reasoning step over the prefetched tool results"""
+        tool_results = await self.prefetch_tool_results(ticker)
+        context = "\n\n".join(f"## {name}\n{result}" for name, result in tool_results.items())
+
+        logger.info("Invoking Fundamental Analysis Agent with prefetched tool results...")
+        response = await model.ainvoke([
+            SystemMessage(content=FUNDAMENTAL_PREFETCH_PROMPT),
+            *state["messages"],
+            HumanMessage(content=f"Fundamental tool results for {ticker}:\n\n{context}"),
+        ])
+        return {"messages": [response]}
         
 fundamental_analysis_agent = FundamentalAnalysisAgent()
     
-def fundamental_agent_node(state: AgentState) -> AgentState:
-    logger.info("Fundamental Analysis Node: Creating and invoking agent.")
-    fundamental_analysis_agent.create_agent(llm_model)
-    
-    response = fundamental_analysis_agent.ask_agent(state)
-    logger.info(f"Fundamental Analysis Node Response: {response}")
+async def fundamental_agent_node(state: AgentState) -> AgentState:
+    # The agent only sees the query and digests of earlier analyses
+    agent_state = {"messages": compact_messages(state, "fundamental_analysis")}
+
+    ticker = None
+    if FUNDAMENTAL_AGENT_MODE == "prefetch":
+        ticker = state.get("metadata", {}).get("ticker")
+
+    try:
+        # The final analysis step keeps its reserve of the deadline
+        if ticker:
+            logger.info("Fundamental Analysis Node: Prefetching tools for %s.", ticker)
+            response = await within_deadline(
+                fundamental_analysis_agent.ask_with_prefetch(LLMConnection().get_llm(), agent_state, ticker),
+                reserve_steps=1
+            )
+        else:
+            logger.info("Fundamental Analysis Node: Creating and invoking agent.")
+            fundamental_analysis_agent.create_agent(LLMConnection().get_llm())
+            response = await within_deadline(fundamental_analysis_agent.ask_agent(agent_state), reserve_steps=1)
+    except Exception as e:
+        return unavailable_analysis("fundamental", "fundamental_analysis", e)
+    logger.debug("Fundamental Analysis Node Response: %s", response)
     
     fundamental_result = {
         "timestamp": datetime.now().isoformat(),
         "agent": "fundamental_analysis",
-        "status": "completed"
+        "mode": "prefetch" if ticker else "react",
+        "status": "completed",
+        "digest": build_digest("fundamental", message_text(response['messages'][-1]))
     }
     state["next_agent"] = "supervisor"
     logger.info("Fundamental Analysis Node: Completed.")
     
     return {
         'messages': [response['messages'][-1]],
-        'analysis_results': {
-            **state.get("analysis_results", {}),  
-            "fundamental": fundamental_result      
-        },
+        'analysis_results': {"fundamental": fundamental_result},
         'next_agent': 'supervisor'
     }
\ No newline at end of file
@@ -8,11 +8,13 @@ from utils.agent_prompts import PREDICTION_AGENT_PROMPT
 from models.agent_state import AgentState
 from models.structured_agent_response import PredictionDecision
 from utils.llm_connection import LLMConnection
+from utils.compaction import compact_messages
+from utils.resilience import within_deadline
+from agents.routing import UNAVAILABLE_STATUSES, analyses_with_status, deadline_passed
 import datetime
 from typing import Any
 
 logger = logging.getLogger(__name__)
-llm_model = LLMConnection().get_llm()
 
 class PredictionAgent():
     def __init__(self):
@@ -30,42 +32,50 @@ class PredictionAgent():
                 tools=[]
             )
         
-    def ask_agent(self, state: AgentState) -> dict[str, Any] | Any:
+    async def ask_agent(self, state: AgentState) -> dict[str, Any] | Any:
         logger.info("Invoking Prediction Agent...")
-        return self.agent.invoke(state)
+        return await self.agent.ainvoke(state)
         
 prediction_agent = PredictionAgent()
 
-def final_analysis_node(state: AgentState) -> AgentState:
+async def final_analysis_node(state: AgentState) -> AgentState:
     """Generate final comprehensive analysis"""
     logger.info("Prediction Node: Generating final comprehensive analysis.")
     
-    fundamental_completed = state.get("analysis_results", {}).get("fundamental", {}).get("status") == "completed"
-    technical_completed = state.get("analysis_results", {}).get("technical", {}).get("status") == "completed"
+    completed = analyses_with_status(state, "completed")
+    # Analyses that timed out or failed are left out, the recommendation notes them
+    missing = sorted(analyses_with_status(state, *UNAVAILABLE_STATUSES))
     
-    if fundamental_completed or technical_completed:
-        logger.info("Prediction Node: Fundamental or technical analysis completed. Creating and invoking agent.")
-        prediction_agent.create_agent(llm_model)
+    if completed:
+        logger.info("Prediction Node: %s analysis completed. Creating and invoking agent.", ", ".join(sorted(completed)))
+        prediction_agent.create_agent(LLMConnection().get_llm())
         
-        prediction = prediction_agent.ask_agent(state)
-        logger.info(f"Prediction Node Response: {prediction}")
+        try:
+            prediction = await within_deadline(prediction_agent.ask_agent({
+                "messages": compact_messages(state, "final_analysis")
+            }))
+        except Exception as e:
+            return unavailable_prediction(f"Prediction did not complete: {str(e) or type(e).__name__}", missing)
+        logger.debug("Prediction Node Response: %s", prediction)
         
-        if "final_recommendation" not in state:
-            state["final_recommendation"] = {}
-            
-        state["final_recommendation"] = {
+        final_recommendation = {
             "action": prediction['structured_response'].action,
             "confidence": prediction['structured_response'].confidence,
             "explanation": prediction['structured_response'].explanation
         }
+        if missing:
+            final_recommendation["partial"] = True
+            final_recommendation["missing_analyses"] = missing
         logger.info("Prediction Node: Final recommendation generated.")
         
-        state['next_agent'] = 'supervisor'
+        # Only the keys this node changed, so streamed updates stay deltas
         return {
-            **state,
+            'final_recommendation': final_recommendation,
             'messages': [prediction['messages'][-1]],
             'next_agent': 'supervisor'
         }
+    elif missing or deadline_passed(state):
+        return unavailable_prediction("No analysis finished in time", missing)
     else:
         logger.warning("Prediction Node: Analysis incomplete. Skipping prediction.")
         return {
@@ -73,4 +83,18 @@ def final_analysis_node(state: AgentState) -> AgentState:
                 HumanMessage(content="Analysis incomplete. Either fundamental or technical analysis required.")
             ],
             'next_agent': 'supervisor'
-        }
\ No newline at end of file
+        }
+
+
+def unavailable_prediction(reason: str, missing: List[str]) -> dict:
+    """Final state when no recommendation could be made; the workflow finishes with the reason"""
+    logger.warning("Prediction Node: %s.", reason)
+    return {
+        'final_recommendation': {
+            "status": "unavailable",
+            "reason": reason,
+            "missing_analyses": missing
+        },
+        'messages': [HumanMessage(content=f"{reason}.")],
+        'next_agent': 'supervisor'
+    }
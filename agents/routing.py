@@ -0,0 +1,168 @@
+import logging
+import re
+from datetime import datetime
+from typing import Any, Dict, Optional, Set
+
+from langchain_core.messages import HumanMessage
+from models.agent_state import AgentState
+from utils.resilience import request_deadline, remaining
+
+logger = logging.getLogger(__name__)
+
+# Keywords match whole words, so inflected forms are listed explicitly
+LONG_TERM_KEYWORDS = (
+    "long term", "long-term", "longterm", "invest", "investing", "investment", "investments",
+    "investor", "fundamental", "fundamentals", "valuation", "valuations",
+    "financials", "financial statement", "financial statements", "earnings", "balance sheet",
+    "cash flow", "dividend", "dividends", "hold for", "years", "retirement",
+)
+SHORT_TERM_KEYWORDS = (
+    "short term", "short-term", "shortterm", "intraday", "swing", "trade", "trades", "trading",
+    "technical", "technicals", "chart", "charts", "pattern", "patterns", "momentum", "breakout",
+    "breakouts", "support", "resistance", "moving average", "moving averages", "sma",
+    "today", "this week", "next week",
+)
+COMPREHENSIVE_KEYWORDS = (
+    "comprehensive", "complete analysis", "full analysis", "overall", "both",
+    "fundamental and technical", "technical and fundamental",
+)
+
+# analyses required for each query intent, in execution order
+INTENT_ANALYSES = {
+    "long_term": ["fundamental"],
+    "short_term": ["technical"],
+    "comprehensive": ["fundamental", "technical"],
+}
+
+ANALYSIS_AGENTS = {
+    "fundamental": "fundamental_analysis_agent",
+    "technical": "technical_analysis_agent",
+}
+
+# statuses of analyses that ran but produced nothing; they are not retried and the final
+# analysis works with the others
+UNAVAILABLE_STATUSES = ("timed_out", "failed")
+
+
+def _contains_any(text: str, keywords: tuple) -> bool:
+    return any(re.search(rf"\b{re.escape(keyword)}\b", text) for keyword in keywords)
+
+
+def classify_intent(query: str) -> Optional[str]:
+    """Classify a query as long_term, short_term or comprehensive. Returns None when ambiguous."""
+    text = (query or "").lower()
+
+    if _contains_any(text, COMPREHENSIVE_KEYWORDS):
+        return "comprehensive"
+
+    long_term = _contains_any(text, LONG_TERM_KEYWORDS)
+    short_term = _contains_any(text, SHORT_TERM_KEYWORDS)
+
+    if long_term and short_term:
+        return "comprehensive"
+    if long_term:
+        return "long_term"
+    if short_term:
+        return "short_term"
+    return None
+
+
+def get_query(state: AgentState) -> str:
+    """Return the user query from metadata or the first human message"""
+    query = state.get("metadata", {}).get("query")
+    if query:
+        return query
+    for message in state.get("messages", []):
+        if isinstance(message, HumanMessage):
+            return message.content
+    return ""
+
+
+def analyses_with_status(state: AgentState, *statuses: str) -> Set[str]:
+    return {
+        name for name, result in state.get("analysis_results", {}).items()
+        if isinstance(result, dict) and result.get("status") in statuses
+    }
+
+
+def is_finished(state: AgentState) -> bool:
+    """Whether the final analysis produced a recommendation, or gave up on one"""
+    final_recommendation = state.get("final_recommendation") or {}
+    return "action" in final_recommendation or final_recommendation.get("status") == "unavailable"
+
+
+def deadline_passed(state: AgentState, reserve_steps: int = 0) -> bool:
+    """Whether the request deadline, less the reserve of `reserve_steps` later steps, has passed"""
+    left = remaining(reserve_steps, deadline=request_deadline(state))
+    return left is not None and left <= 0
+
+
+def unavailable_analysis(analysis: str, agent: str, error: BaseException) -> Dict[str, Any]:
+    """Node update recording an analysis that timed out or failed, so the workflow carries on"""
+    status = "timed_out" if isinstance(error, TimeoutError) else "failed"
+    message = str(error) or type(error).__name__
+    logger.warning("%s analysis %s: %s", analysis.capitalize(), status.replace("_", " "), message)
+    return {
+        "analysis_results": {
+            analysis: {
+                "timestamp": datetime.now().isoformat(),
+                "agent": agent,
+                "status": status,
+                "error": message,
+            }
+        },
+        "next_agent": "supervisor",
+    }
+
+
+class RoutingEngine():
+    """Rule-based supervisor routing. Decides the next agent from AgentState without a model call."""
+
+    def decide(self, state: AgentState) -> Optional[str]:
+        if is_finished(state):
+            return "FINISH"
+        if deadline_passed(state, reserve_steps=1):
+            # No time left for another analysis
+            return "final_analysis_agent"
+
+        attempted = analyses_with_status(state, "completed", *UNAVAILABLE_STATUSES)
+
+        intent = classify_intent(get_query(state))
+        if intent is None:
+            # Ambiguous query, only decide when every analysis has already run
+            if set(ANALYSIS_AGENTS) <= attempted:
+                return "final_analysis_agent"
+            return None
+
+        for analysis in INTENT_ANALYSES[intent]:
+            if analysis not in attempted:
+                return ANALYSIS_AGENTS[analysis]
+        return "final_analysis_agent"
+
+    def fallback(self, state: AgentState) -> str:
+        """Route without a model: every analysis that has not run yet, then the final analysis"""
+        if is_finished(state):
+            return "FINISH"
+        attempted = analyses_with_status(state, "completed", *UNAVAILABLE_STATUSES)
+        for analysis in INTENT_ANALYSES["comprehensive"]:
+            if analysis not in attempted and not deadline_passed(state, reserve_steps=1):
+                return ANALYSIS_AGENTS[analysis]
+        return "final_analysis_agent"
+
+
+def record_hop(metadata: dict, next_agent: str, source: str) -> dict:
+    """Return metadata with the routing hop appended to the routing report"""
+    routing = dict(metadata.get("routing", {}))
+    routing["hops"] = routing.get("hops", 0) + 1
+    routing[f"{source}_hops"] = routing.get(f"{source}_hops", 0) + 1
+    routing["path"] = [*routing.get("path", []), {"next_agent": next_agent, "source": source}]
+
+    if next_agent == "FINISH":
+        logger.info(
+            "Routing completed in %s hops (%s rule, %s llm)",
+            routing['hops'], routing.get('rule_hops', 0), routing.get('llm_hops', 0)
+        )
+    return {**metadata, "routing": routing}
+
+
+routing_engine = RoutingEngine()
@@ -1,5 +1,6 @@
 import logging
 from langchain_core.tools import BaseTool
+from langchain_core.messages import SystemMessage
 from langgraph.prebuilt import create_react_agent
 from langgraph.graph import END
 
@@ -7,12 +8,22 @@ from typing import List
 from utils.agent_prompts import SUPERVISOR_AGENT_PROMPT
 from models.agent_state import AgentState
 from models.structured_agent_response import SupervisorDecision
+from agents.routing import (
+    ANALYSIS_AGENTS, UNAVAILABLE_STATUSES, analyses_with_status, deadline_passed, is_finished, record_hop, routing_engine
+)
+from utils.resilience import within_deadline
 from utils.llm_connection import LLMConnection
+from utils.compaction import compact_messages
 import datetime
+import os
 from typing import Any
 
 logger = logging.getLogger(__name__)
-llm_model = LLMConnection().get_llm()
+
+# rules - rule-based routing with llm fallback for ambiguous queries, llm - always ask the llm
+SUPERVISOR_ROUTING = os.getenv("SUPERVISOR_ROUTING", "rules")
+
+OPTIONS = "fundamental_analysis_agent,technical_analysis_agent,final_analysis_agent,FINISH"
 
 class SupervisorAgent():
     def __init__(self):
@@ -20,44 +31,80 @@ class SupervisorAgent():
         self.temp = ""
         self.agent = None
 
-    def create_agent(self, model, options, status):
-        logger.info("Creating Supervisor Agent...")
-        self.agent = create_react_agent(
-            model=model,
-            prompt=self.prompt.replace('Enum-Options', options).replace('completed_analysis_result', str(status)),
-            response_format=SupervisorDecision,
-            tools=[],
-        )
-        
-    def ask_agent(self, state: AgentState) -> dict[str, Any] | Any:
+    def create_agent(self, model):
+        if not self.agent:
+            logger.info("Creating Supervisor Agent...")
+            self.agent = create_react_agent(
+                model=model,
+                response_format=SupervisorDecision,
+                tools=[],
+            )
+
+    async def ask_agent(self, state: AgentState, options: str, status: dict) -> dict[str, Any] | Any:
         logger.info("Invoking Supervisor Agent...")
-        return self.agent.invoke(state)
-    
+        status = {
+            name: {key: value for key, value in result.items() if key != "digest"}
+            for name, result in status.items() if isinstance(result, dict)
+        }
+        prompt = self.prompt.replace('Enum-Options', options).replace('completed_analysis_result', str(status))
+        return await self.agent.ainvoke({
+            "messages": [SystemMessage(content=prompt), *compact_messages(state, "supervisor")]
+        })
+
 supervisor_agent = SupervisorAgent()
 
-def supervisor_node(state: AgentState) -> AgentState:
+async def supervisor_node(state: AgentState) -> AgentState:
     logger.info("Supervisor Node: Determining next agent.")
-    options = "fundamental_analysis_agent,technical_analysis_agent,final_analysis_agent,FINISH"
+    metadata = state.get('metadata', {})
+
+    if SUPERVISOR_ROUTING == "rules":
+        next_agent = routing_engine.decide(state)
+        if next_agent is not None:
+            logger.info("Supervisor Node: Next agent determined by rules: %s", next_agent)
+            return {
+                'next_agent': next_agent,
+                'metadata': record_hop(metadata, next_agent, "rule")
+            }
+        logger.info("Supervisor Node: Ambiguous query, falling back to LLM routing.")
+
+    if is_finished(state):
+        return {
+            'next_agent': "FINISH",
+            'metadata': record_hop(metadata, "FINISH", "rule")
+        }
+    if deadline_passed(state, reserve_steps=1):
+        logger.info("Supervisor Node: No time left for another analysis, moving to the final analysis.")
+        return {
+            'next_agent': "final_analysis_agent",
+            'metadata': record_hop(metadata, "final_analysis_agent", "deadline")
+        }
+
     status = state.get('analysis_results', {})
-    
-    supervisor_agent.create_agent(llm_model, options, status)
-    
-    final_recommendation = state['final_recommendation']
-    if 'action' in final_recommendation:
+    supervisor_agent.create_agent(LLMConnection().get_llm())
+    try:
+        # Routing must leave time for an analysis and the final analysis
+        response = await within_deadline(supervisor_agent.ask_agent(state, OPTIONS, status), reserve_steps=2)
+    except Exception as e:
+        next_agent = routing_engine.fallback(state)
+        logger.warning("Supervisor Node: LLM routing unavailable (%s), routing to %s.", str(e) or type(e).__name__, next_agent)
         return {
-            'next_agent': "FINISH"
+            'next_agent': next_agent,
+            'metadata': record_hop(metadata, next_agent, "fallback")
         }
-    
-    response = supervisor_agent.ask_agent(state)
-    logger.info(f"Supervisor Node: Response: {response}")
-    
-    if response['structured_response'].next_agent in options.split(","):
+    logger.debug("Supervisor Node: Response: %s", response)
+
+    unavailable = {ANALYSIS_AGENTS[name] for name in analyses_with_status(state, *UNAVAILABLE_STATUSES)}
+    if response['structured_response'].next_agent in unavailable:
+        # Analyses that timed out or failed are not run again
+        next_agent = routing_engine.fallback(state)
+        logger.info("Supervisor Node: %s is unavailable, routing to %s.", response['structured_response'].next_agent, next_agent)
+    elif response['structured_response'].next_agent in OPTIONS.split(","):
         next_agent = response['structured_response'].next_agent
-        logger.info(f"Supervisor Node: Next agent determined: {next_agent}")
+        logger.info("Supervisor Node: Next agent determined: %s", next_agent)
     else:
         next_agent = 'FINISH'
         logger.info("Supervisor Node: No specific next agent, finishing.")
-    state['next_agent'] = next_agent
     return {
-        'next_agent': next_agent
-    }
\ No newline at end of file
+        'next_agent': next_agent,
+        'metadata': record_hop(metadata, next_agent, "llm")
+    }
@@ -6,12 +6,14 @@ from utils.agent_prompts import TECHNICAL_AGENT_PROMPT
 from models.agent_state import AgentState
 from tools.technical_analysis_tools import technical_tools
 from utils.llm_connection import LLMConnection
+from utils.compaction import build_digest, compact_messages, message_text
+from utils.resilience import within_deadline
+from agents.routing import unavailable_analysis
 import datetime
 from typing import Any
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
-llm_model = LLMConnection().get_llm()
 
 class TechnicalAnalysisAgent():
     def __init__(self):
@@ -28,31 +30,35 @@ class TechnicalAnalysisAgent():
                 prompt=self.prompt
             )
         
-    def ask_agent(self, state: AgentState) -> dict[str, Any] | Any:
+    async def ask_agent(self, state: AgentState) -> dict[str, Any] | Any:
         logger.info("Invoking Technical Analysis Agent...")
-        return self.agent.invoke(state)
+        return await self.agent.ainvoke(state)
         
 technical_analysis_agent = TechnicalAnalysisAgent()
 
-def technical_agent_node(state: AgentState) -> AgentState:
+async def technical_agent_node(state: AgentState) -> AgentState:
     logger.info("Technical Analysis Node: Creating and invoking agent.")
-    technical_analysis_agent.create_agent(llm_model)
+    technical_analysis_agent.create_agent(LLMConnection().get_llm())
 
-    response = technical_analysis_agent.ask_agent(state)
-    logger.info(f"Technical Analysis Node: Agent response: {response}")
+    try:
+        # The final analysis step keeps its reserve of the deadline
+        response = await within_deadline(technical_analysis_agent.ask_agent({
+            "messages": compact_messages(state, "technical_analysis")
+        }), reserve_steps=1)
+    except Exception as e:
+        return unavailable_analysis("technical", "technical_analysis", e)
+    logger.debug("Technical Analysis Node: Agent response: %s", response)
 
     techincal_result = {
         "timestamp": datetime.now().isoformat(),
         "agent": "technical_analysis",
-        "status": "completed"
+        "status": "completed",
+        "digest": build_digest("technical", message_text(response['messages'][-1]))
     }
     state["next_agent"] = "supervisor"
     logger.info("Technical Analysis Node: Completed.")
     return {
         'messages': [response['messages'][-1]],
-        'analysis_results': {
-            **state.get("analysis_results", {}),  
-            "technical": techincal_result      
-        },
+        'analysis_results': {"technical": techincal_result},
         'next_agent': 'supervisor'
     }
\ No newline at end of file
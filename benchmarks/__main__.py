@@ -0,0 +1,238 @@
+"""
+Offline benchmarks for the agent workflow.
+
+Usage:
+    python -m benchmarks [--suite chart_patterns scan nodes run_query streaming] [--iterations 20]
+                         [--latency 0.0] [--jitter 0.0] [--ticker-counts 1,10,50]
+                         [--history-bars 60,120,250] [--warm] [--json results.json]
+    python -m benchmarks record AAPL MSFT RELIANCE.NS
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+from typing import Any, Dict, List
+
+SUITES = ["chart_patterns", "scan", "nodes", "run_query", "streaming"]
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Offline agent workflow benchmarks")
+    parser.add_argument("--suite", nargs="+", choices=SUITES, default=SUITES)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated LLM latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="uniform jitter of the simulated latency")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ticker-counts", type=_int_list, default=[1, 10, 50])
+    parser.add_argument("--history-bars", type=_int_list, default=[60, 120, 250])
+    parser.add_argument("--warm", action="store_true", help="keep caches between iterations")
+    parser.add_argument("--json", help="write the results to this file")
+    return parser.parse_args(argv)
+
+
+def load_universe() -> List[str]:
+    with open(os.path.join(ROOT_DIR, "data", "tickers.json"), encoding="utf-8") as file:
+        return [entry["symbol"] for entry in json.load(file)]
+
+
+def reset_caches():
+    """Drop market data, indicator state and result caches so each iteration starts cold"""
+    from tools.fundamentals_store import fundamentals_store
+    from tools.indicators import indicator_engine
+    from tools.market_data import market_data
+    from tools.screener import screener
+    from utils.cache import CACHES
+
+    market_data._memory.clear()
+    shutil.rmtree(market_data.cache_dir, ignore_errors=True)
+    os.makedirs(market_data.cache_dir, exist_ok=True)
+    indicator_engine._states.clear()
+    fundamentals_store.clear()
+    screener.clear()
+    for cache in CACHES.values():
+        cache.invalidate()
+
+
+def initial_state(ticker: str) -> Dict[str, Any]:
+    from langchain_core.messages import HumanMessage
+
+    query = f"Give a comprehensive analysis of {ticker}"
+    return {
+        "messages": [HumanMessage(content=query)],
+        "analysis_results": {},
+        "metadata": {"query": query, "ticker": ticker},
+        "next_agent": "supervisor",
+        "final_recommendation": {},
+    }
+
+
+async def bench_chart_patterns(args, store, universe, measure) -> List[Dict[str, Any]]:
+    from tools.technical_analysis_tools import get_chart_patterns
+
+    results = []
+    for bars in args.history_bars:
+        store.history_bars = bars
+        for count in args.ticker_counts:
+            tickers = universe[:count]
+            results.append(await measure(
+                "get_chart_patterns",
+                lambda: asyncio.gather(*(get_chart_patterns.ainvoke(ticker) for ticker in tickers)),
+                tickers=len(tickers), bars=bars,
+            ))
+    return results
+
+
+async def bench_scan(args, store, universe, measure) -> List[Dict[str, Any]]:
+    from tools.screener import screener
+    from utils.executors import run_blocking
+
+    async def scan(tickers: List[str]):
+        matrix = await run_blocking("yfinance", screener.load, tickers)
+        return screener.scan(matrix, "SMA_50 > SMA_200 and High >= SR_high")
+
+    results = []
+    for bars in args.history_bars:
+        store.history_bars = bars
+        for count in args.ticker_counts:
+            tickers = universe[:count]
+            results.append(await measure("scan", lambda: scan(tickers), tickers=len(tickers), bars=bars))
+    return results
+
+
+async def bench_nodes(args, store, universe, measure) -> List[Dict[str, Any]]:
+    from agents.fundamental_analysis_agent import fundamental_agent_node
+    from agents.prediction_agent import final_analysis_node
+    from agents.supervisor_agent import supervisor_node
+    from agents.technical_analysis_agent import technical_agent_node
+    from benchmarks.fakes import ANALYSIS_TEXT
+    from utils.compaction import build_digest
+
+    ticker = universe[0]
+    state = initial_state(ticker)
+    analysed_state = {
+        **state,
+        "analysis_results": {
+            "fundamental": {"status": "completed", "digest": build_digest("fundamental", ANALYSIS_TEXT)},
+            "technical": {"status": "completed", "digest": build_digest("technical", ANALYSIS_TEXT)},
+        },
+    }
+    nodes = [
+        ("supervisor", supervisor_node, state),
+        ("fundamental_analysis", fundamental_agent_node, state),
+        ("technical_analysis", technical_agent_node, state),
+        ("final_analysis", final_analysis_node, analysed_state),
+    ]
+    return [
+        await measure(f"node.{name}", lambda node=node, node_state=node_state: node(dict(node_state)), ticker=ticker)
+        for name, node, node_state in nodes
+    ]
+
+
+async def bench_run_query(args, store, universe, measure) -> List[Dict[str, Any]]:
+    from services.query_service import run_query
+
+    results = []
+    for count in args.ticker_counts:
+        tickers = universe[:count]
+        results.append(await measure(
+            "run_query",
+            lambda: asyncio.gather(*(run_query(f"Give a comprehensive analysis of {ticker}") for ticker in tickers)),
+            tickers=len(tickers),
+        ))
+    return results
+
+
+async def bench_streaming(args, store, universe, measure) -> List[Dict[str, Any]]:
+    from benchmarks.report import summarize
+    from services.query_service import run_query_streaming
+
+    results = []
+    for count in args.ticker_counts:
+        tickers = universe[:count]
+        first_event_times: List[float] = []
+
+        async def consume(ticker: str):
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            first = None
+            async for _ in run_query_streaming(f"Give a comprehensive analysis of {ticker}"):
+                if first is None:
+                    first = loop.time() - start
+            first_event_times.append(first or 0.0)
+
+        results.append(await measure(
+            "run_query_streaming",
+            lambda: asyncio.gather(*(consume(ticker) for ticker in tickers)),
+            tickers=len(tickers),
+        ))
+        measured = first_event_times[args.warmup * count:(args.warmup + args.iterations) * count]
+        results.append(summarize("run_query_streaming.first_event", measured, tickers=len(tickers)))
+    return results
+
+
+async def run_benchmarks(args) -> List[Dict[str, Any]]:
+    from benchmarks.fakes import install_fake_llms
+    install_fake_llms(args.latency, args.jitter, args.seed)
+
+    from benchmarks.fixtures import FixtureStore, install_fixtures
+    from benchmarks.report import measure as measure_latency
+    store = FixtureStore()
+    install_fixtures(store)
+
+    universe = load_universe()
+    args.ticker_counts = [count for count in args.ticker_counts if count <= len(universe)]
+    setup = None if args.warm else reset_caches
+
+    async def measure(name, func, **params):
+        return await measure_latency(name, func, args.iterations, args.warmup, setup, **params)
+
+    suites = {
+        "chart_patterns": bench_chart_patterns,
+        "scan": bench_scan,
+        "nodes": bench_nodes,
+        "run_query": bench_run_query,
+        "streaming": bench_streaming,
+    }
+    results = []
+    for suite in args.suite:
+        print(f"Running {suite} benchmarks...", file=sys.stderr)
+        results.extend(await suites[suite](args, store, universe, measure))
+    return results
+
+
+def main(argv: List[str]):
+    if argv[:1] == ["record"]:
+        from benchmarks.fixtures import record_fixtures
+        record_fixtures(argv[1:])
+        return
+
+    args = parse_args(argv)
+
+    # Isolated, offline environment: throwaway market data cache, no request coalescing
+    os.environ.setdefault("MARKET_DATA_CACHE_DIR", tempfile.mkdtemp(prefix="benchmark_market_data_"))
+    os.environ.setdefault("FUNDAMENTALS_STORE_DIR", tempfile.mkdtemp(prefix="benchmark_fundamentals_"))
+    os.environ.setdefault("QUERY_COALESCING", "false")
+    logging.basicConfig(level=logging.WARNING)
+    sys.path.insert(0, ROOT_DIR)
+
+    from benchmarks.report import format_table
+
+    results = asyncio.run(run_benchmarks(args))
+    print(format_table(results))
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,218 @@
+import asyncio
+import json
+import os
+import random
+import re
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, SystemMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+from utils.tokens import estimate_tokens
+
+# Scripted analysis text, with bullets and figures so digests have key points
+ANALYSIS_TEXT = """## Summary
+The company shows steady performance over the last three years.
+- Revenue grew 8% year over year to 391B
+- Net margin stable at 24%
+- Debt to equity of 1.8, manageable given cash flows
+- Price above SMA_50 and SMA_200, trend is up
+1. Support at 180, resistance at 200
+Overall the outlook is moderately positive with valuation risk."""
+
+TICKER_PATTERN = re.compile(r"Ticker: ([A-Z0-9.&-]+)")
+
+
+class SimulatedLatency():
+    """Deterministic simulated latency: a base delay plus seeded uniform jitter"""
+
+    def __init__(self, base: float, jitter: float = 0.0, seed: int = 0):
+        self.base = base
+        self.jitter = jitter
+        self._random = random.Random(seed)
+
+    def next(self) -> float:
+        return max(0.0, self.base + self._random.uniform(-self.jitter, self.jitter))
+
+
+def _text(messages: Sequence[BaseMessage]) -> str:
+    return "\n".join(message.content for message in messages if isinstance(message.content, str))
+
+
+def _ticker(messages: Sequence[BaseMessage]) -> str:
+    match = TICKER_PATTERN.search(_text(messages))
+    return match.group(1) if match else "AAPL"
+
+
+def _supervisor_decision(schema, messages: Sequence[BaseMessage]):
+    status = next((message.content for message in messages if isinstance(message, SystemMessage)), "")
+    done = "'fundamental'" in status or "'technical'" in status
+    return schema(next_agent="final_analysis_agent" if done else "fundamental_analysis_agent")
+
+
+def _prediction_decision(schema, messages: Sequence[BaseMessage]):
+    return schema(action="BUY", confidence=0.7, explanation="Scripted benchmark recommendation.")
+
+
+def _ticker_extraction(schema, messages: Sequence[BaseMessage]):
+    symbols = re.findall(r"\b[A-Z]{2,10}(?:\.[A-Z]{1,2})?\b", _text(messages[1:]))
+    return schema(ticker=symbols[0] if symbols else "")
+
+
+# Structured output scripts by schema name
+SCRIPTED_DECISIONS: Dict[str, Callable[[Any, Sequence[BaseMessage]], Any]] = {
+    "SupervisorDecision": _supervisor_decision,
+    "PredictionDecision": _prediction_decision,
+    "TickerExtraction": _ticker_extraction,
+}
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Chat model with scripted responses and simulated latency.
+
+    With tools bound, the first call requests every tool for the ticker in the prompt and the
+    next call answers with the scripted analysis. Structured output is produced by
+    SCRIPTED_DECISIONS.
+    """
+
+    latency: Any = None
+    tool_names: List[str] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def _delay(self) -> float:
+        return self.latency.next() if self.latency else 0.0
+
+    def _message(self, messages: List[BaseMessage]) -> AIMessage:
+        prompt_tokens = estimate_tokens(_text(messages))
+        if self.tool_names and not any(isinstance(message, ToolMessage) for message in messages):
+            ticker = _ticker(messages)
+            tool_calls = [
+                {"name": name, "args": {"ticker": ticker}, "id": f"call_{index}"}
+                for index, name in enumerate(self.tool_names)
+            ]
+            return AIMessage(
+                content="",
+                tool_calls=tool_calls,
+                usage_metadata={"input_tokens": prompt_tokens, "output_tokens": 20, "total_tokens": prompt_tokens + 20},
+            )
+
+        output_tokens = estimate_tokens(ANALYSIS_TEXT)
+        return AIMessage(
+            content=ANALYSIS_TEXT,
+            usage_metadata={
+                "input_tokens": prompt_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": prompt_tokens + output_tokens,
+            },
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self._delay())
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self._delay())
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        message = self._message(messages)
+        words = message.content.split(" ") if message.content else [""]
+        delay = self._delay() / len(words)
+        for index, word in enumerate(words):
+            await asyncio.sleep(delay)
+            last = index == len(words) - 1
+            chunk = ChatGenerationChunk(message=AIMessageChunk(
+                content=word if last else f"{word} ",
+                tool_call_chunks=[
+                    {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": i}
+                    for i, call in enumerate(message.tool_calls)
+                ] if last else [],
+                usage_metadata=message.usage_metadata if last else None,
+            ))
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    def bind_tools(self, tools, **kwargs) -> "ScriptedChatModel":
+        return self.model_copy(update={"tool_names": [tool.name for tool in tools]})
+
+    def with_structured_output(self, schema, **kwargs) -> RunnableLambda:
+        script = SCRIPTED_DECISIONS[schema.__name__]
+
+        def respond(messages):
+            time.sleep(self._delay())
+            return script(schema, _as_messages(messages))
+
+        async def arespond(messages):
+            await asyncio.sleep(self._delay())
+            return script(schema, _as_messages(messages))
+
+        return RunnableLambda(respond, afunc=arespond)
+
+
+def _as_messages(value: Any) -> List[BaseMessage]:
+    if hasattr(value, "to_messages"):
+        return value.to_messages()
+    return list(value)
+
+
+class FakeGenAIModels():
+    """Stand-in for `genai.Client().models` returning scripted text after a simulated latency"""
+
+    def __init__(self, latency: Optional[SimulatedLatency]):
+        self.latency = latency
+
+    def _response(self, contents: str) -> SimpleNamespace:
+        return SimpleNamespace(
+            text=ANALYSIS_TEXT,
+            usage_metadata=SimpleNamespace(
+                prompt_token_count=estimate_tokens(str(contents)),
+                candidates_token_count=estimate_tokens(ANALYSIS_TEXT),
+            ),
+        )
+
+    def generate_content(self, model: str, contents: str, config: Any = None) -> SimpleNamespace:
+        time.sleep(self.latency.next() if self.latency else 0.0)
+        return self._response(contents)
+
+
+class AsyncFakeGenAIModels(FakeGenAIModels):
+    async def generate_content(self, model: str, contents: str, config: Any = None) -> SimpleNamespace:
+        await asyncio.sleep(self.latency.next() if self.latency else 0.0)
+        return self._response(contents)
+
+
+def install_fake_llms(latency: float = 0.0, jitter: float = 0.0, seed: int = 0):
+    """
+    Replace the LangChain chat model and the google-genai clients with scripted fakes.
+
+    Must run before the first request, since the chat model and clients are created once.
+    """
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+    from utils import genai_client, llm_connection
+
+    chat_latency = SimulatedLatency(latency, jitter, seed)
+    genai_latency = SimulatedLatency(latency, jitter, seed + 1)
+
+    def chat_model() -> ScriptedChatModel:
+        return ScriptedChatModel(latency=chat_latency)
+
+    def client(**kwargs) -> SimpleNamespace:
+        return SimpleNamespace(
+            models=FakeGenAIModels(genai_latency),
+            aio=SimpleNamespace(models=AsyncFakeGenAIModels(genai_latency)),
+        )
+
+    llm_connection.create_llm = chat_model
+    llm_connection.LLMConnection._instance = None
+    genai_client.genai = SimpleNamespace(Client=client)
+    genai_client.GenAIClientPool._instance = None
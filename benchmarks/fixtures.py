@@ -0,0 +1,168 @@
+import json
+import logging
+import os
+import zlib
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from tools.market_data import PRICE_COLUMNS, STATEMENTS
+
+logger = logging.getLogger(__name__)
+
+# Recorded fixtures: <dir>/<TICKER>/history.parquet, <statement>.parquet and info.json
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+SECTORS = ["Technology", "Financial Services", "Healthcare", "Energy", "Consumer Cyclical"]
+STATEMENT_ITEMS = {
+    "income_stmt": {"Total Revenue": 1.0, "Total Expenses": 0.8, "Gross Profit": 0.4, "Net Income": 0.2},
+    "balance_sheet": {"Total Debt": 0.6, "Net Debt": 0.4, "Tangible Book Value": 0.5},
+    "cashflow": {"Operating Cash Flow": 0.25, "Free Cash Flow": 0.18},
+}
+
+
+def _seed(ticker: str) -> int:
+    return zlib.crc32(ticker.upper().encode())
+
+
+def synthetic_history(ticker: str, bars: int, end: Optional[pd.Timestamp] = None) -> pd.DataFrame:
+    """Deterministic daily OHLCV random walk ending today"""
+    rng = np.random.default_rng(_seed(ticker))
+    end = end or pd.Timestamp.today().normalize()
+    index = pd.bdate_range(end=end, periods=bars, name="Date")
+
+    close = 100 * np.exp(np.cumsum(rng.normal(0.0005, 0.015, bars)))
+    open_ = np.concatenate([[close[0]], close[:-1]]) * (1 + rng.normal(0, 0.003, bars))
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.01, bars))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.01, bars))
+    volume = rng.integers(1_000_000, 10_000_000, bars).astype(float)
+    return pd.DataFrame({"Open": open_, "High": high, "Low": low, "Close": close, "Volume": volume}, index=index)
+
+
+def synthetic_statement(ticker: str, statement: str, years: int = 4) -> pd.DataFrame:
+    """Annual statement in the yfinance layout: one row per line item, one column per year, newest first"""
+    rng = np.random.default_rng(_seed(ticker) + len(statement))
+    revenue = 1e9 * rng.uniform(1, 100)
+    columns = pd.to_datetime([f"{pd.Timestamp.today().year - year}-12-31" for year in range(1, years + 1)])
+    growth = np.cumprod(rng.uniform(0.9, 1.2, years))[::-1]
+    return pd.DataFrame(
+        {column: {item: revenue * share * factor for item, share in STATEMENT_ITEMS[statement].items()}
+         for column, factor in zip(columns, growth)}
+    )
+
+
+def synthetic_info(ticker: str) -> Dict[str, Any]:
+    rng = np.random.default_rng(_seed(ticker))
+    return {
+        "symbol": ticker.upper(),
+        "sector": SECTORS[_seed(ticker) % len(SECTORS)],
+        "trailingPE": round(rng.uniform(8, 40), 2),
+        "forwardPE": round(rng.uniform(8, 35), 2),
+        "priceToBook": round(rng.uniform(1, 15), 2),
+        "returnOnEquity": round(rng.uniform(0.05, 0.4), 4),
+        "trailingEps": round(rng.uniform(1, 12), 2),
+        "forwardEps": round(rng.uniform(1, 14), 2),
+        "debtToEquity": round(rng.uniform(10, 200), 2),
+        "currentRatio": round(rng.uniform(0.8, 3), 2),
+    }
+
+
+class FixtureStore():
+    """
+    yfinance data for the benchmarks: recorded fixtures when present, otherwise deterministic
+    synthetic data. `history_bars` sets the history length served for every ticker.
+    """
+
+    def __init__(self, history_bars: int = 250, fixtures_dir: str = FIXTURES_DIR):
+        self.history_bars = history_bars
+        self.fixtures_dir = fixtures_dir
+
+    def _recorded(self, ticker: str, name: str) -> Optional[str]:
+        path = os.path.join(self.fixtures_dir, ticker.upper(), name)
+        return path if os.path.exists(path) else None
+
+    def history(self, ticker: str) -> pd.DataFrame:
+        path = self._recorded(ticker, "history.parquet")
+        if path:
+            return pd.read_parquet(path).tail(self.history_bars)
+        return synthetic_history(ticker, self.history_bars)
+
+    def statement(self, ticker: str, statement: str) -> pd.DataFrame:
+        path = self._recorded(ticker, f"{statement}.parquet")
+        if path:
+            # Stored transposed, like the market data cache: one row per period
+            return pd.read_parquet(path).T
+        return synthetic_statement(ticker, statement)
+
+    def info(self, ticker: str) -> Dict[str, Any]:
+        path = self._recorded(ticker, "info.json")
+        if path:
+            with open(path) as file:
+                return json.load(file)
+        return synthetic_info(ticker)
+
+
+class FixtureTicker():
+    """Offline stand-in for `yfinance.Ticker` serving a FixtureStore"""
+
+    def __init__(self, ticker: str, store: FixtureStore):
+        self.ticker = ticker
+        self.store = store
+
+    def history(self, period: Optional[str] = None, interval: str = "1d", start: Optional[str] = None, **kwargs) -> pd.DataFrame:
+        df = self.store.history(self.ticker)
+        if start is not None:
+            df = df[df.index >= pd.Timestamp(start)]
+        return df
+
+    @property
+    def income_stmt(self) -> pd.DataFrame:
+        return self.store.statement(self.ticker, "income_stmt")
+
+    @property
+    def balance_sheet(self) -> pd.DataFrame:
+        return self.store.statement(self.ticker, "balance_sheet")
+
+    @property
+    def cashflow(self) -> pd.DataFrame:
+        return self.store.statement(self.ticker, "cashflow")
+
+    @property
+    def info(self) -> Dict[str, Any]:
+        return self.store.info(self.ticker)
+
+
+def install_fixtures(store: FixtureStore):
+    """Serve market data from the fixture store instead of yfinance"""
+    from tools import market_data
+
+    def download(tickers: List[str], period: str = "1y", interval: str = "1d", **kwargs) -> pd.DataFrame:
+        return pd.concat({ticker: store.history(ticker) for ticker in tickers}, axis=1)
+
+    market_data.yf = SimpleNamespace(Ticker=lambda ticker: FixtureTicker(ticker, store), download=download)
+
+
+def record_fixtures(tickers: List[str], fixtures_dir: str = FIXTURES_DIR, period: str = "5y"):
+    """Download live yfinance data for the tickers into the fixture directory"""
+    import yfinance as yf
+
+    for ticker in tickers:
+        directory = os.path.join(fixtures_dir, ticker.upper())
+        os.makedirs(directory, exist_ok=True)
+        stock = yf.Ticker(ticker)
+
+        history = stock.history(period=period, interval="1d")[PRICE_COLUMNS]
+        history.index = history.index.tz_localize(None)
+        history.index.name = "Date"
+        history.to_parquet(os.path.join(directory, "history.parquet"))
+
+        for statement in STATEMENTS:
+            frame = getattr(stock, statement).T
+            frame.columns = [str(column) for column in frame.columns]
+            frame.to_parquet(os.path.join(directory, f"{statement}.parquet"))
+
+        with open(os.path.join(directory, "info.json"), "w") as file:
+            json.dump(stock.info, file, default=str)
+        logger.info("Recorded fixtures for %s", ticker)
@@ -0,0 +1,86 @@
+import gc
+import statistics
+import time
+import tracemalloc
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+def percentile(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(name: str, samples: List[float], peak_memory: Optional[int] = None, **params) -> Dict[str, Any]:
+    """Latency distribution in milliseconds and peak traced memory in MiB"""
+    milliseconds = [sample * 1000 for sample in samples]
+    return {
+        "name": name,
+        **params,
+        "iterations": len(samples),
+        "mean_ms": round(statistics.fmean(milliseconds), 3) if milliseconds else 0.0,
+        "p50_ms": round(percentile(milliseconds, 0.50), 3),
+        "p90_ms": round(percentile(milliseconds, 0.90), 3),
+        "p99_ms": round(percentile(milliseconds, 0.99), 3),
+        "min_ms": round(min(milliseconds), 3) if milliseconds else 0.0,
+        "max_ms": round(max(milliseconds), 3) if milliseconds else 0.0,
+        "peak_memory_mib": round(peak_memory / 2 ** 20, 3) if peak_memory is not None else None,
+    }
+
+
+async def measure(
+    name: str,
+    func: Callable[[], Awaitable[Any]],
+    iterations: int,
+    warmup: int = 1,
+    setup: Optional[Callable[[], Any]] = None,
+    **params
+) -> Dict[str, Any]:
+    """
+    Time `iterations` runs of a coroutine function after `warmup` runs.
+
+    Latencies are measured without tracing. Peak memory is taken from one extra run under
+    tracemalloc, since tracing slows allocations down considerably.
+    """
+    for _ in range(warmup):
+        if setup:
+            setup()
+        await func()
+
+    samples = []
+    for _ in range(iterations):
+        if setup:
+            setup()
+        gc.collect()
+        start = time.perf_counter()
+        await func()
+        samples.append(time.perf_counter() - start)
+
+    if setup:
+        setup()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        await func()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return summarize(name, samples, peak_memory, **params)
+
+
+COLUMNS = ["name", "params", "iterations", "mean_ms", "p50_ms", "p90_ms", "p99_ms", "max_ms", "peak_memory_mib"]
+
+
+def format_table(results: List[Dict[str, Any]]) -> str:
+    rows = []
+    for result in results:
+        params = ", ".join(f"{key}={value}" for key, value in result.items() if key not in COLUMNS and not key.endswith("_ms"))
+        rows.append([str(result["name"]), params, *(str(result[column]) for column in COLUMNS[2:])])
+
+    widths = [max(len(column), *(len(row[index]) for row in rows)) for index, column in enumerate(COLUMNS)]
+    lines = ["  ".join(column.ljust(width) for column, width in zip(COLUMNS, widths))]
+    lines.append("  ".join("-" * width for width in widths))
+    lines.extend("  ".join(value.ljust(width) for value, width in zip(row, widths)) for row in rows)
+    return "\n".join(lines)
@@ -1,29 +1,143 @@
-from fastapi import FastAPI, Request
+from dotenv import load_dotenv
+
+# Load .env before any module reads its settings
+load_dotenv()
+
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from typing import AsyncGenerator
-import json
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Optional
 from datetime import datetime
+import asyncio
 import logging
+import os
 from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from slowapi import Limiter
+from slowapi.errors import RateLimitExceeded
 from slowapi.util import get_remote_address
 from models.chatQuery import ChatQuery
+from models.batchQuery import BatchQuery
+from models.scanQuery import ScanQuery
 
-from services.query_service import run_query, run_query_streaming
+from services.admission import AdmissionRejected, admit, throttle
+from services.query_service import BATCH_MAX_CONCURRENCY, run_query, run_query_streaming, run_batch_query
+from services.startup import startup
+from utils.cache import cache_stats
+from utils.executors import run_blocking
+from utils.serialization import sse_event
+from utils.logging_config import configure_logging
+from utils.metrics import metrics
+from utils.resilience import circuit_stats
+from utils.shared_store import SHARED_STORE_URL
+from agent_workflow import get_agent_workflow
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("app.log"),
-        logging.StreamHandler()
-    ]
-)
+configure_logging()
 logger = logging.getLogger(__name__)
-limiter = Limiter(key_func=get_remote_address)
+# Comma separated API keys accepted in the X-API-Key header; any other value is ignored
+API_KEYS = {key.strip() for key in os.getenv("API_KEYS", "").split(",") if key.strip()}
+# Coarse guard per client address, or per API key when a valid one is presented; requests are
+# also metered by services/admission.py. With several workers the limiter counters must live
+# in the shared store, otherwise every worker allows the full rate
+IP_RATE_LIMIT = os.getenv("IP_RATE_LIMIT", "1/minute")
+API_KEY_RATE_LIMIT = os.getenv("API_KEY_RATE_LIMIT", "60/minute")
+
+
+def api_key(request: Request) -> Optional[str]:
+    """The request's X-API-Key when it is one of API_KEYS"""
+    key = request.headers.get("X-API-Key")
+    return key if key in API_KEYS else None
+
+
+def client_key(request: Request) -> str:
+    """Key the request is metered by: its valid API key, or the client address without one"""
+    key = api_key(request)
+    return f"key:{key}" if key else get_remote_address(request)
+
+
+def rate_limit(key: str) -> str:
+    return API_KEY_RATE_LIMIT if key.startswith("key:") else IP_RATE_LIMIT
+
+
+limiter = Limiter(key_func=client_key, storage_uri=SHARED_STORE_URL)
+
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+if WEB_CONCURRENCY > 1 and SHARED_STORE_URL.startswith("memory:"):
+    logger.warning(
+        "Running %s workers with SHARED_STORE_URL=%s: rate limits, caches and sessions are per worker",
+        WEB_CONCURRENCY, SHARED_STORE_URL
+    )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load libraries, clients and the graph in the background so the server starts accepting
+    # connections right away; /ready reports when they are done
+    startup_task = asyncio.create_task(startup.run())
+    refresh_task = asyncio.create_task(refresh_fundamentals())
+    precompute_task = asyncio.create_task(precompute_watchlist())
+    yield
+    precompute_task.cancel()
+    refresh_task.cancel()
+    startup_task.cancel()
+
+
+async def refresh_fundamentals():
+    """Keep the fundamentals store of the universe fresh once the libraries have loaded"""
+    if await startup.wait_ready(timeout=None):
+        from tools.fundamentals_store import fundamentals_store
+
+        await fundamentals_store.run_schedule()
+
 
-app = FastAPI()
+async def precompute_watchlist():
+    """Precompute the watchlist's tool results before market open, unless a separate worker does"""
+    if await startup.wait_ready(timeout=None):
+        from services.precompute import PRECOMPUTE_MODE, precomputer
+
+        if PRECOMPUTE_MODE != "service":
+            return
+        if WEB_CONCURRENCY > 1 and SHARED_STORE_URL.startswith("memory:"):
+            # Without a shared store the workers cannot agree on which one runs
+            logger.error(
+                "Not precomputing in %s workers with SHARED_STORE_URL=%s, set a shared store or PRECOMPUTE_MODE=worker",
+                WEB_CONCURRENCY, SHARED_STORE_URL
+            )
+            return
+        await precomputer.run_schedule()
+
+
+async def ensure_ready():
+    if not await startup.wait_ready():
+        raise HTTPException(status_code=503, detail="Service is starting up", headers={"Retry-After": "5"})
+
+
+app = FastAPI(lifespan=lifespan)
+app.state.limiter = limiter
+
+
+def retry_later(reason: str, retry_after: int, status_code: int) -> JSONResponse:
+    return JSONResponse(
+        content={"error": reason, "retry_after": retry_after},
+        status_code=status_code,
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected) -> JSONResponse:
+    logger.warning("Request to %s rejected: %s, retry after %ss", request.url.path, exc.reason, exc.retry_after)
+    return retry_later(exc.reason, exc.retry_after, exc.status_code)
+
+
+@app.exception_handler(RateLimitExceeded)
+async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded) -> JSONResponse:
+    logger.warning(
+        "Request to %s rejected: %s per %s", request.url.path, exc.detail,
+        "API key" if api_key(request) else "client address"
+    )
+    return retry_later(f"Rate limit exceeded: {exc.detail}", exc.limit.limit.get_expiry(), 429)
 
 app.add_middleware(
     CORSMiddleware,
@@ -39,25 +153,74 @@ def test():
     return "hello world"
 
 
+@app.get("/ready")
+def get_ready():
+    status = startup.snapshot()
+    return JSONResponse(content=status, status_code=200 if status["ready"] else 503)
+
+
+@app.get("/cache_stats")
+def get_cache_stats():
+    return cache_stats()
+
+
+@app.get("/metrics")
+def get_metrics():
+    from tools.fundamentals_store import fundamentals_store
+    from tools.market_data import market_data
+    from tools.screener import screener
+
+    return {
+        **metrics.snapshot(),
+        "caches": {
+            **cache_stats(),
+            "market_data": market_data.stats(),
+            "fundamentals": fundamentals_store.stats(),
+            "screener": screener.stats(),
+        },
+        "circuits": circuit_stats(),
+    }
+
+
+@app.get("/checkpoint_stats")
+def get_checkpoint_stats():
+    return get_agent_workflow().memory.stats()
+
+
+@app.get("/precompute_status")
+async def get_precompute_status():
+    await ensure_ready()
+    from services.precompute import precomputer
+
+    return await precomputer.status()
+
+
 @app.post(
     "/predict_signal"
 )
-@limiter.limit("1/minute")
-def predict_signal(query: str, request: Request) -> JSONResponse:
-    logger.info(f"Predict signal endpoint called with query: {query}")
-    response = run_query(query)
-    logger.info(f"Predict signal endpoint returned response: {response}")
+@limiter.limit(rate_limit)
+async def predict_signal(query: str, request: Request) -> JSONResponse:
+    logger.info("Predict signal endpoint called with query: %s", query)
+    await ensure_ready()
+    admission = await admit(client_key(request))
+    try:
+        response = await run_query(query)
+    finally:
+        admission.release()
+    logger.debug("Predict signal endpoint returned response: %s", response)
     return JSONResponse(content=response, status_code=200)
 
 @app.post(
     "/predict_signal_stream"
 )
-@limiter.limit("1/minute")
+@limiter.limit(rate_limit)
 async def predict_signal_stream(chatQuery: ChatQuery, request: Request) -> StreamingResponse:
     query = chatQuery.query
-    logger.info(f"Streaming predict signal endpoint called with query: {query}")
+    logger.info("Streaming predict signal endpoint called with query: %s", query)
+    await ensure_ready()
+    admission = await admit(client_key(request))
     
-    async def generate_prediction_stream() -> AsyncGenerator[str, None]:
+    async def generate_prediction_stream() -> AsyncGenerator[bytes, None]:
         """Generate streaming response for signal prediction"""
         
         try:
@@ -66,21 +229,22 @@ async def predict_signal_stream(chatQuery: ChatQuery, request: Request) -> Strea
             
             async for chunk in run_query_streaming(query):
                 # Format as Server-Sent Events (SSE)
-                chunk_json = json.dumps(chunk, default=str)
-                logger.info(f"Streaming chunk: {chunk_json}")
-                yield f"data: {chunk_json}\n\n"
+                yield sse_event(chunk)
             
             # Send final completion signal
-            yield f"data: {json.dumps({'type': 'stream_end', 'message': 'Stream completed'})}\n\n"
+            yield sse_event({'type': 'stream_end', 'message': 'Stream completed'})
             
         except Exception as e:
-            logger.error(f"Streaming prediction error: {str(e)}")
+            logger.error("Streaming prediction error: %s", e)
             error_chunk = {
                 "type": "error",
                 "error": str(e),
                 "timestamp": datetime.now().isoformat()
             }
-            yield f"data: {json.dumps(error_chunk)}\n\n"
+            yield sse_event(error_chunk)
+
+        finally:
+            admission.release()
     
     return StreamingResponse(
         generate_prediction_stream(),
@@ -90,10 +254,98 @@ async def predict_signal_stream(chatQuery: ChatQuery, request: Request) -> Strea
             "Connection": "keep-alive",
             "Access-Control-Allow-Origin": "*",
             "Access-Control-Allow-Headers": "Cache-Control"
-        }
+        },
+        # Runs even when the client disconnects before the stream starts
+        background=BackgroundTask(admission.release)
     )
 
+@app.post(
+    "/predict_signal_batch"
+)
+@limiter.limit(rate_limit)
+async def predict_signal_batch(batchQuery: BatchQuery, request: Request) -> StreamingResponse:
+    logger.info("Batch predict signal endpoint called for %s tickers", len(batchQuery.tickers))
+    await ensure_ready()
+    # A batch draws a token per ticker and occupies up to max_concurrency workflow slots
+    admission = await admit(
+        client_key(request),
+        tokens=len(batchQuery.tickers),
+        workflows=min(len(batchQuery.tickers), batchQuery.max_concurrency or BATCH_MAX_CONCURRENCY)
+    )
 
+    async def generate_batch_stream() -> AsyncGenerator[bytes, None]:
+        """Stream each ticker's prediction as soon as its workflow completes"""
+
+        try:
+            completed = 0
+            async for result in run_batch_query(
+                batchQuery.tickers,
+                query=batchQuery.query,
+                # The workflow slots admitted, not the requested concurrency
+                max_concurrency=admission.cost
+            ):
+                completed += 1
+                yield sse_event(result)
+
+            yield sse_event({'type': 'stream_end', 'message': 'Batch completed', 'total': completed})
+
+        except Exception as e:
+            logger.error("Batch prediction error: %s", e)
+            error_chunk = {
+                "type": "error",
+                "error": str(e),
+                "timestamp": datetime.now().isoformat()
+            }
+            yield sse_event(error_chunk)
+
+        finally:
+            admission.release()
+
+    return StreamingResponse(
+        generate_batch_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Headers": "Cache-Control"
+        },
+        # Runs even when the client disconnects before the stream starts
+        background=BackgroundTask(admission.release)
+    )
+
+
+@app.post(
+    "/scan"
+)
+@limiter.limit(rate_limit)
+async def scan(scanQuery: ScanQuery, request: Request) -> JSONResponse:
+    logger.info("Scan endpoint called with filter: %s", scanQuery.filter)
+    await ensure_ready()
+    from tools.screener import (
+        SCREENER_MAX_RESULTS, SCREENER_TICKERS_PER_TOKEN, ScreenerFilterError, compile_filter, screener
+    )
+
+    try:
+        # Reject a bad filter before loading any prices
+        compile_filter(scanQuery.filter)
+        if scanQuery.tickers:
+            # A custom list may need a download, charge it by size
+            await throttle(client_key(request), tokens=len(scanQuery.tickers) / SCREENER_TICKERS_PER_TOKEN)
+        matrix = await run_blocking("yfinance", screener.load, scanQuery.tickers)
+        response = await run_blocking(
+            "compute",
+            screener.scan,
+            matrix,
+            scanQuery.filter,
+            sort_by=scanQuery.sort_by,
+            ascending=scanQuery.ascending,
+            limit=scanQuery.limit or SCREENER_MAX_RESULTS,
+        )
+    except ScreenerFilterError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.info("Scan matched %s of %s tickers", response["matched"], response["scanned"])
+    return JSONResponse(content=response, status_code=200)
 
 
 if __name__ == "__main__":
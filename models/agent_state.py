@@ -2,9 +2,20 @@ from typing import Annotated, List, TypedDict, Union, Optional
 from langchain_core.messages import BaseMessage
 import operator
 
+
+def merge_analysis_results(left: dict, right: dict) -> dict:
+    """Merge analysis results written by nodes that may run in the same step"""
+    return {**(left or {}), **(right or {})}
+
+
+def last_value(left: str, right: str) -> str:
+    """Keep the latest value when several nodes write the same key in one step"""
+    return right
+
+
 class AgentState(TypedDict):
     messages: Annotated[List[BaseMessage], operator.add]
-    next_agent: str
-    analysis_results: dict
+    next_agent: Annotated[str, last_value]
+    analysis_results: Annotated[dict, merge_analysis_results]
     final_recommendation: Optional[str]
-    metadata: dict
\ No newline at end of file
+    metadata: dict
@@ -0,0 +1,21 @@
+import os
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+from services.admission import ADMISSION_MAX_IN_FLIGHT
+
+# Largest ticker list a batch accepts
+BATCH_MAX_TICKERS = int(os.getenv("BATCH_MAX_TICKERS", "50"))
+
+class BatchQuery(BaseModel):
+    tickers: List[str] = Field(description="Ticker symbols to analyse", min_length=1, max_length=BATCH_MAX_TICKERS)
+    query: Optional[str] = Field(
+        default=None,
+        description="Query template for each ticker, use {ticker} as placeholder"
+    )
+    max_concurrency: Optional[int] = Field(
+        default=None,
+        description="Maximum number of concurrent workflow executions",
+        ge=1,
+        le=ADMISSION_MAX_IN_FLIGHT
+    )
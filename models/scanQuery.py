@@ -0,0 +1,24 @@
+import os
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+# Largest custom ticker list a scan accepts
+SCREENER_MAX_TICKERS = int(os.getenv("SCREENER_MAX_TICKERS", "2000"))
+
+class ScanQuery(BaseModel):
+    filter: str = Field(
+        description="Filter expression over the screener fields, e.g. SMA_50 > SMA_200 and High >= SR_high",
+        min_length=1
+    )
+    tickers: Optional[List[str]] = Field(
+        default=None,
+        description="Ticker symbols to scan, the screener universe by default",
+        max_length=SCREENER_MAX_TICKERS
+    )
+    sort_by: Optional[str] = Field(default=None, description="Numeric field to sort the matches by")
+    ascending: bool = Field(default=False, description="Sort in ascending instead of descending order")
+    limit: Optional[int] = Field(
+        default=None,
+        description="Maximum number of matches returned, SCREENER_MAX_RESULTS by default",
+        ge=1
+    )
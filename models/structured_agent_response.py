@@ -16,4 +16,7 @@ class PredictionDecision(BaseModel):
         "HOLD",
     ] = Field(description="The decision to take on ticker")
     confidence: float = Field(description="The confidence in the decision")
-    explanation: str = Field(description="The explanation for the decision")
\ No newline at end of file
+    explanation: str = Field(description="The explanation for the decision")
+
+class TickerExtraction(BaseModel):
+    ticker: str = Field(description="The yfinance ticker symbol of the stock in the query, empty if there is none")
@@ -0,0 +1,46 @@
+from dotenv import load_dotenv
+
+# Load .env before any module reads its settings
+load_dotenv()
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+from typing import List
+
+from services.precompute import precomputer
+from utils.logging_config import configure_logging
+from utils.shared_store import SHARED_STORE_URL
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python precompute_worker.py",
+        description="Precompute the tool results of the watchlist (PRECOMPUTE_WATCHLIST) before market open"
+    )
+    parser.add_argument("tickers", nargs="*", help="tickers of a --once run, the watchlist by default")
+    parser.add_argument("--once", action="store_true", help="run once now instead of on the schedule")
+    parser.add_argument("--status", action="store_true", help="print the age of the precomputed entries and exit")
+    return parser.parse_args(argv)
+
+
+async def main(argv: List[str]):
+    args = parse_args(argv)
+    if SHARED_STORE_URL.startswith("memory:"):
+        logger.warning("SHARED_STORE_URL=%s: the API workers will not see the precomputed results", SHARED_STORE_URL)
+
+    if args.status:
+        print(json.dumps(await precomputer.status(), indent=2))
+    elif args.once:
+        print(json.dumps(await precomputer.run(args.tickers or None), indent=2))
+    else:
+        await precomputer.run_schedule()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1:]))
@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from threading import Lock
+from typing import Deque, Dict, Tuple
+
+from utils.executors import run_blocking
+from utils.metrics import metrics, record
+from utils.shared_store import shared_store
+
+logger = logging.getLogger(__name__)
+
+# Token bucket of each API key (a valid X-API-Key, the client address without one): requests
+# refill at ADMISSION_KEY_RATE per second up to ADMISSION_KEY_BURST, a batch costs one per ticker
+ADMISSION_KEY_RATE = float(os.getenv("ADMISSION_KEY_RATE", "0.2"))
+ADMISSION_KEY_BURST = float(os.getenv("ADMISSION_KEY_BURST", "10"))
+# Workflows run at once by this worker; requests beyond it wait in a queue of at most
+# ADMISSION_MAX_QUEUE workflows for up to ADMISSION_QUEUE_TIMEOUT seconds
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "16"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))
+
+# Request duration assumed for Retry-After estimates until one has been measured
+DEFAULT_REQUEST_SECONDS = 20.0
+
+
+class AdmissionRejected(Exception):
+    """A request that is not admitted; answered with `status_code` and a Retry-After header"""
+
+    def __init__(self, reason: str, retry_after: float, status_code: int = 429):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.status_code = status_code
+
+
+class TokenBuckets():
+    """
+    Token bucket per key, in the shared store when one is configured so that all workers draw
+    from the same bucket, otherwise in process.
+    """
+
+    def __init__(self, rate: float = ADMISSION_KEY_RATE, capacity: float = ADMISSION_KEY_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = Lock()
+
+    def take(self, key: str, cost: float) -> float:
+        """Take tokens for a request; 0 when taken, otherwise the seconds until they are available"""
+        if self.rate <= 0:
+            return 0.0
+        # A request larger than the bucket would never fit, it takes the whole bucket instead
+        cost = min(cost, self.capacity)
+        if shared_store is not None:
+            return shared_store.take_tokens(key, cost, self.rate, self.capacity)
+        return self._take_local(key, cost)
+
+    async def atake(self, key: str, cost: float) -> float:
+        """take without blocking the event loop on the shared store"""
+        if self.rate <= 0:
+            return 0.0
+        cost = min(cost, self.capacity)
+        if shared_store is not None:
+            return await run_blocking("default", shared_store.take_tokens, key, cost, self.rate, self.capacity)
+        return self._take_local(key, cost)
+
+    def _take_local(self, key: str, cost: float) -> float:
+        now = time.time()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated_at) * self.rate)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = (cost - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+        return wait
+
+
+class AdmissionController():
+    """
+    Admits requests by their cost in workflows.
+
+    Up to `max_in_flight` workflows run at once. Further requests wait in FIFO order while
+    the queued cost stays within `max_queue` and their estimated wait, from the recent
+    request durations, fits in `queue_timeout`; otherwise they are rejected right away with
+    a Retry-After estimate instead of piling onto the upstream APIs.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = ADMISSION_MAX_IN_FLIGHT,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.queued = 0
+        self._waiters: Deque[Tuple[int, asyncio.Future]] = deque()
+        self._durations: Deque[float] = deque(maxlen=64)
+
+    def seconds_per_request(self) -> float:
+        if not self._durations:
+            return DEFAULT_REQUEST_SECONDS
+        return sum(self._durations) / len(self._durations)
+
+    def estimated_wait(self, cost: int) -> float:
+        """Seconds until `cost` more workflows could start, given the work ahead of them"""
+        ahead = self.in_flight + self.queued + cost - self.max_in_flight
+        if ahead <= 0:
+            return 0.0
+        return self.seconds_per_request() * math.ceil(ahead / self.max_in_flight)
+
+    async def acquire(self, cost: int) -> float:
+        """Wait for capacity for `cost` workflows; returns the start time to pass to release"""
+        cost = max(1, min(cost, self.max_in_flight))
+        if not self._waiters and self.in_flight + cost <= self.max_in_flight:
+            return self._start(cost)
+
+        wait = self.estimated_wait(cost)
+        if self.queued + cost > self.max_queue or wait > self.queue_timeout:
+            metrics.increment("admission.rejected")
+            raise AdmissionRejected("Server is busy", wait or self.seconds_per_request(), status_code=503)
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = (cost, future)
+        self._waiters.append(waiter)
+        self.queued += cost
+        metrics.add_gauge("admission.queued", cost)
+        queued_at = time.perf_counter()
+        try:
+            started_at = await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done():
+                # Admitted just as the wait ended: hand the slot back if nobody will use it
+                if isinstance(e, asyncio.CancelledError):
+                    self.release(cost, future.result())
+                    raise
+                started_at = future.result()
+            else:
+                future.cancel()
+                self._waiters.remove(waiter)
+                self.queued -= cost
+                metrics.add_gauge("admission.queued", -cost)
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                metrics.increment("admission.timed_out")
+                raise AdmissionRejected("Timed out waiting for capacity", self.estimated_wait(cost), status_code=503)
+        record("queue", "admission", time.perf_counter() - queued_at)
+        return started_at
+
+    def release(self, cost: int, started_at: float):
+        cost = max(1, min(cost, self.max_in_flight))
+        self.in_flight -= cost
+        metrics.add_gauge("admission.in_flight", -cost)
+        self._durations.append(time.perf_counter() - started_at)
+        self._wake()
+
+    def _start(self, cost: int) -> float:
+        self.in_flight += cost
+        metrics.add_gauge("admission.in_flight", cost)
+        return time.perf_counter()
+
+    def _wake(self):
+        """Start queued requests in order while they fit"""
+        while self._waiters:
+            cost, future = self._waiters[0]
+            if self.in_flight + cost > self.max_in_flight:
+                return
+            self._waiters.popleft()
+            self.queued -= cost
+            metrics.add_gauge("admission.queued", -cost)
+            future.set_result(self._start(cost))
+
+
+class Admission():
+    """Admission ticket of a request: released once, when its response has been produced"""
+
+    def __init__(self, controller: AdmissionController, cost: int, started_at: float):
+        self.controller = controller
+        self.cost = cost
+        self.started_at = started_at
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.controller.release(self.cost, self.started_at)
+
+
+token_buckets = TokenBuckets()
+admission_controller = AdmissionController()
+
+
+async def throttle(client_key: str, tokens: float = 1):
+    """Take `tokens` from the client's bucket for a request that runs no workflow, or raise AdmissionRejected"""
+    wait = await token_buckets.atake(f"client:{client_key}", tokens)
+    if wait > 0:
+        metrics.increment("admission.throttled")
+        raise AdmissionRejected("Rate limit exceeded", wait, status_code=429)
+
+
+async def admit(client_key: str, tokens: float = 1, workflows: int = 1) -> Admission:
+    """
+    Admit a request costing `tokens` from the client's bucket and `workflows` concurrent
+    workflow slots, or raise AdmissionRejected.
+    """
+    await throttle(client_key, tokens)
+    # Never more than can run at once; callers size their concurrency from Admission.cost
+    workflows = max(1, min(workflows, admission_controller.max_in_flight))
+    started_at = await admission_controller.acquire(workflows)
+    return Admission(admission_controller, workflows, started_at)
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import re
+from typing import Any, AsyncGenerator, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from agents.routing import classify_intent
+from utils.ticker_resolution import ticker_index
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(re.sub(r"[^\w.\s-]", " ", (query or "").lower()).split())
+
+
+def coalescing_key(query: str) -> Tuple[str, str]:
+    """
+    Key identifying requests that produce the same analysis: the ticker resolved from the
+    local index, or the normalised query when it does not resolve, and the query intent.
+    """
+    subject = ticker_index.resolve(query) or normalize_query(query)
+    return subject, classify_intent(query) or "ambiguous"
+
+
+class SingleFlight():
+    """Concurrent calls for the same key share one in-flight execution"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+
+    def is_in_flight(self, key: Hashable) -> bool:
+        return key in self._in_flight
+
+    async def do(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Return the result of compute for the key and whether it was shared with an earlier caller"""
+        task = self._in_flight.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.create_task(compute())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            logger.info("%s: attaching to in-flight execution for %s", self.name, key)
+
+        # A caller that goes away does not cancel the execution the others are waiting on
+        return await asyncio.shield(task), shared
+
+
+class StreamBroadcast():
+    """
+    Runs one source stream and fans its chunks out to any number of subscribers.
+
+    Every chunk is kept in a replay buffer, so subscribers that attach late receive the
+    chunks produced before they joined.
+    """
+
+    def __init__(self, source: AsyncIterator[Dict[str, Any]]):
+        self.chunks: List[Dict[str, Any]] = []
+        self.done = False
+        self._condition = asyncio.Condition()
+        self.task = asyncio.create_task(self._run(source))
+
+    async def _run(self, source: AsyncIterator[Dict[str, Any]]):
+        try:
+            async for chunk in source:
+                async with self._condition:
+                    self.chunks.append(chunk)
+                    self._condition.notify_all()
+        except Exception as e:
+            logger.error("Broadcast source failed: %s", e)
+            async with self._condition:
+                self.chunks.append({"type": "error", "error": str(e)})
+        finally:
+            async with self._condition:
+                self.done = True
+                self._condition.notify_all()
+
+    async def subscribe(self) -> AsyncGenerator[Dict[str, Any], None]:
+        index = 0
+        while True:
+            async with self._condition:
+                await self._condition.wait_for(lambda: index < len(self.chunks) or self.done)
+                pending = self.chunks[index:]
+                done = self.done
+            for chunk in pending:
+                yield chunk
+            index += len(pending)
+            if done and index >= len(self.chunks):
+                return
+
+
+class StreamCoalescer():
+    """Concurrent streams for the same key subscribe to one broadcast"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._broadcasts: Dict[Hashable, StreamBroadcast] = {}
+
+    def subscribe(
+        self,
+        key: Hashable,
+        source_factory: Callable[[], AsyncIterator[Dict[str, Any]]],
+        on_complete: Optional[Callable[[List[Dict[str, Any]]], None]] = None
+    ) -> Tuple[AsyncGenerator[Dict[str, Any], None], bool]:
+        """Return a subscription to the stream for the key and whether it was shared"""
+        broadcast = self._broadcasts.get(key)
+        shared = broadcast is not None
+        if broadcast is None:
+            broadcast = StreamBroadcast(source_factory())
+            self._broadcasts[key] = broadcast
+
+            def finished(_):
+                self._broadcasts.pop(key, None)
+                if on_complete is not None:
+                    on_complete(broadcast.chunks)
+
+            broadcast.task.add_done_callback(finished)
+        else:
+            logger.info("%s: attaching to in-flight stream for %s", self.name, key)
+        return broadcast.subscribe(), shared
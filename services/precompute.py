@@ -0,0 +1,335 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta
+from datetime import time as clock_time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from utils.executors import run_blocking
+from utils.metrics import metrics, record
+from utils.shared_store import deserialize, serialize, shared_store, take_lease
+
+logger = logging.getLogger(__name__)
+
+# comma separated tickers whose tool results are computed ahead of the trading day
+PRECOMPUTE_WATCHLIST = [ticker.strip().upper() for ticker in os.getenv("PRECOMPUTE_WATCHLIST", "").split(",") if ticker.strip()]
+# service - background task of every API worker (one of them runs each scheduled run), worker - only
+# the precompute_worker.py process, off
+PRECOMPUTE_MODE = os.getenv("PRECOMPUTE_MODE", "service")
+# Daily run at PRECOMPUTE_AT on PRECOMPUTE_DAYS, local time of PRECOMPUTE_TIMEZONE, ahead of MARKET_OPEN
+PRECOMPUTE_AT = os.getenv("PRECOMPUTE_AT", "08:00")
+PRECOMPUTE_DAYS = [day.strip().lower() for day in os.getenv("PRECOMPUTE_DAYS", "mon,tue,wed,thu,fri").split(",") if day.strip()]
+PRECOMPUTE_TIMEZONE = os.getenv("PRECOMPUTE_TIMEZONE", "America/New_York")
+MARKET_OPEN = os.getenv("MARKET_OPEN", "09:30")
+# tool results computed at once during a run
+PRECOMPUTE_CONCURRENCY = int(os.getenv("PRECOMPUTE_CONCURRENCY", "4"))
+
+WEEKDAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+# Summary of the last run, kept in the shared store so the API workers see a separate worker's runs
+LAST_RUN_TTL = 7 * 86400
+# Seconds a worker holds the lease of a scheduled run, longer than any run
+RUN_LEASE_TTL = 6 * 3600
+
+
+def parse_clock(value: str) -> clock_time:
+    hours, minutes = value.split(":")
+    return clock_time(int(hours), int(minutes))
+
+
+def isoformat(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp).isoformat(timespec="seconds") if timestamp is not None else None
+
+
+class PrecomputedTool():
+    """A tool result cache filled ahead of time: the cache key of a ticker and how to compute its entry"""
+
+    def __init__(
+        self,
+        name: str,
+        cache,
+        key: Callable[[str], Awaitable[Hashable]],
+        compute: Callable[[Any], Awaitable[str]],
+    ):
+        self.name = name
+        self.cache = cache
+        self.key = key
+        self.compute = compute
+
+
+def precomputed_tools() -> List[PrecomputedTool]:
+    """The get_chart_patterns output and the five fundamental tool results"""
+    from tools import fundamental_analysis_tools as fundamental
+    from tools import technical_analysis_tools as technical
+    from tools.exchanges import infer_country
+
+    async def ticker_key(ticker: str) -> str:
+        return ticker
+
+    async def country_key(ticker: str) -> str:
+        return infer_country(ticker)
+
+    return [
+        PrecomputedTool("get_chart_patterns", technical.chart_patterns_cache, ticker_key, technical.chart_patterns),
+        PrecomputedTool(
+            "get_financial_statements", fundamental.financial_statements_cache, ticker_key,
+            fundamental.summarize_financial_statements,
+        ),
+        PrecomputedTool(
+            "get_valuation_ratios", fundamental.valuation_ratios_cache, ticker_key,
+            fundamental.summarize_valuation_ratios,
+        ),
+        PrecomputedTool("get_company_overview", fundamental.company_overview_cache, ticker_key, fundamental.company_overview),
+        PrecomputedTool(
+            "get_industry_analysis", fundamental.industry_analysis_cache, fundamental.industry_scope,
+            lambda scope: fundamental.industry_analysis(*scope),
+        ),
+        PrecomputedTool(
+            "get_macroeconomic_conditions", fundamental.macroeconomic_cache, country_key,
+            fundamental.macroeconomic_conditions,
+        ),
+    ]
+
+
+class Precomputer():
+    """
+    Computes the tool results of a watchlist before the market opens and stores them in the
+    tool caches, so the first request of the day for a watched ticker only runs the agents'
+    reasoning.
+
+    A run fetches the prices (one bulk download) and fundamentals of the watchlist, then
+    computes every tool result, once per cache key for results shared by several tickers
+    (industry, country). Entries precomputed before the open live until the market opens
+    plus their cache's TTL. An entry is stale when it is missing, expired or older than the latest scheduled run.
+
+    Every scheduled run takes a lease in the shared store first, so when several processes
+    run the schedule only one of them computes it.
+    """
+
+    def __init__(
+        self,
+        watchlist: Iterable[str] = PRECOMPUTE_WATCHLIST,
+        at: str = PRECOMPUTE_AT,
+        days: Iterable[str] = PRECOMPUTE_DAYS,
+        timezone: str = PRECOMPUTE_TIMEZONE,
+        market_open: str = MARKET_OPEN,
+        concurrency: int = PRECOMPUTE_CONCURRENCY,
+    ):
+        self.watchlist = list(dict.fromkeys(ticker.upper() for ticker in watchlist))
+        self.at = parse_clock(at)
+        self.days = {WEEKDAYS.index(day[:3]) for day in days}
+        self.timezone = ZoneInfo(timezone)
+        self.market_open = parse_clock(market_open)
+        self.concurrency = concurrency
+        self._tools: Optional[List[PrecomputedTool]] = None
+        # Cache key of each (tool, ticker) as of the last run
+        self._keys: Dict[Tuple[str, str], Hashable] = {}
+        self._last_run: Optional[Dict[str, Any]] = None
+        self._run_lock = asyncio.Lock()
+
+    @property
+    def tools(self) -> List[PrecomputedTool]:
+        if self._tools is None:
+            self._tools = precomputed_tools()
+        return self._tools
+
+    # ---- schedule ----
+
+    def _scheduled_days(self, start: date, step: int) -> Iterable[date]:
+        for offset in range(8):
+            day = start + timedelta(days=offset * step)
+            if day.weekday() in self.days:
+                yield day
+
+    def _at(self, day: date, clock: clock_time) -> datetime:
+        return datetime.combine(day, clock, tzinfo=self.timezone)
+
+    def previous_run_time(self, now: Optional[datetime] = None) -> Optional[datetime]:
+        """The latest scheduled run at or before now"""
+        now = now or datetime.now(self.timezone)
+        for day in self._scheduled_days(now.astimezone(self.timezone).date(), -1):
+            if self._at(day, self.at) <= now:
+                return self._at(day, self.at)
+        return None
+
+    def next_run_time(self, now: Optional[datetime] = None) -> Optional[datetime]:
+        now = now or datetime.now(self.timezone)
+        for day in self._scheduled_days(now.astimezone(self.timezone).date(), 1):
+            if self._at(day, self.at) > now:
+                return self._at(day, self.at)
+        return None
+
+    def seconds_until_open(self, now: Optional[datetime] = None) -> float:
+        """Seconds until today's market open, 0 once it has opened or on days without a run"""
+        now = now or datetime.now(self.timezone)
+        today = now.astimezone(self.timezone).date()
+        if today.weekday() not in self.days:
+            return 0.0
+        return max(0.0, (self._at(today, self.market_open) - now).total_seconds())
+
+    async def run_schedule(self):
+        """Run before every scheduled market open, and right away when entries are stale"""
+        if not self.watchlist or not self.days:
+            return
+        logger.info(
+            "Precomputing tool results of %s tickers at %s %s",
+            len(self.watchlist), self.at.strftime("%H:%M"), self.timezone.key
+        )
+        try:
+            stale = (await self.status())["stale"]
+        except Exception as e:
+            logger.warning("Could not check the precomputed entries: %s", e)
+            stale = True
+        if stale:
+            await self.run_logged(self.previous_run_time() or datetime.now(self.timezone))
+
+        while True:
+            next_run = self.next_run_time()
+            await asyncio.sleep(max(0.0, (next_run - datetime.now(self.timezone)).total_seconds()))
+            await self.run_logged(next_run)
+
+    async def run_logged(self, scheduled_at: datetime):
+        if not await take_lease(f"precompute:{scheduled_at.isoformat()}", RUN_LEASE_TTL):
+            logger.info("Precompute run of %s is done by another worker", scheduled_at.isoformat())
+            return
+        try:
+            summary = await self.run()
+            logger.info(
+                "Precomputed %s tool results in %.1fs, %s failed",
+                summary["computed"], summary["seconds"], len(summary["failed"])
+            )
+        except Exception as e:
+            logger.error("Precompute run failed: %s", e)
+
+    # ---- runs ----
+
+    async def run(self, tickers: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """Compute and store every tool result of the tickers (the watchlist by default)"""
+        from tools.fundamentals_store import fundamentals_store
+        from tools.market_data import market_data
+
+        tickers = list(dict.fromkeys(ticker.upper() for ticker in (tickers or self.watchlist)))
+        async with self._run_lock:
+            started_at = time.time()
+            try:
+                await run_blocking("yfinance", market_data.prefetch_histories, tickers)
+                await run_blocking("yfinance", fundamentals_store.refresh, tickers)
+            except Exception as e:
+                # The tools fetch whatever is still missing themselves
+                logger.warning("Prefetching the watchlist data failed: %s", e)
+
+            keys = await asyncio.gather(
+                *(tool.key(ticker) for ticker in tickers for tool in self.tools), return_exceptions=True
+            )
+            # One job per cache key, with the tickers it serves
+            jobs: Dict[Tuple[str, Hashable], Tuple[PrecomputedTool, List[str]]] = {}
+            failed: Dict[str, str] = {}
+            for (ticker, tool), key in zip(((ticker, tool) for ticker in tickers for tool in self.tools), keys):
+                if isinstance(key, Exception):
+                    failed[f"{ticker}/{tool.name}"] = str(key)
+                    continue
+                self._keys[(tool.name, ticker)] = key
+                jobs.setdefault((tool.name, key), (tool, []))[1].append(ticker)
+
+            # Before the open the latest bars are final, so entries are kept until the market
+            # opens plus their usual TTL
+            until_open = self.seconds_until_open()
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def precompute(tool: PrecomputedTool, key: Hashable):
+                async with semaphore:
+                    start = time.perf_counter()
+                    error = False
+                    try:
+                        await tool.cache.aset(key, await tool.compute(key), ttl=tool.cache.ttl + until_open)
+                    except Exception:
+                        error = True
+                        raise
+                    finally:
+                        record("precompute", tool.name, time.perf_counter() - start, error)
+
+            results = await asyncio.gather(
+                *(precompute(tool, key) for (_, key), (tool, _) in jobs.items()), return_exceptions=True
+            )
+            for ((name, key), (_, served)), result in zip(jobs.items(), results):
+                if isinstance(result, Exception):
+                    logger.warning("Precomputing %s for %s failed: %s", name, key, result)
+                    failed.update({f"{ticker}/{name}": str(result) for ticker in served})
+            metrics.increment("precompute.failed", len(failed))
+
+            summary = {
+                "started_at": isoformat(started_at),
+                "finished_at": isoformat(time.time()),
+                "seconds": round(time.time() - started_at, 2),
+                "tickers": len(tickers),
+                "computed": sum(not isinstance(result, Exception) for result in results),
+                "failed": failed,
+            }
+            self._last_run = summary
+            await run_blocking("default", self._save_last_run, summary)
+            return summary
+
+    # ---- status ----
+
+    async def status(self) -> Dict[str, Any]:
+        """Age of every precomputed entry of the watchlist and which ones are stale"""
+        previous_run = self.previous_run_time()
+        next_run = self.next_run_time()
+        now = time.time()
+        entries: Dict[str, Dict[str, Any]] = {}
+        stale: List[str] = []
+        for ticker in self.watchlist:
+            entries[ticker] = {}
+            for tool in self.tools:
+                key = self._keys.get((tool.name, ticker))
+                if key is None:
+                    key = await tool.key(ticker)
+                entry = await run_blocking("default", self._entry_status, tool, key, previous_run, now)
+                entries[ticker][tool.name] = entry
+                if entry["status"] != "fresh":
+                    stale.append(f"{ticker}/{tool.name}")
+
+        return {
+            "watchlist": self.watchlist,
+            "mode": PRECOMPUTE_MODE,
+            "previous_run": previous_run.isoformat() if previous_run else None,
+            "next_run": next_run.isoformat() if next_run else None,
+            "last_run": await run_blocking("default", self._load_last_run),
+            "stale": stale,
+            "entries": entries,
+        }
+
+    @staticmethod
+    def _entry_status(tool: PrecomputedTool, key: Hashable, previous_run: Optional[datetime], now: float) -> Dict[str, Any]:
+        timestamps = tool.cache.timestamps(key)
+        if timestamps is None:
+            return {"status": "missing"}
+        stored_at, expires_at = timestamps
+        outdated = previous_run is not None and stored_at < previous_run.timestamp()
+        return {
+            "status": "stale" if outdated else "fresh",
+            "computed_at": isoformat(stored_at),
+            "expires_at": isoformat(expires_at),
+            "age_seconds": round(now - stored_at),
+        }
+
+    def _save_last_run(self, summary: Dict[str, Any]):
+        if shared_store is not None:
+            try:
+                shared_store.set("precompute", "last_run", serialize(summary), LAST_RUN_TTL)
+            except Exception as e:
+                logger.warning("Could not write the precompute summary to the shared store: %s", e)
+
+    def _load_last_run(self) -> Optional[Dict[str, Any]]:
+        if shared_store is not None:
+            try:
+                found = shared_store.get("precompute", "last_run")
+                if found is not None:
+                    return deserialize(found[0])
+            except Exception as e:
+                logger.warning("Could not read the precompute summary from the shared store: %s", e)
+        return self._last_run
+
+
+precomputer = Precomputer()
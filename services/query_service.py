@@ -1,41 +1,125 @@
 from typing import Optional
 from datetime import datetime
 from typing import Any
-from langchain_core.messages import HumanMessage
+from langchain_core.messages import BaseMessage, HumanMessage
+import asyncio
 import logging
-from agent_workflow import agent_workflow
-from typing import AsyncGenerator, Dict
+import os
+import uuid
+from agent_workflow import get_agent_workflow
+from utils.executors import run_blocking
+from utils.cache import TTLCache
+from utils.ticker_resolution import resolve_ticker
+from utils.metrics import RequestMetrics, current_request_metrics, metrics_callback, track_in_flight
+from utils.resilience import circuit_breaker_callback, deadline_scope, new_deadline
+from services.coalescing import SingleFlight, StreamCoalescer, coalescing_key
+from utils.compaction import message_text
+from typing import AsyncGenerator, Dict, List, Tuple
 
 logger = logging.getLogger(__name__)
 
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "5"))
+DEFAULT_BATCH_QUERY = "Give a comprehensive analysis of {ticker}"
 
-def run_query(query: str, config: Optional[dict] = None, session_id: Optional[str] = None) -> dict:
+# Identical requests (same ticker and intent) share one execution and finished results are reused
+QUERY_COALESCING = os.getenv("QUERY_COALESCING", "true").lower() == "true"
+QUERY_RESULT_CACHE_TTL = float(os.getenv("QUERY_RESULT_CACHE_TTL", "30"))
+QUERY_RESULT_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_RESULT_CACHE_MAX_ENTRIES", "256"))
+
+# Workflow nodes whose LLM output is streamed token by token
+STREAM_TOKEN_NODES = set(filter(None, os.getenv("STREAM_TOKEN_NODES", "final_analysis").split(",")))
+
+query_results = TTLCache("query_results", QUERY_RESULT_CACHE_TTL, QUERY_RESULT_CACHE_MAX_ENTRIES)
+stream_results = TTLCache("stream_results", QUERY_RESULT_CACHE_TTL, QUERY_RESULT_CACHE_MAX_ENTRIES)
+query_flight = SingleFlight("query_flight")
+stream_coalescer = StreamCoalescer("stream_coalescer")
+
+
+def _coalescing_enabled(config: Optional[dict], session_id: Optional[str]) -> bool:
+    # Requests bound to a session continue their own checkpointed thread and are never shared
+    return QUERY_COALESCING and config is None and session_id is None
+
+
+def with_callbacks(config: dict) -> dict:
+    """
+    Run config with the circuit breaker callback, which fails chat model calls fast while the
+    model is unavailable, and the metrics callback, which times LLM and tool calls and counts tokens
+    """
+    return {**config, "callbacks": [circuit_breaker_callback, *(config.get("callbacks") or []), metrics_callback]}
+
+
+def _served_from(result: dict, source: str) -> dict:
+    if "metadata" not in result:
+        return result
+    return {**result, "metadata": {**result["metadata"], "served_from": source}}
+
+
+async def run_query(query: str, config: Optional[dict] = None, session_id: Optional[str] = None) -> dict:
+    """Execute the agent workflow, coalescing identical concurrent requests"""
+    with track_in_flight("requests"):
+        return await _run_query(query, config, session_id)
+
+
+async def _run_query(query: str, config: Optional[dict], session_id: Optional[str]) -> dict:
+    if not _coalescing_enabled(config, session_id):
+        return await execute_query(query, config=config, session_id=session_id)
+
+    key = coalescing_key(query)
+    cached = query_results.get(key)
+    if cached is not None:
+        logger.info("Serving cached result for %s", key)
+        return _served_from(cached, "cache")
+
+    async def compute() -> dict:
+        result = await execute_query(query)
+        if "error" not in result:
+            query_results.set(key, result)
+        return result
+
+    result, shared = await query_flight.do(key, compute)
+    return _served_from(result, "in_flight" if shared else "execution")
+
+
+async def build_initial_state(query: str, config: dict, start_time: datetime, deadline: Optional[float] = None) -> dict:
+    """Initial workflow state, with the ticker resolved ahead of the agents and the request deadline"""
+    ticker, ticker_source = await resolve_ticker(query)
+    return {
+        "messages": [HumanMessage(content=query)],
+        "analysis_results": {},
+        "metadata": {
+            "start_time": start_time.isoformat(),
+            "deadline": deadline,
+            "query": query,
+            "ticker": ticker,
+            "ticker_source": ticker_source,
+            "session_id": config.get("configurable", {}).get("thread_id")
+        },
+        "next_agent": "supervisor",
+        "final_recommendation": {}
+    }
+
+
+async def execute_query(query: str, config: Optional[dict] = None, session_id: Optional[str] = None) -> dict:
     """Execute the agent workflow"""
 
     start_time = datetime.now()
         
     # Generate config if not provided
     if config is None:
-        thread_id = session_id or f"session_{start_time.strftime('%Y%m%d_%H%M%S')}"
+        thread_id = session_id or f"session_{uuid.uuid4().hex}"
         config = {"configurable": {"thread_id": thread_id}}
     
-    logger.info(f"Starting financial analysis: {query}")
+    logger.info("Starting financial analysis: %s", query)
+    request_metrics = RequestMetrics()
+    metrics_token = current_request_metrics.set(request_metrics)
+    
+    deadline = new_deadline()
     
     try:
-        # Initialize state
-        initial_state = {
-            "messages": [HumanMessage(content=query)],
-            "analysis_results": {},
-            "metadata": {
-                "start_time": start_time.isoformat(),
-                "query": query,
-                "session_id": config.get("configurable", {}).get("thread_id")
-            },
-            "next_agent": "supervisor",
-            "final_recommendation": {}
-        }
-        
-        result = agent_workflow.execute_workflow(initial_state, config=config)
+        with track_in_flight("workflows"), deadline_scope(deadline):
+            initial_state = await build_initial_state(query, config, start_time, deadline)
+            
+            result = await get_agent_workflow().execute_workflow(initial_state, config=with_callbacks(config))
 
         execution_time = (datetime.now() - start_time).total_seconds()
         
@@ -46,16 +130,57 @@ def run_query(query: str, config: Optional[dict] = None, session_id: Optional[st
                 "metadata": {
                     **result.get("metadata", {}),
                     "execution_time": execution_time,
-                    "end_time": datetime.now().isoformat()
+                    "end_time": datetime.now().isoformat(),
+                    "metrics": request_metrics.summary()
                 }
             }
     except Exception as e:
         return {"error": str(e)}
+    finally:
+        current_request_metrics.reset(metrics_token)
     
     
     
     
 async def run_query_streaming(
+    query: str,
+    config: Optional[dict] = None,
+    session_id: Optional[str] = None
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """Stream the agent workflow, identical concurrent streams receive the chunks of one execution"""
+    with track_in_flight("streams"):
+        async for chunk in _run_query_streaming(query, config, session_id):
+            yield chunk
+
+
+async def _run_query_streaming(
+    query: str,
+    config: Optional[dict],
+    session_id: Optional[str]
+) -> AsyncGenerator[Dict[str, Any], None]:
+    if not _coalescing_enabled(config, session_id):
+        async for chunk in execute_query_streaming(query, config=config, session_id=session_id):
+            yield chunk
+        return
+
+    key = coalescing_key(query)
+    cached = stream_results.get(key)
+    if cached is not None:
+        logger.info("Replaying cached stream for %s", key)
+        for chunk in cached:
+            yield chunk
+        return
+
+    def store(chunks: List[Dict[str, Any]]):
+        if chunks and not any(chunk.get("type") == "error" for chunk in chunks):
+            stream_results.set(key, chunks)
+
+    subscription, _ = stream_coalescer.subscribe(key, lambda: execute_query_streaming(query), on_complete=store)
+    async for chunk in subscription:
+        yield chunk
+
+
+async def execute_query_streaming(
     query: str, 
     config: Optional[dict] = None, 
     session_id: Optional[str] = None
@@ -66,66 +191,129 @@ async def run_query_streaming(
     
     # Generate config if not provided
     if config is None:
-        thread_id = session_id or f"session_{start_time.strftime('%Y%m%d_%H%M%S')}"
+        thread_id = session_id or f"session_{uuid.uuid4().hex}"
         config = {"configurable": {"thread_id": thread_id}}
     
-    logger.info(f"Starting streaming financial analysis: {query}")
+    logger.info("Starting streaming financial analysis: %s", query)
+    request_metrics = RequestMetrics()
+    metrics_token = current_request_metrics.set(request_metrics)
     
-    try:
-        # Initialize state
-        initial_state = {
-            "messages": [HumanMessage(content=query)],
-            "analysis_results": {},
-            "metadata": {
-                "start_time": start_time.isoformat(),
-                "query": query,
-                "session_id": config.get("configurable", {}).get("thread_id")
-            },
-            "next_agent": "supervisor",
-            "final_recommendation": {}
-        }
+    deadline = new_deadline()
+    
+    with track_in_flight("workflows"):
+        try:
+            with deadline_scope(deadline):
+                initial_state = await build_initial_state(query, config, start_time, deadline)
         
-        # Stream the workflow execution
-        final_result = None
-        chunk_count = 0
+            # Stream node deltas and prediction tokens, the final result is assembled from the deltas
+            analysis_results = {}
+            final_recommendation = None
+            chunk_count = 0
         
-        async for chunk in agent_workflow.execute_workflow_streaming(initial_state, config=config):
-            chunk_count += 1
-            
-            # Process and yield each chunk
-            logger.info(f"Processing chunk {chunk_count}: {chunk}")
-            processed_chunk = chunk
-            logger.info(f"Processed chunk {chunk_count}: {processed_chunk}")
-            yield processed_chunk
-            
-            # Store the final result
-            if chunk.get("type") != "error":
-                final_result = chunk
+            async for mode, chunk in get_agent_workflow().execute_workflow_streaming(initial_state, config=with_callbacks(config)):
+                if mode == "messages":
+                    token_event = process_message_chunk(chunk, chunk_count + 1)
+                    if token_event is not None:
+                        chunk_count += 1
+                        yield token_event
+                    continue
+
+                if mode == "error":
+                    chunk_count += 1
+                    yield chunk
+                    continue
+
+                for node_name, delta in chunk.items():
+                    delta = delta or {}
+                    analysis_results.update(delta.get("analysis_results") or {})
+                    final_recommendation = delta.get("final_recommendation") or final_recommendation
+                    chunk_count += 1
+                    yield process_workflow_chunk({node_name: delta}, chunk_count)
         
-        # Calculate execution time
-        execution_time = (datetime.now() - start_time).total_seconds()
+            # Calculate execution time
+            execution_time = (datetime.now() - start_time).total_seconds()
         
-        # Yield final summary
-        yield {
-            "type": "completion",
-            "message": "Analysis completed successfully",
-            "final_recommendation": final_result.get("final_recommendation") if final_result else None,
-            "analysis_results": final_result.get("analysis_results") if final_result else None,
-            "execution_time": execution_time,
-            "total_chunks": chunk_count,
-            "timestamp": datetime.now().isoformat()
-        }
+            # Yield final summary
+            yield {
+                "type": "completion",
+                "message": "Analysis completed successfully",
+                "final_recommendation": final_recommendation,
+                "analysis_results": analysis_results,
+                "execution_time": execution_time,
+                "total_chunks": chunk_count,
+                "metrics": request_metrics.summary(),
+                "timestamp": datetime.now().isoformat()
+            }
         
+        except Exception as e:
+            logger.error("Streaming query error: %s", e)
+            yield {
+                "type": "error",
+                "error": str(e),
+                "timestamp": datetime.now().isoformat()
+            }
+        finally:
+            current_request_metrics.reset(metrics_token)
+
+async def run_batch_query(
+    tickers: List[str],
+    query: Optional[str] = None,
+    max_concurrency: Optional[int] = None
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """Execute the agent workflow for several tickers, yielding each result as it completes"""
+
+    tickers = list(dict.fromkeys(ticker.strip().upper() for ticker in tickers if ticker.strip()))
+    query = query or DEFAULT_BATCH_QUERY
+    if "{ticker}" not in query:
+        query = f"{query} for {{ticker}}"
+
+    logger.info("Starting batch financial analysis for %s tickers", len(tickers))
+
+    # One bulk download warms the market data cache for every ticker
+    from tools.market_data import market_data
+    try:
+        await run_blocking("yfinance", market_data.prefetch_histories, tickers)
     except Exception as e:
-        logger.error(f"Streaming query error: {str(e)}")
-        yield {
-            "type": "error",
-            "error": str(e),
-            "timestamp": datetime.now().isoformat()
-        }
+        logger.error("Bulk market data download failed: %s", e)
+
+    semaphore = asyncio.Semaphore(max_concurrency or BATCH_MAX_CONCURRENCY)
+
+    async def analyse(ticker: str) -> Dict[str, Any]:
+        async with semaphore:
+            result = await run_query(query.replace("{ticker}", ticker))
+        return {"type": "ticker_result", "ticker": ticker, **result}
+
+    tasks = [asyncio.create_task(analyse(ticker)) for ticker in tickers]
+    try:
+        for completed in asyncio.as_completed(tasks):
+            yield await completed
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def process_message_chunk(chunk: Tuple[BaseMessage, Dict[str, Any]], chunk_number: int) -> Optional[Dict[str, Any]]:
+    """Turn an LLM message chunk into a token event, only for the nodes whose tokens are streamed"""
+    message, message_metadata = chunk
+    # Nested agents report their own node name, the namespace root is the workflow node
+    namespace = message_metadata.get("langgraph_checkpoint_ns") or message_metadata.get("langgraph_node", "")
+    node_name = namespace.split(":")[0]
+    if node_name not in STREAM_TOKEN_NODES:
+        return None
+
+    content = message_text(message)
+    if not content:
+        return None
+    return {
+        "type": "token",
+        "node": node_name,
+        "content": content,
+        "chunk_number": chunk_number
+    }
+
 
-async def process_workflow_chunk(chunk: Dict[str, Any], chunk_number: int) -> Dict[str, Any]:
-    """Process each workflow chunk for streaming"""
+def process_workflow_chunk(chunk: Dict[str, Any], chunk_number: int) -> Dict[str, Any]:
+    """Turn a node update into an event carrying only the keys the node changed"""
     
     try:
         # Extract node information
@@ -145,19 +333,21 @@ async def process_workflow_chunk(chunk: Dict[str, Any], chunk_number: int) -> Di
                 chunk_type = "routing"
                 
             elif node_name == "fundamental_analysis":
-                message = "Performing fundamental analysis..."
+                status = (node_data.get("analysis_results") or {}).get("fundamental", {}).get("status", "completed")
+                message = f"Fundamental analysis {status.replace('_', ' ')}"
                 chunk_type = "analysis"
                 
             elif node_name == "technical_analysis":
-                message = "Performing technical analysis..."
+                status = (node_data.get("analysis_results") or {}).get("technical", {}).get("status", "completed")
+                message = f"Technical analysis {status.replace('_', ' ')}"
                 chunk_type = "analysis"
                 
             elif node_name == "final_analysis":
-                message = "Generating final recommendation..."
+                message = "Final recommendation generated"
                 chunk_type = "synthesis"
                 
             else:
-                message = f"Processing {node_name}..."
+                message = f"{node_name} completed"
                 chunk_type = "processing"
             
             return {
@@ -180,7 +370,7 @@ async def process_workflow_chunk(chunk: Dict[str, Any], chunk_number: int) -> Di
             }
             
     except Exception as e:
-        logger.error(f"Chunk processing error: {str(e)}")
+        logger.error("Chunk processing error: %s", e)
         return {
             "type": "error",
             "error": f"Error processing chunk: {str(e)}",
@@ -0,0 +1,129 @@
+import asyncio
+import importlib
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.executors import run_blocking
+
+logger = logging.getLogger(__name__)
+
+# build the agents and prefetch STARTUP_WARMUP_TICKERS before reporting ready
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "false").lower() == "true"
+# comma separated tickers whose price history is fetched during warm-up
+STARTUP_WARMUP_TICKERS = [ticker.strip() for ticker in os.getenv("STARTUP_WARMUP_TICKERS", "").split(",") if ticker.strip()]
+# seconds a request waits for startup to finish before it is answered with 503
+STARTUP_READY_TIMEOUT = float(os.getenv("STARTUP_READY_TIMEOUT", "30"))
+
+# Modules imported by the imports stage: the tools and, through them, pandas, yfinance and google-genai
+TOOL_MODULES = ["tools.technical_analysis_tools", "tools.fundamental_analysis_tools"]
+
+
+def import_libraries():
+    from tools.indicators import load_pandas_ta
+    from tools.market_data import load_yfinance
+
+    for module in TOOL_MODULES:
+        importlib.import_module(module)
+    load_yfinance()
+    load_pandas_ta()
+
+
+def create_clients():
+    from utils.genai_client import GenAIClientPool
+    from utils.llm_connection import LLMConnection
+
+    LLMConnection()
+    GenAIClientPool()
+
+
+def compile_graph():
+    from agent_workflow import get_agent_workflow
+
+    get_agent_workflow()
+
+
+def warm_up():
+    from agents.fundamental_analysis_agent import fundamental_analysis_agent
+    from agents.prediction_agent import prediction_agent
+    from agents.supervisor_agent import supervisor_agent
+    from agents.technical_analysis_agent import technical_analysis_agent
+    from tools.market_data import market_data
+    from utils.llm_connection import LLMConnection
+
+    llm = LLMConnection().get_llm()
+    for agent in (supervisor_agent, fundamental_analysis_agent, technical_analysis_agent, prediction_agent):
+        agent.create_agent(llm)
+
+    if STARTUP_WARMUP_TICKERS:
+        market_data.prefetch_histories(STARTUP_WARMUP_TICKERS)
+
+
+class Startup():
+    """
+    Staged application startup.
+
+    Importing the app only loads the web layer. The heavy libraries, model clients and the
+    compiled graph are created by `run` in the background, one stage after another on a worker
+    thread, so the server accepts connections (and answers /ready) while they load.
+    """
+
+    def __init__(self, warmup: bool = STARTUP_WARMUP):
+        self.stages: List[Tuple[str, Callable[[], Any]]] = [
+            ("imports", import_libraries),
+            ("clients", create_clients),
+            ("graph", compile_graph),
+        ]
+        if warmup:
+            self.stages.append(("warmup", warm_up))
+        self.status: Dict[str, Dict[str, Any]] = {name: {"status": "pending"} for name, _ in self.stages}
+        self.started_at: Optional[str] = None
+        self._done: Optional[asyncio.Event] = None
+
+    @property
+    def ready(self) -> bool:
+        return all(stage["status"] == "ready" for stage in self.status.values())
+
+    @property
+    def failed(self) -> bool:
+        return any(stage["status"] == "failed" for stage in self.status.values())
+
+    def _event(self) -> asyncio.Event:
+        if self._done is None:
+            self._done = asyncio.Event()
+        return self._done
+
+    async def run(self):
+        self.started_at = datetime.now().isoformat()
+        done = self._event()
+        try:
+            for name, stage in self.stages:
+                self.status[name] = {"status": "running"}
+                start = time.perf_counter()
+                try:
+                    await run_blocking("default", stage)
+                except Exception as e:
+                    logger.exception("Startup stage %s failed", name)
+                    self.status[name] = {"status": "failed", "error": str(e), "seconds": round(time.perf_counter() - start, 3)}
+                    return
+                self.status[name] = {"status": "ready", "seconds": round(time.perf_counter() - start, 3)}
+                logger.info("Startup stage %s ready in %.3fs", name, self.status[name]["seconds"])
+        finally:
+            done.set()
+
+    async def wait_ready(self, timeout: float = STARTUP_READY_TIMEOUT) -> bool:
+        """Wait until startup has finished; False if it failed or did not finish in time"""
+        if not self.ready and not self.failed:
+            try:
+                await asyncio.wait_for(self._event().wait(), timeout)
+            except asyncio.TimeoutError:
+                return False
+        return self.ready
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"ready": self.ready, "started_at": self.started_at, "stages": self.status}
+
+
+startup = Startup()
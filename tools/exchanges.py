@@ -0,0 +1,36 @@
+# yfinance exchange suffix -> country of the listing
+EXCHANGE_COUNTRIES = {
+    "NS": "India",
+    "BO": "India",
+    "L": "United Kingdom",
+    "TO": "Canada",
+    "V": "Canada",
+    "AX": "Australia",
+    "HK": "Hong Kong",
+    "T": "Japan",
+    "SS": "China",
+    "SZ": "China",
+    "KS": "South Korea",
+    "KQ": "South Korea",
+    "SI": "Singapore",
+    "DE": "Germany",
+    "F": "Germany",
+    "PA": "France",
+    "AS": "Netherlands",
+    "MI": "Italy",
+    "MC": "Spain",
+    "SW": "Switzerland",
+    "ST": "Sweden",
+    "SA": "Brazil",
+    "MX": "Mexico",
+    "JO": "South Africa",
+}
+DEFAULT_COUNTRY = "United States"
+
+
+def infer_country(ticker: str) -> str:
+    """Infer the country of a listing from its exchange suffix, e.g. India for RELIANCE.NS"""
+    if "." not in ticker:
+        return DEFAULT_COUNTRY
+    suffix = ticker.rsplit(".", 1)[1].upper()
+    return EXCHANGE_COUNTRIES.get(suffix, DEFAULT_COUNTRY)
@@ -0,0 +1,127 @@
+import json
+import logging
+import math
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from utils.tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+PRICE_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+
+def _round(value: Any, digits: int = 2) -> Optional[float]:
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return round(float(value), digits)
+
+
+def _date(timestamp: pd.Timestamp) -> str:
+    return timestamp.strftime("%Y-%m-%d")
+
+
+def _sma_crossover(result: pd.DataFrame) -> Dict[str, Any]:
+    """Return the most recent SMA_50/SMA_200 crossover inside the window"""
+    spread = (result["SMA_50"] - result["SMA_200"]).dropna()
+    signs = np.sign(spread)
+    changes = signs[signs.diff().fillna(0) != 0]
+    if changes.empty:
+        return {"type": "none"}
+
+    timestamp = changes.index[-1]
+    return {
+        "type": "golden_cross" if changes.iloc[-1] > 0 else "death_cross",
+        "date": _date(timestamp),
+    }
+
+
+def _summary(ticker: str, result: pd.DataFrame) -> Dict[str, Any]:
+    last = result.iloc[-1]
+    first_close = result["Close"].iloc[0]
+    close = last["Close"]
+
+    summary = {
+        "ticker": ticker,
+        "as_of": _date(result.index[-1]),
+        "close": _round(close),
+        "change_pct": _round((close / first_close - 1) * 100) if first_close else None,
+        "trend": last["trend"],
+        "sma_50": _round(last["SMA_50"]),
+        "sma_200": _round(last["SMA_200"]),
+        "sma_crossover": _sma_crossover(result),
+        "support": _round(last["SR_low"]),
+        "resistance": _round(last["SR_high"]),
+    }
+    if summary["resistance"] and summary["support"]:
+        summary["distance_to_resistance_pct"] = _round((last["SR_high"] / close - 1) * 100)
+        summary["distance_to_support_pct"] = _round((close / last["SR_low"] - 1) * 100)
+    return summary
+
+
+def _patterns(result: pd.DataFrame) -> List[Dict[str, Any]]:
+    """List the candlestick patterns that fired; columns that never fired are dropped"""
+    pattern_columns = [column for column in result.columns if column.startswith("CDL")]
+    fired = result[pattern_columns]
+    fired = fired.loc[:, (fired != 0).any(axis=0)]
+
+    events = []
+    for timestamp, row in fired.iterrows():
+        for column, signal in row[row != 0].items():
+            events.append({
+                "date": _date(timestamp),
+                "pattern": column.removeprefix("CDL_"),
+                "signal": "bullish" if signal > 0 else "bearish",
+            })
+    return events
+
+
+def _bars(result: pd.DataFrame) -> Dict[str, Any]:
+    rows = []
+    for timestamp, row in result[PRICE_COLUMNS].iterrows():
+        rows.append([
+            _date(timestamp),
+            _round(row["Open"]),
+            _round(row["High"]),
+            _round(row["Low"]),
+            _round(row["Close"]),
+            int(row["Volume"]) if not math.isnan(row["Volume"]) else None,
+        ])
+    return {"columns": ["date", "open", "high", "low", "close", "volume"], "rows": rows}
+
+
+def _dumps(payload: Dict[str, Any]) -> str:
+    return json.dumps(payload, separators=(",", ":"))
+
+
+def format_chart_patterns(ticker: str, result: pd.DataFrame, token_budget: int) -> str:
+    """
+    Compact, token budgeted representation of the indicator engine output.
+
+    Trend, SMA crossover and support/resistance are summarised as structured fields, only
+    fired candlestick patterns are listed and prices are rounded. When the payload exceeds
+    the token budget the oldest bars are dropped first, then the oldest pattern events.
+    """
+    if result.empty:
+        return _dumps({"ticker": ticker, "error": "no price data"})
+
+    payload = {
+        "summary": _summary(ticker, result),
+        "patterns": _patterns(result),
+        "bars": _bars(result),
+    }
+
+    text = _dumps(payload)
+    while estimate_tokens(text) > token_budget and payload["bars"]["rows"]:
+        payload["bars"]["rows"].pop(0)
+        text = _dumps(payload)
+
+    while estimate_tokens(text) > token_budget and payload["patterns"]:
+        payload["patterns"].pop(0)
+        text = _dumps(payload)
+
+    if estimate_tokens(text) > token_budget:
+        logger.warning("Chart pattern summary for %s exceeds token budget of %s", ticker, token_budget)
+    return text
@@ -1,24 +1,62 @@
 import logging
-import yfinance as yf
 from typing import Dict, List, Tuple, Union
 from pydantic import BaseModel
 from langchain.tools import tool
 
-from google import genai
-from google.genai import types
-from dotenv import load_dotenv
+from tools.exchanges import infer_country
+from tools.fundamentals_store import fundamentals_store
+from tools.market_data import market_data
+from utils.cache import TTLCache
+from utils.executors import run_blocking
+from utils.genai_client import GenAIClientPool, generation_config
 import os
 
 logger = logging.getLogger(__name__)
-load_dotenv()
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# Industry and macroeconomic analyses depend on the sector and country, not the individual stock
+SCOPED_CACHE_MAX_ENTRIES = int(os.getenv("SCOPED_CACHE_MAX_ENTRIES", "256"))
+industry_analysis_cache = TTLCache(
+    "industry_analysis",
+    ttl=int(os.getenv("INDUSTRY_CACHE_TTL", "21600")),
+    max_entries=SCOPED_CACHE_MAX_ENTRIES,
+)
+macroeconomic_cache = TTLCache(
+    "macroeconomic_conditions",
+    ttl=int(os.getenv("MACRO_CACHE_TTL", "21600")),
+    max_entries=SCOPED_CACHE_MAX_ENTRIES,
+)
+# Summaries of a single stock, also filled ahead of time by services/precompute.py
+TICKER_CACHE_MAX_ENTRIES = int(os.getenv("TICKER_CACHE_MAX_ENTRIES", "1024"))
+financial_statements_cache = TTLCache(
+    "financial_statements",
+    ttl=int(os.getenv("FINANCIAL_STATEMENTS_CACHE_TTL", "86400")),
+    max_entries=TICKER_CACHE_MAX_ENTRIES,
+)
+valuation_ratios_cache = TTLCache(
+    "valuation_ratios",
+    ttl=int(os.getenv("VALUATION_CACHE_TTL", "3600")),
+    max_entries=TICKER_CACHE_MAX_ENTRIES,
+)
+company_overview_cache = TTLCache(
+    "company_overview",
+    ttl=int(os.getenv("COMPANY_OVERVIEW_CACHE_TTL", "86400")),
+    max_entries=TICKER_CACHE_MAX_ENTRIES,
+)
 
-# Configure the client
+
+async def industry_scope(ticker: str) -> tuple:
+    """Cache key of the industry analysis: (sector, country), falling back to the ticker"""
+    try:
+        info = await run_blocking("yfinance", market_data.get_info, ticker)
+        sector = info.get("sector")
+    except Exception as e:
+        logger.warning("Could not look up sector of %s: %s", ticker, e)
+        sector = None
+    return (sector or ticker.upper(), infer_country(ticker))
 
 
 @tool("get_financial_statements")
-def get_financial_statements(ticker: str) -> str:
+async def get_financial_statements(ticker: str) -> str:
     """
     Analyzes financial statements for a given ticker.
     
@@ -28,83 +66,37 @@ def get_financial_statements(ticker: str) -> str:
     Returns:
         A dictionary of financial statements.
     """
-    logger.info(f"Fetching financial statements for {ticker}")
-    
-    stock = yf.Ticker(ticker)
+    logger.info("Fetching financial statements for %s", ticker)
+    return await financial_statements_cache.aget_or_compute(
+        ticker.upper(), lambda: summarize_financial_statements(ticker.upper())
+    )
 
-    income_statement = stock.income_stmt
-    balance_sheet = stock.balance_sheet
-    cash_flow = stock.cashflow
-    
-    revenue_details_for_last_3_years = "Revenue Details: "
-    expenses_details_for_last_3_years = "Expenses Details: "
-    net_profit_details_for_last_3_years = "Net Profit Details: "
-    
-    net_debt_details_for_last_3_years = "Net Debt Details: "
-    total_Debt_details_for_last_3_years = "Total Debt Details: "
-    debt_to_equity_ratio_details_for_last_3_years = "Debt-to-Equity Ratio Details: "
-    
-    free_cash_flow_details_for_last_3_years = "Free Cash Flow Details: "
-    operating_cash_flow_details_for_last_3_years = "Operating Cash Flow Details: "
-    
-    for year in income_statement.columns[:3]:
-        # Income Statement
-        revenue_details_for_last_3_years += f"{year}: {income_statement.loc['Total Revenue', year]}, "
-        expenses_details_for_last_3_years += f"{year}: {income_statement.loc['Total Expenses', year]}, "
-        net_profit_details_for_last_3_years += f"{year}: {income_statement.loc['Gross Profit', year]}, "
-        
-        # Balance Sheet
-        net_debt_details_for_last_3_years += f"{year}: {balance_sheet.loc['Net Debt', year]}, "
-        total_Debt_details_for_last_3_years += f"{year}: {balance_sheet.loc['Total Debt', year]}, "
-        
-        debt_to_equity_ratio = balance_sheet.loc['Total Debt', year] / balance_sheet.loc['Tangible Book Value', year]
-        debt_to_equity_ratio_details_for_last_3_years += f"{year}: {debt_to_equity_ratio}, "
-        
-        # cash flow
-        free_cash_flow_details_for_last_3_years += f"{year}: {cash_flow.loc['Free Cash Flow', year]}, "
-        operating_cash_flow_details_for_last_3_years += f"{year}: {cash_flow.loc['Operating Cash Flow', year]}, "
-    
-    response = {
-        "period": "Last 3 Years",
-        "data": {
-            "income_statement": {
-                "revenue_details": revenue_details_for_last_3_years[:-2],
-                "expenses_details": expenses_details_for_last_3_years[:-2],
-                "net_profit_details": net_profit_details_for_last_3_years[:-2],
-                },
-            "balance_sheet": {
-                "net_debt_details": net_debt_details_for_last_3_years[:-2],
-                "total_Debt_details": total_Debt_details_for_last_3_years[:-2],
-                "debt_to_equity_ratio_details": debt_to_equity_ratio_details_for_last_3_years[:-2],
-                },
-            "cash_flow": {
-                "free_cash_flow_details": free_cash_flow_details_for_last_3_years[:-2],
-                "operating_cash_flow_details": operating_cash_flow_details_for_last_3_years[:-2],
-                },
-        }
-    }
+
+async def summarize_financial_statements(ticker: str) -> str:
+    # Precomputed by the fundamentals store, fetched into it on first use
+    response = fundamentals_store.financial_statements(ticker)
+    if response is None:
+        response = await run_blocking("yfinance", fundamentals_store.load_financial_statements, ticker)
     
     system_instruction = f"Analyse the Financial Statements for {ticker} and give a summarized analysis of the company's financial performance in the last 3 years. \n\n"
-    client = genai.Client(
-        api_key=GEMINI_API_KEY
-    )
-    config = types.GenerateContentConfig(
+    config = generation_config(
         max_output_tokens=200,
-        system_instruction= system_instruction,
+        system_instruction=system_instruction,
         temperature=0.9
     )
-    summarized_response = client.models.generate_content(
+    summarized_response = await GenAIClientPool().agenerate_content(
         model="gemini-2.0-flash-lite",
         contents=f"Financial Data: {response} \n Use Maximum of 200 words.",
         config=config,
     )
     
-    logger.info(f"Successfully fetched financial statements for {ticker}: {summarized_response.text}")
+    logger.info("Successfully fetched financial statements for %s", ticker)
+    logger.debug("Successfully fetched financial statements for %s: %s", ticker, summarized_response.text)
     return summarized_response.text
     
     
 @tool("get_valuation_ratios")
-def get_valuation_ratios(ticker: str) -> str:
+async def get_valuation_ratios(ticker: str) -> str:
     """
     Analyzes valuation ratios for a given ticker.
     
@@ -113,43 +105,37 @@ def get_valuation_ratios(ticker: str) -> str:
     Returns:
         A dictionary of valuation ratios.
     """
-    logger.info(f"Fetching valuation ratios for {ticker}")
-    stock = yf.Ticker(ticker)
-    stock_info = stock.info
-    
+    logger.info("Fetching valuation ratios for %s", ticker)
+    return await valuation_ratios_cache.aget_or_compute(
+        ticker.upper(), lambda: summarize_valuation_ratios(ticker.upper())
+    )
+
+
+async def summarize_valuation_ratios(ticker: str) -> str:
+    valuation_ratios = fundamentals_store.valuation_ratios(ticker)
+    if valuation_ratios is None:
+        valuation_ratios = await run_blocking("yfinance", fundamentals_store.load_valuation_ratios, ticker)
     
-    valuation_ratios = {
-        "P/E": stock_info.get("trailingPE"),
-        "Forward P/E": stock_info.get("forwardPE"),
-        "P/B": stock_info.get("priceToBook"),
-        "ROE": stock_info.get("returnOnEquity"),
-        "EPS (TTM)": stock_info.get("trailingEps"),
-        "EPS (Forward)": stock_info.get("forwardEps"),
-        "D/E": stock_info.get("debtToEquity"),
-        "Current Ratio": stock_info.get("currentRatio"),
-    }
     system_instruction = f"Analyse the Valuation Ratios for {ticker} and give a summarized analysis of the company's valuation performance in the last 3 years. \n\n"
-    client = genai.Client(
-        api_key=GEMINI_API_KEY
-    )
-    config = types.GenerateContentConfig(
+    config = generation_config(
         max_output_tokens=200,
         system_instruction=system_instruction,
         temperature=0.9
     )
     
-    summarized_response = client.models.generate_content(
+    summarized_response = await GenAIClientPool().agenerate_content(
         model="gemini-2.0-flash-lite",
         contents=f"Valuation Ratios Data: {valuation_ratios} \n Use Maximum of 200 words.",
         config=config,
     )
     
-    logger.info(f"Successfully fetched valuation ratios for {ticker}: {summarized_response.text}")
+    logger.info("Successfully fetched valuation ratios for %s", ticker)
+    logger.debug("Successfully fetched valuation ratios for %s: %s", ticker, summarized_response.text)
     return summarized_response.text
 
 
 @tool("get_company_overview")
-def get_management_and_business_details(ticker: str) -> str:
+async def get_management_and_business_details(ticker: str) -> str:
     """
     Understand and Analyze management and business details for a given ticker.
 
@@ -158,13 +144,12 @@ def get_management_and_business_details(ticker: str) -> str:
     Returns:
         A string of management and business details.
     """
-    logger.info(f"Fetching company overview for {ticker}")
+    logger.info("Fetching company overview for %s", ticker)
+    return await company_overview_cache.aget_or_compute(ticker.upper(), lambda: company_overview(ticker.upper()))
 
 
-    # Define the grounding tool
-    grounding_tool = types.Tool(
-        google_search=types.GoogleSearch()
-    )
+async def company_overview(ticker: str) -> str:
+
     system_instruction = """
     You are a stock market analyst. Analyse the given stock on these topics only:
 
@@ -176,26 +161,24 @@ def get_management_and_business_details(ticker: str) -> str:
     Answer under 500 words. Keep your answers short and crisp.
     """
     # Configure generation settings
-    config = types.GenerateContentConfig(
-        tools=[grounding_tool],
+    config = generation_config(
         max_output_tokens=500,
-        system_instruction= system_instruction,
-        temperature=0.9
-    )
-    client = genai.Client(
-        api_key=GEMINI_API_KEY
+        system_instruction=system_instruction,
+        temperature=0.9,
+        google_search=True
     )
-    response = client.models.generate_content(
+    response = await GenAIClientPool().agenerate_content(
         model="gemini-2.0-flash",
         contents=f"Stock: {ticker}",
         config=config,
     )
-    logger.info(f"Successfully fetched company overview for {ticker}: {response.text}")
+    logger.info("Successfully fetched company overview for %s", ticker)
+    logger.debug("Successfully fetched company overview for %s: %s", ticker, response.text)
     return response.text
 
 
 @tool("get_industry_analysis")
-def get_industry_analysis(ticker: str) -> str:
+async def get_industry_analysis(ticker: str) -> str:
     """
     Analyze industry analysis for a given ticker.
 
@@ -204,43 +187,44 @@ def get_industry_analysis(ticker: str) -> str:
     Returns:
         A string of industry analysis.
     """
-    logger.info(f"Fetching industry analysis for {ticker}")
-    
-    # Define the grounding tool
-    grounding_tool = types.Tool(
-        google_search=types.GoogleSearch()
+    logger.info("Fetching industry analysis for %s", ticker)
+    sector, country = await industry_scope(ticker)
+    return await industry_analysis_cache.aget_or_compute(
+        (sector, country), lambda: industry_analysis(sector, country)
     )
+
+
+async def industry_analysis(sector: str, country: str) -> str:
+    logger.info("Running industry analysis for %s in %s", sector, country)
     system_instruction = """
-    You are a stock's Industry analyst. Analyse the given stock Industry on these topics only:
+    You are an Industry analyst. Analyse the given Industry in the given country on these topics only:
 
     1. Industry Growth: Is the industry itself growing or declining? - 50 words maximum
     2. Competition: How intense is the competition? - 50 words maximum
-    3. Regulatory Environment: Are there any government policies or regulations that could significantly impact the company? - 50 words maximum
+    3. Regulatory Environment: Are there any government policies or regulations that could significantly impact companies in the industry? - 50 words maximum
     5. Economic Cycles: How does the industry perform during different economic cycles (boom, recession)? - 100 words maximum
 
     Answer under 500 words. Keep your answers short and crisp.
     """
     # Configure generation settings
-    config = types.GenerateContentConfig(
-        tools=[grounding_tool],
+    config = generation_config(
         max_output_tokens=500,
-        system_instruction= system_instruction,
-        temperature=0.9
-    )
-    client = genai.Client(
-        api_key=GEMINI_API_KEY
+        system_instruction=system_instruction,
+        temperature=0.9,
+        google_search=True
     )
-    response = client.models.generate_content(
+    response = await GenAIClientPool().agenerate_content(
         model="gemini-2.0-flash",
-        contents=f"Stock: {ticker}",
+        contents=f"Industry: {sector}\nCountry: {country}",
         config=config,
     )
-    logger.info(f"Successfully fetched industry analysis for {ticker}: {response.text}")
+    logger.info("Successfully fetched industry analysis for %s in %s", sector, country)
+    logger.debug("Successfully fetched industry analysis for %s in %s: %s", sector, country, response.text)
     return response.text
 
 
 @tool("get_macroeconomic_conditions")
-def get_macroeconomic_conditions(ticker: str) -> str:
+async def get_macroeconomic_conditions(ticker: str) -> str:
     """
     Analyze global/country specific macroeconomic conditions for a given ticker.
     
@@ -249,13 +233,15 @@ def get_macroeconomic_conditions(ticker: str) -> str:
     Returns:
         A string of macroeconomic conditions.
     """
-    logger.info(f"Fetching macroeconomic conditions for {ticker}")
-    # Define the grounding tool
-    grounding_tool = types.Tool(
-        google_search=types.GoogleSearch()
-    )
+    logger.info("Fetching macroeconomic conditions for %s", ticker)
+    country = infer_country(ticker)
+    return await macroeconomic_cache.aget_or_compute(country, lambda: macroeconomic_conditions(country))
+
+
+async def macroeconomic_conditions(country: str) -> str:
+    logger.info("Running macroeconomic analysis for %s", country)
     system_instruction = """
-    You are a Macroeconomic analyst. Analyse the given stock with respective country and global Macroeconomic on these topics only:
+    You are a Macroeconomic analyst. Analyse the given country and global Macroeconomic conditions for its stock market on these topics only:
 
     1. Interest Rates: Rising interest rates can make borrowing more expensive for companies and make bonds more attractive than stocks. - 50 words maximum
     2. Inflation: High inflation can erode purchasing power and company profits. - 50 words maximum
@@ -266,22 +252,20 @@ def get_macroeconomic_conditions(ticker: str) -> str:
     Answer under 1000 words. Keep your answers short and crisp.
     """
     # Configure generation settings
-    config = types.GenerateContentConfig(
-        tools=[grounding_tool],
+    config = generation_config(
         max_output_tokens=1000,
-        system_instruction= system_instruction,
-        temperature=0.9
-    )
-    client = genai.Client(
-        api_key=GEMINI_API_KEY
+        system_instruction=system_instruction,
+        temperature=0.9,
+        google_search=True
     )
-    response = client.models.generate_content(
+    response = await GenAIClientPool().agenerate_content(
         model="gemini-2.0-flash",
-        contents=f"Stock: {ticker}",
+        contents=f"Country: {country}",
         config=config,
     )
     
-    logger.info(f"Successfully fetched macroeconomic conditions for {ticker}: {response.text}")
+    logger.info("Successfully fetched macroeconomic conditions for %s", country)
+    logger.debug("Successfully fetched macroeconomic conditions for %s: %s", country, response.text)
     return response.text
 
 
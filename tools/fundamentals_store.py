@@ -0,0 +1,380 @@
+import asyncio
+import logging
+import os
+import time
+from threading import Lock
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from tools.market_data import market_data
+from utils.executors import run_blocking
+from utils.shared_store import take_lease
+
+logger = logging.getLogger(__name__)
+
+FUNDAMENTALS_STORE_DIR = os.getenv("FUNDAMENTALS_STORE_DIR", ".cache/fundamentals")
+# Statements change quarterly, valuation ratios move with the price
+FUNDAMENTALS_STATEMENT_TTL = int(os.getenv("FUNDAMENTALS_STATEMENT_TTL", "86400"))
+FUNDAMENTALS_VALUATION_TTL = int(os.getenv("FUNDAMENTALS_VALUATION_TTL", "3600"))
+# seconds between scheduled refreshes of the stale rows, 0 refreshes them when they are read instead
+FUNDAMENTALS_REFRESH_INTERVAL = int(os.getenv("FUNDAMENTALS_REFRESH_INTERVAL", "900"))
+# comma separated tickers kept in the store from startup; others are added on first request
+FUNDAMENTALS_UNIVERSE = [ticker.strip().upper() for ticker in os.getenv("FUNDAMENTALS_UNIVERSE", "").split(",") if ticker.strip()]
+FUNDAMENTALS_YEARS = int(os.getenv("FUNDAMENTALS_YEARS", "3"))
+
+# Columns of the statements table by yfinance statement and line item
+STATEMENT_COLUMNS = {
+    "income_stmt": {
+        "Total Revenue": "total_revenue",
+        "Total Expenses": "total_expenses",
+        "Gross Profit": "gross_profit",
+    },
+    "balance_sheet": {
+        "Net Debt": "net_debt",
+        "Total Debt": "total_debt",
+        "Tangible Book Value": "tangible_book_value",
+    },
+    "cashflow": {
+        "Free Cash Flow": "free_cash_flow",
+        "Operating Cash Flow": "operating_cash_flow",
+    },
+}
+# Columns of the valuations table by yfinance info key, with the label the tool reports
+VALUATION_COLUMNS = {
+    "trailingPE": ("trailing_pe", "P/E"),
+    "forwardPE": ("forward_pe", "Forward P/E"),
+    "priceToBook": ("price_to_book", "P/B"),
+    "returnOnEquity": ("return_on_equity", "ROE"),
+    "trailingEps": ("trailing_eps", "EPS (TTM)"),
+    "forwardEps": ("forward_eps", "EPS (Forward)"),
+    "debtToEquity": ("debt_to_equity", "D/E"),
+    "currentRatio": ("current_ratio", "Current Ratio"),
+}
+
+# Reported series of the financial statements summary: (section, key, label, column)
+STATEMENT_DETAILS = [
+    ("income_statement", "revenue_details", "Revenue Details", "total_revenue"),
+    ("income_statement", "expenses_details", "Expenses Details", "total_expenses"),
+    ("income_statement", "net_profit_details", "Net Profit Details", "gross_profit"),
+    ("income_statement", "revenue_growth_details", "Revenue Growth Details", "revenue_growth"),
+    ("balance_sheet", "net_debt_details", "Net Debt Details", "net_debt"),
+    ("balance_sheet", "total_Debt_details", "Total Debt Details", "total_debt"),
+    ("balance_sheet", "debt_to_equity_ratio_details", "Debt-to-Equity Ratio Details", "debt_to_equity"),
+    ("cash_flow", "free_cash_flow_details", "Free Cash Flow Details", "free_cash_flow"),
+    ("cash_flow", "operating_cash_flow_details", "Operating Cash Flow Details", "operating_cash_flow"),
+    ("cash_flow", "free_cash_flow_margin_details", "Free Cash Flow Margin Details", "free_cash_flow_margin"),
+]
+
+
+def statement_rows(ticker: str, statements: Dict[str, pd.DataFrame], fetched_at: float) -> pd.DataFrame:
+    """Rows of the statements table for a ticker: one per annual period, newest first"""
+    income_statement = statements["income_stmt"]
+    periods = income_statement.columns[:FUNDAMENTALS_YEARS]
+    frames = [
+        statements[statement].reindex(index=list(columns), columns=periods).T.rename(columns=columns)
+        for statement, columns in STATEMENT_COLUMNS.items()
+    ]
+    rows = pd.concat(frames, axis=1).apply(pd.to_numeric, errors="coerce")
+    rows.index = pd.to_datetime(rows.index)
+    rows = rows.rename_axis("period").reset_index()
+    rows.insert(0, "ticker", ticker)
+    rows["fetched_at"] = fetched_at
+    return rows
+
+
+def valuation_row(ticker: str, info: Dict[str, Any], fetched_at: float) -> pd.DataFrame:
+    row = {"ticker": ticker, **{column: info.get(key) for key, (column, _) in VALUATION_COLUMNS.items()}}
+    row["fetched_at"] = fetched_at
+    frame = pd.DataFrame([row])
+    columns = [column for column, _ in VALUATION_COLUMNS.values()]
+    frame[columns] = frame[columns].apply(pd.to_numeric, errors="coerce")
+    return frame
+
+
+def compute_ratios(statements: pd.DataFrame) -> pd.DataFrame:
+    """Derived ratios of every ticker and period in one vectorised pass, newest period first"""
+    frame = statements.sort_values(["ticker", "period"]).reset_index(drop=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        frame["debt_to_equity"] = frame["total_debt"] / frame["tangible_book_value"]
+        frame["gross_margin"] = frame["gross_profit"] / frame["total_revenue"]
+        frame["free_cash_flow_margin"] = frame["free_cash_flow"] / frame["total_revenue"]
+        frame["revenue_growth"] = frame.groupby("ticker")["total_revenue"].pct_change(fill_method=None)
+    return frame.sort_values(["ticker", "period"], ascending=[True, False]).reset_index(drop=True)
+
+
+def statement_summaries(ratios: pd.DataFrame) -> Dict[str, Dict[str, Any]]:
+    """The financial statements payload of every ticker, formatted column-wise"""
+    if ratios.empty:
+        return {}
+    labels = ratios["period"].dt.strftime("%Y-%m-%d") + ": "
+    details = pd.DataFrame({"ticker": ratios["ticker"]})
+    for _, key, _, column in STATEMENT_DETAILS:
+        details[key] = labels + ratios[column].astype(str)
+    joined = details.groupby("ticker", sort=False).agg(", ".join)
+
+    summaries = {}
+    for ticker, row in zip(joined.index, joined.to_dict("records")):
+        data: Dict[str, Dict[str, str]] = {}
+        for section, key, label, _ in STATEMENT_DETAILS:
+            data.setdefault(section, {})[key] = f"{label}: {row[key]}"
+        summaries[ticker] = {"period": f"Last {FUNDAMENTALS_YEARS} Years", "data": data}
+    return summaries
+
+
+def valuation_summaries(valuations: pd.DataFrame) -> Dict[str, Dict[str, Any]]:
+    """The valuation ratios payload of every ticker, missing values as None"""
+    if valuations.empty:
+        return {}
+    columns = {column: label for column, label in VALUATION_COLUMNS.values()}
+    frame = valuations.set_index("ticker")[list(columns)].rename(columns=columns)
+    frame = frame.astype(object).where(frame.notna(), None)
+    return frame.to_dict("index")
+
+
+class FundamentalsStore():
+    """
+    Local columnar store of the fundamentals of a ticker universe.
+
+    Annual statements (one row per ticker and period) and valuation ratios (one row per
+    ticker) are kept as Parquet tables in `store_dir`, shared by the workers of a host. Derived
+    ratios and the tool payloads of every ticker are recomputed in one vectorised pass whenever
+    the tables change, so tool reads are dictionary lookups. Stale rows are refreshed by
+    `run_schedule`, or on read when the schedule is disabled; tickers missing from the store
+    are fetched on first read and stay in the universe.
+    """
+
+    def __init__(
+        self,
+        store_dir: str = FUNDAMENTALS_STORE_DIR,
+        statement_ttl: int = FUNDAMENTALS_STATEMENT_TTL,
+        valuation_ttl: int = FUNDAMENTALS_VALUATION_TTL,
+        refresh_interval: int = FUNDAMENTALS_REFRESH_INTERVAL,
+        universe: Iterable[str] = FUNDAMENTALS_UNIVERSE,
+    ):
+        self.store_dir = store_dir
+        self.statement_ttl = statement_ttl
+        self.valuation_ttl = valuation_ttl
+        self.refresh_interval = refresh_interval
+        self.universe = list(universe)
+        self._lock = Lock()
+        self._mtimes: Dict[str, float] = {}
+        self.statements = pd.DataFrame()
+        self.valuations = pd.DataFrame()
+        self.ratios = pd.DataFrame()
+        self._statement_summaries: Dict[str, Dict[str, Any]] = {}
+        self._valuation_summaries: Dict[str, Dict[str, Any]] = {}
+        self._fetched_at: Dict[str, Dict[str, float]] = {"statements": {}, "valuations": {}}
+        os.makedirs(store_dir, exist_ok=True)
+        self._reload()
+
+    # ---- reads ----
+
+    def financial_statements(self, ticker: str) -> Optional[Dict[str, Any]]:
+        """Precomputed financial statements payload, None when the ticker must be fetched first"""
+        return self._read("statements", ticker.upper(), self._statement_summaries, self.statement_ttl)
+
+    def valuation_ratios(self, ticker: str) -> Optional[Dict[str, Any]]:
+        """Precomputed valuation ratios, None when the ticker must be fetched first"""
+        return self._read("valuations", ticker.upper(), self._valuation_summaries, self.valuation_ttl)
+
+    def _read(self, table: str, ticker: str, summaries: Dict[str, Dict[str, Any]], ttl: int) -> Optional[Dict[str, Any]]:
+        summary = summaries.get(ticker)
+        if summary is None:
+            return None
+        # With a schedule, stale rows are served until it refreshes them
+        if self.refresh_interval <= 0 and not self._is_fresh(table, ticker, ttl):
+            return None
+        return summary
+
+    def load_financial_statements(self, ticker: str) -> Dict[str, Any]:
+        """Blocking: fetch the ticker's statements into the store and return its payload"""
+        ticker = ticker.upper()
+        self.refresh([ticker], valuations=False, stale_only=False, raise_errors=True)
+        return self._statement_summaries[ticker]
+
+    def load_valuation_ratios(self, ticker: str) -> Dict[str, Any]:
+        """Blocking: fetch the ticker's valuation ratios into the store and return them"""
+        ticker = ticker.upper()
+        self.refresh([ticker], statements=False, stale_only=False, raise_errors=True)
+        return self._valuation_summaries[ticker]
+
+    # ---- refresh ----
+
+    def tickers(self) -> List[str]:
+        known = set(self._fetched_at["statements"]) | set(self._fetched_at["valuations"])
+        return sorted(known | set(self.universe))
+
+    def refresh(
+        self,
+        tickers: Optional[Iterable[str]] = None,
+        statements: bool = True,
+        valuations: bool = True,
+        stale_only: bool = True,
+        raise_errors: bool = False,
+    ) -> Dict[str, int]:
+        """
+        Blocking: fetch the statements and valuation ratios of `tickers` (the whole universe by
+        default) that are missing or stale, write the tables and recompute the derived ratios.
+        Tickers that cannot be fetched are logged and skipped unless `raise_errors` is set.
+        """
+        with self._lock:
+            # Rows refreshed by another worker are not fetched again
+            self._reload_changed()
+        tickers = [ticker.upper() for ticker in (tickers or self.tickers())]
+        statement_tickers = [
+            ticker for ticker in tickers
+            if statements and not (stale_only and self._is_fresh("statements", ticker, self.statement_ttl))
+        ]
+        valuation_tickers = [
+            ticker for ticker in tickers
+            if valuations and not (stale_only and self._is_fresh("valuations", ticker, self.valuation_ttl))
+        ]
+
+        now = time.time()
+        statement_frames, valuation_frames = [], []
+        for ticker in statement_tickers:
+            try:
+                fetched = {statement: market_data.get_statement(ticker, statement) for statement in STATEMENT_COLUMNS}
+                statement_frames.append(statement_rows(ticker, fetched, now))
+            except Exception as e:
+                if raise_errors:
+                    raise
+                logger.error("Could not refresh statements of %s: %s", ticker, e)
+        for ticker in valuation_tickers:
+            try:
+                valuation_frames.append(valuation_row(ticker, market_data.get_info(ticker), now))
+            except Exception as e:
+                if raise_errors:
+                    raise
+                logger.error("Could not refresh valuation ratios of %s: %s", ticker, e)
+
+        if statement_frames or valuation_frames:
+            with self._lock:
+                # Another worker may have written the tables while these tickers were fetched
+                self._reload_changed()
+                statements_table = self._merge(self.statements, statement_frames)
+                valuations_table = self._merge(self.valuations, valuation_frames)
+                if statement_frames:
+                    self._write("statements", statements_table)
+                if valuation_frames:
+                    self._write("valuations", valuations_table)
+                self._update(statements_table, valuations_table)
+        return {"statements": len(statement_frames), "valuations": len(valuation_frames)}
+
+    async def run_schedule(self):
+        """
+        Refresh the stale rows of the universe every `refresh_interval` seconds.
+
+        Runs start on multiples of the interval and take a lease in the shared store, so with
+        several workers only one of them refreshes each time.
+        """
+        if self.refresh_interval <= 0:
+            return
+        logger.info("Refreshing fundamentals of %s tickers every %ss", len(self.tickers()), self.refresh_interval)
+        while True:
+            run = int(time.time() // self.refresh_interval)
+            if await take_lease(f"fundamentals:{run}", self.refresh_interval):
+                try:
+                    refreshed = await run_blocking("yfinance", self.refresh)
+                    if any(refreshed.values()):
+                        logger.info("Refreshed fundamentals: %s", refreshed)
+                except Exception as e:
+                    logger.error("Scheduled fundamentals refresh failed: %s", e)
+            await asyncio.sleep(max(0.0, (run + 1) * self.refresh_interval - time.time()))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tickers": len(self.tickers()),
+            "statement_rows": len(self.statements),
+            "valuation_rows": len(self.valuations),
+            "refresh_interval": self.refresh_interval,
+        }
+
+    def clear(self):
+        """Drop every table from memory and disk"""
+        with self._lock:
+            for table in ("statements", "valuations"):
+                path = self._path(table)
+                if os.path.exists(path):
+                    os.remove(path)
+            self._mtimes.clear()
+            self._update(pd.DataFrame(), pd.DataFrame())
+
+    # ---- tables ----
+
+    @staticmethod
+    def _merge(table: pd.DataFrame, frames: List[pd.DataFrame]) -> pd.DataFrame:
+        """Replace the rows of the fetched tickers"""
+        if not frames:
+            return table
+        fetched = pd.concat(frames, ignore_index=True)
+        if table.empty:
+            return fetched
+        kept = table[~table["ticker"].isin(fetched["ticker"])]
+        return pd.concat([kept, fetched], ignore_index=True)
+
+    def _update(self, statements: pd.DataFrame, valuations: pd.DataFrame):
+        ratios = compute_ratios(statements) if not statements.empty else pd.DataFrame()
+        self.statements = statements
+        self.valuations = valuations
+        self.ratios = ratios
+        self._statement_summaries = statement_summaries(ratios)
+        self._valuation_summaries = valuation_summaries(valuations)
+        self._fetched_at = {
+            "statements": self._fetched_by_ticker(statements),
+            "valuations": self._fetched_by_ticker(valuations),
+        }
+
+    @staticmethod
+    def _fetched_by_ticker(table: pd.DataFrame) -> Dict[str, float]:
+        if table.empty:
+            return {}
+        return table.groupby("ticker")["fetched_at"].min().to_dict()
+
+    def _is_fresh(self, table: str, ticker: str, ttl: int) -> bool:
+        fetched_at = self._fetched_at[table].get(ticker)
+        return fetched_at is not None and time.time() - fetched_at < ttl
+
+    def _path(self, table: str) -> str:
+        return os.path.join(self.store_dir, f"{table}.parquet")
+
+    def _read_table(self, table: str) -> pd.DataFrame:
+        path = self._path(table)
+        if not os.path.exists(path):
+            return pd.DataFrame()
+        try:
+            frame = pd.read_parquet(path)
+        except Exception as e:
+            logger.warning("Discarding unreadable fundamentals table %s: %s", path, e)
+            return pd.DataFrame()
+        self._mtimes[table] = os.path.getmtime(path)
+        return frame
+
+    def _write(self, table: str, frame: pd.DataFrame):
+        path = self._path(table)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            frame.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+            self._mtimes[table] = os.path.getmtime(path)
+        except Exception as e:
+            logger.warning("Could not persist fundamentals table %s: %s", path, e)
+
+    def _reload(self):
+        with self._lock:
+            self._update(self._read_table("statements"), self._read_table("valuations"))
+
+    def _reload_changed(self):
+        """Pick up tables written by other workers"""
+        changed = False
+        for table in ("statements", "valuations"):
+            path = self._path(table)
+            if os.path.exists(path) and os.path.getmtime(path) != self._mtimes.get(table):
+                changed = True
+        if changed:
+            self._update(self._read_table("statements"), self._read_table("valuations"))
+
+
+fundamentals_store = FundamentalsStore()
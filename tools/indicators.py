@@ -0,0 +1,228 @@
+import logging
+import math
+import operator
+import os
+from collections import OrderedDict, deque
+from threading import Lock
+from typing import Callable, Deque, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+INDICATOR_WINDOW = int(os.getenv("INDICATOR_WINDOW", "20"))
+INDICATOR_STATE_MAX_TICKERS = int(os.getenv("INDICATOR_STATE_MAX_TICKERS", "1000"))
+
+# Bars of context needed before a bar for candlestick patterns (TA-Lib averages over up to 10 bars
+# and the longest patterns span 5 bars)
+CDL_LOOKBACK = 30
+
+
+def load_pandas_ta():
+    """Import pandas_ta, which registers the DataFrame `.ta` accessor, on first use"""
+    import pandas_ta  # noqa: F401
+
+
+class RollingMean():
+    """Simple moving average over a fixed window using a running sum"""
+
+    def __init__(self, length: int):
+        self.length = length
+        self.values: Deque[float] = deque()
+        self.total = 0.0
+
+    def push(self, value: float):
+        self.values.append(value)
+        self.total += value
+        if len(self.values) > self.length:
+            self.total -= self.values.popleft()
+
+    def value(self) -> float:
+        return self.total / self.length if len(self.values) == self.length else math.nan
+
+    def peek(self, value: float) -> float:
+        """Return the mean as if `value` was pushed, without changing the state"""
+        count, total = len(self.values) + 1, self.total + value
+        if count > self.length:
+            total -= self.values[0]
+            count = self.length
+        return total / self.length if count == self.length else math.nan
+
+
+class RollingExtreme():
+    """Rolling max or min over a fixed window using a monotonic deque"""
+
+    def __init__(self, length: int, compare: Callable[[float, float], bool]):
+        self.length = length
+        self.compare = compare
+        self.window: Deque[Tuple[int, float]] = deque()
+        self.position = 0
+
+    def push(self, value: float):
+        while self.window and self.compare(value, self.window[-1][1]):
+            self.window.pop()
+        self.window.append((self.position, value))
+        self.position += 1
+        while self.window[0][0] <= self.position - 1 - self.length:
+            self.window.popleft()
+
+    def value(self) -> float:
+        return self.window[0][1] if self.position >= self.length else math.nan
+
+    def peek(self, value: float) -> float:
+        """Return the extreme as if `value` was pushed, without changing the state"""
+        if self.position + 1 < self.length:
+            return math.nan
+        for position, candidate in self.window:
+            if position > self.position - self.length:
+                return candidate if self.compare(candidate, value) else value
+        return value
+
+
+class TickerIndicatorState():
+    """Rolling indicator state of one ticker, committed up to (excluding) the latest bar"""
+
+    def __init__(self, window: int):
+        self.sma_50 = RollingMean(50)
+        self.sma_200 = RollingMean(200)
+        self.sr_high = RollingExtreme(20, operator.ge)
+        self.sr_low = RollingExtreme(20, operator.le)
+        self.last_timestamp: Optional[pd.Timestamp] = None
+        self.last_close = math.nan
+        self.rows: Deque[Tuple[pd.Timestamp, dict]] = deque(maxlen=window)
+        self.patterns: "OrderedDict[pd.Timestamp, pd.Series]" = OrderedDict()
+        self.lock = Lock()
+
+    def push(self, timestamp: pd.Timestamp, high: float, low: float, close: float):
+        self.sma_50.push(close)
+        self.sma_200.push(close)
+        self.sr_high.push(high)
+        self.sr_low.push(low)
+        self.last_timestamp = timestamp
+        self.last_close = close
+        self.rows.append((timestamp, {
+            "SMA_50": self.sma_50.value(),
+            "SMA_200": self.sma_200.value(),
+            "SR_high": self.sr_high.value(),
+            "SR_low": self.sr_low.value(),
+        }))
+
+    def peek(self, high: float, low: float, close: float) -> dict:
+        return {
+            "SMA_50": self.sma_50.peek(close),
+            "SMA_200": self.sma_200.peek(close),
+            "SR_high": self.sr_high.peek(high),
+            "SR_low": self.sr_low.peek(low),
+        }
+
+
+class IndicatorEngine():
+    """
+    Incremental indicator engine for get_chart_patterns.
+
+    Keeps rolling state per ticker so each new bar costs O(1) for SMA_50, SMA_200 and the
+    20 day support/resistance. The latest bar may still be forming, so it is evaluated
+    against the state without being committed. Candlestick patterns are only computed for
+    the returned window plus the lookback they need.
+    """
+
+    def __init__(self, window: int = INDICATOR_WINDOW, max_tickers: int = INDICATOR_STATE_MAX_TICKERS):
+        self.window = window
+        self.max_tickers = max_tickers
+        self._states: "OrderedDict[str, TickerIndicatorState]" = OrderedDict()
+        self._lock = Lock()
+
+    def compute(self, ticker: str, df: pd.DataFrame) -> pd.DataFrame:
+        """Return the last `window` bars with candlestick patterns, SMAs, support/resistance and trend"""
+        if df.empty:
+            return df
+
+        state = self._state_for(ticker, df)
+        with state.lock:
+            self._advance(state, df)
+
+            last_timestamp = df.index[-1]
+            last_bar = df.iloc[-1]
+            rows = [row for timestamp, row in state.rows if timestamp != last_timestamp]
+            timestamps = [timestamp for timestamp, _ in state.rows if timestamp != last_timestamp]
+            rows.append(state.peek(last_bar["High"], last_bar["Low"], last_bar["Close"]))
+            timestamps.append(last_timestamp)
+
+            indicators = pd.DataFrame(rows[-self.window:], index=pd.Index(timestamps[-self.window:], name=df.index.name))
+            patterns = self._patterns(state, df)
+
+        result = df.iloc[-self.window:].copy()
+        result = result.join(patterns).join(indicators)
+        result["trend"] = np.where(result["SMA_50"] > result["SMA_200"], "up", "down")
+        return result
+
+    def reset(self, ticker: Optional[str] = None):
+        with self._lock:
+            if ticker is None:
+                self._states.clear()
+            else:
+                self._states.pop(ticker, None)
+
+    def _state_for(self, ticker: str, df: pd.DataFrame) -> TickerIndicatorState:
+        with self._lock:
+            state = self._states.get(ticker)
+            if state is not None and state.last_timestamp is not None and self._rewritten(state, df):
+                # History was rewritten (e.g. re-adjusted prices), start over
+                logger.info("Rebuilding indicator state for %s", ticker)
+                state = None
+
+            if state is None:
+                state = TickerIndicatorState(self.window)
+                self._states[ticker] = state
+            self._states.move_to_end(ticker)
+
+            while len(self._states) > self.max_tickers:
+                self._states.popitem(last=False)
+            return state
+
+    @staticmethod
+    def _rewritten(state: TickerIndicatorState, df: pd.DataFrame) -> bool:
+        """Whether the last committed bar is gone from `df`, is not before its latest bar or its Close changed"""
+        # The latest bar is evaluated on top of the committed state, it must not be in it already
+        if state.last_timestamp not in df.index or df.index[-1] <= state.last_timestamp:
+            return True
+        return not np.isclose(df.at[state.last_timestamp, "Close"], state.last_close, rtol=1e-6, equal_nan=True)
+
+    @staticmethod
+    def _advance(state: TickerIndicatorState, df: pd.DataFrame):
+        """Commit every bar after the last committed one, except the latest bar"""
+        committed = df.iloc[:-1]
+        if state.last_timestamp is not None:
+            committed = committed[committed.index > state.last_timestamp]
+
+        for timestamp, high, low, close in zip(
+            committed.index, committed["High"].to_numpy(), committed["Low"].to_numpy(), committed["Close"].to_numpy()
+        ):
+            state.push(timestamp, high, low, close)
+
+    def _patterns(self, state: TickerIndicatorState, df: pd.DataFrame) -> pd.DataFrame:
+        needed = df.index[-self.window:]
+        missing = [timestamp for timestamp in needed if timestamp not in state.patterns]
+
+        computed = None
+        if missing:
+            start = max(0, df.index.get_loc(missing[0]) - CDL_LOOKBACK)
+            load_pandas_ta()
+            computed = df.iloc[start:].ta.cdl_pattern(name="all")
+
+            for timestamp in missing:
+                # The latest bar may still change, so its patterns are never cached
+                if timestamp != df.index[-1]:
+                    state.patterns[timestamp] = computed.loc[timestamp]
+            while len(state.patterns) > self.window:
+                state.patterns.popitem(last=False)
+
+        rows = [
+            state.patterns[timestamp] if timestamp in state.patterns else computed.loc[timestamp]
+            for timestamp in needed
+        ]
+        return pd.DataFrame(rows, index=needed)
+
+
+indicator_engine = IndicatorEngine()
@@ -0,0 +1,358 @@
+import json
+import logging
+import os
+import re
+import time
+from contextlib import contextmanager
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from langchain_core.rate_limiters import InMemoryRateLimiter
+
+from utils.metrics import record
+from utils.resilience import circuit_breaker
+
+logger = logging.getLogger(__name__)
+
+# yfinance is imported on first use (or by the startup imports stage), see load_yfinance
+yf = None
+
+MARKET_DATA_CACHE_DIR = os.getenv("MARKET_DATA_CACHE_DIR", ".cache/market_data")
+MARKET_DATA_HISTORY_TTL = int(os.getenv("MARKET_DATA_HISTORY_TTL", "900"))
+MARKET_DATA_STATEMENT_TTL = int(os.getenv("MARKET_DATA_STATEMENT_TTL", "86400"))
+MARKET_DATA_INFO_TTL = int(os.getenv("MARKET_DATA_INFO_TTL", "3600"))
+# Yahoo requests per second of this process (on top of YFINANCE_EXECUTOR_WORKERS concurrent calls), 0 disables
+YFINANCE_REQUESTS_PER_SECOND = float(os.getenv("YFINANCE_REQUESTS_PER_SECOND", "0"))
+YFINANCE_MAX_BURST = float(os.getenv("YFINANCE_MAX_BURST", "8"))
+
+STATEMENTS = ("income_stmt", "balance_sheet", "cashflow")
+PRICE_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+CacheKey = Tuple[str, str, str, str]
+
+
+def load_yfinance():
+    """Import yfinance once; it pulls in requests, curl_cffi and friends"""
+    global yf
+    if yf is None:
+        import yfinance
+        yf = yfinance
+    return yf
+
+
+yfinance_rate_limiter = InMemoryRateLimiter(
+    requests_per_second=YFINANCE_REQUESTS_PER_SECOND,
+    check_every_n_seconds=min(0.1, 1 / YFINANCE_REQUESTS_PER_SECOND),
+    max_bucket_size=YFINANCE_MAX_BURST,
+) if YFINANCE_REQUESTS_PER_SECOND > 0 else None
+
+
+@contextmanager
+def yfinance_request():
+    """
+    yfinance, once the outbound rate limit allows another request. Failures of the calls made
+    in the block trip the yfinance circuit breaker.
+    """
+    with circuit_breaker("yfinance").guard():
+        if yfinance_rate_limiter is not None:
+            start = time.perf_counter()
+            yfinance_rate_limiter.acquire()
+            record("outbound_wait", "yfinance", time.perf_counter() - start)
+        yield load_yfinance()
+
+
+def period_start(period: str, end: pd.Timestamp) -> Optional[pd.Timestamp]:
+    """Return the first timestamp covered by a yfinance period string ending at `end`"""
+    if period == "max":
+        return None
+    if period == "ytd":
+        return pd.Timestamp(year=end.year, month=1, day=1, tz=end.tz)
+
+    match = re.fullmatch(r"(\d+)(d|wk|mo|y)", period)
+    if not match:
+        raise ValueError(f"Unsupported period: {period}")
+
+    amount, unit = int(match.group(1)), match.group(2)
+    offsets = {
+        "d": pd.DateOffset(days=amount),
+        "wk": pd.DateOffset(weeks=amount),
+        "mo": pd.DateOffset(months=amount),
+        "y": pd.DateOffset(years=amount),
+    }
+    return end - offsets[unit]
+
+
+class MarketDataCache():
+    """
+    Shared cache for yfinance data used by all tools.
+
+    Entries are keyed by (ticker, dataset, period, interval), kept in memory and persisted
+    on disk as parquet. Freshness is TTL-based. Refreshing a stale price history only
+    downloads the bars since the last cached date and appends them.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = MARKET_DATA_CACHE_DIR,
+        history_ttl: int = MARKET_DATA_HISTORY_TTL,
+        statement_ttl: int = MARKET_DATA_STATEMENT_TTL,
+        info_ttl: int = MARKET_DATA_INFO_TTL,
+    ):
+        self.cache_dir = cache_dir
+        self.history_ttl = history_ttl
+        self.statement_ttl = statement_ttl
+        self.info_ttl = info_ttl
+        self._memory: Dict[CacheKey, Tuple[float, Any]] = {}
+        self._locks: Dict[CacheKey, Lock] = {}
+        self._locks_lock = Lock()
+        self._download_lock = Lock()
+        self._stats_lock = Lock()
+        self._hits: Dict[str, int] = {}
+        self._misses: Dict[str, int] = {}
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    # ---- public api ----
+
+    def get_history(self, ticker: str, period: str = "1y", interval: str = "1d") -> pd.DataFrame:
+        """Return OHLCV bars for a ticker, fetching only the missing bars when stale"""
+        key = (ticker.upper(), "history", period, interval)
+        with self._lock_for(key):
+            fetched_at, df = self._load(key)
+            fresh = df is not None and self._is_fresh(fetched_at, self.history_ttl)
+            self._count("history", fresh)
+            if fresh:
+                return df.copy()
+
+            df = self._refresh_history(ticker, period, interval, df)
+            self._store(key, df)
+            return df.copy()
+
+    def store_history(self, ticker: str, df: pd.DataFrame, period: str = "1y", interval: str = "1d"):
+        """Store bars fetched elsewhere (e.g. a bulk download) as a fresh cache entry"""
+        key = (ticker.upper(), "history", period, interval)
+        with self._lock_for(key):
+            self._store(key, self._normalize_history(df))
+
+    def prefetch_histories(self, tickers: List[str], period: str = "1y", interval: str = "1d") -> List[str]:
+        """
+        Fetch price history of every stale ticker with a single bulk download.
+
+        Returns:
+            The tickers that were downloaded.
+        """
+        stale = []
+        for ticker in dict.fromkeys(ticker.upper() for ticker in tickers):
+            fetched_at, df = self._load((ticker, "history", period, interval))
+            if df is None or not self._is_fresh(fetched_at, self.history_ttl):
+                stale.append(ticker)
+
+        if not stale:
+            return []
+
+        logger.info("Bulk downloading %s of %s bars for %s tickers", period, interval, len(stale))
+        # yf.download keeps its results in module level state, so bulk downloads are serialized
+        with self._download_lock:
+            with yfinance_request() as client:
+                df = client.download(
+                    stale,
+                    period=period,
+                    interval=interval,
+                    group_by="ticker",
+                    progress=False,
+                )
+
+        downloaded = []
+        for ticker in stale:
+            if ticker not in df.columns.get_level_values(0):
+                logger.warning("No bars returned for %s in bulk download", ticker)
+                continue
+            self.store_history(ticker, df[ticker].dropna(how="all"), period, interval)
+            downloaded.append(ticker)
+        return downloaded
+
+    def get_statement(self, ticker: str, statement: str) -> pd.DataFrame:
+        """Return an annual financial statement (income_stmt, balance_sheet or cashflow)"""
+        if statement not in STATEMENTS:
+            raise ValueError(f"Unsupported statement: {statement}")
+
+        key = (ticker.upper(), statement, "annual", "-")
+        with self._lock_for(key):
+            fetched_at, df = self._load(key)
+            fresh = df is not None and self._is_fresh(fetched_at, self.statement_ttl)
+            self._count("statement", fresh)
+            if fresh:
+                return df.copy()
+
+            logger.info("Downloading %s for %s", statement, ticker)
+            with yfinance_request() as client:
+                df = getattr(client.Ticker(ticker), statement)
+            self._store(key, df)
+            return df.copy()
+
+    def get_info(self, ticker: str) -> dict:
+        """Return the yfinance info dictionary for a ticker"""
+        key = (ticker.upper(), "info", "-", "-")
+        with self._lock_for(key):
+            fetched_at, info = self._load(key)
+            fresh = info is not None and self._is_fresh(fetched_at, self.info_ttl)
+            self._count("info", fresh)
+            if fresh:
+                return dict(info)
+
+            logger.info("Downloading info for %s", ticker)
+            with yfinance_request() as client:
+                info = client.Ticker(ticker).info
+            self._store(key, info)
+            return dict(info)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Hits and misses per dataset, a miss is a download or an incremental refresh"""
+        with self._stats_lock:
+            stats = {}
+            for dataset in sorted(set(self._hits) | set(self._misses)):
+                hits, misses = self._hits.get(dataset, 0), self._misses.get(dataset, 0)
+                stats[dataset] = {
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+                }
+            return stats
+
+    def invalidate(self, ticker: str):
+        """Drop every cached dataset of a ticker from memory and disk"""
+        ticker = ticker.upper()
+        for key in [key for key in self._memory if key[0] == ticker]:
+            self._memory.pop(key, None)
+        for name in os.listdir(self.cache_dir):
+            if name.startswith(f"{ticker}__"):
+                os.remove(os.path.join(self.cache_dir, name))
+
+    # ---- history ----
+
+    def _refresh_history(
+        self, ticker: str, period: str, interval: str, cached: Optional[pd.DataFrame]
+    ) -> pd.DataFrame:
+        with yfinance_request() as client:
+            stock = client.Ticker(ticker)
+
+            if cached is None or cached.empty:
+                logger.info("Downloading %s of %s bars for %s", period, interval, ticker)
+                df = self._normalize_history(stock.history(period=period, interval=interval))
+            else:
+                # The last cached bar may have been partial, so it is fetched again, together with
+                # the final bar before it to check that the cached prices are still on the same scale
+                last_date = cached.index[-1]
+                check_date = cached.index[-2] if len(cached) > 1 else last_date
+                logger.info("Downloading %s bars for %s since %s", interval, ticker, last_date.date())
+                fetched = stock.history(start=check_date.strftime("%Y-%m-%d"), interval=interval, actions=True)
+                new_bars = self._normalize_history(fetched)
+
+                if self._readjusted(cached, new_bars, fetched, check_date):
+                    # Prices are auto-adjusted: after a split or dividend every earlier bar changes
+                    logger.info("Prices of %s were adjusted since %s, downloading %s again", ticker, check_date.date(), period)
+                    df = self._normalize_history(stock.history(period=period, interval=interval))
+                else:
+                    df = pd.concat([cached, new_bars])
+                    df = df[~df.index.duplicated(keep="last")].sort_index()
+
+        if df.empty:
+            return df
+
+        start = period_start(period, df.index[-1])
+        if start is not None:
+            df = df[df.index > start]
+        return df
+
+    @staticmethod
+    def _readjusted(cached: pd.DataFrame, new_bars: pd.DataFrame, fetched: pd.DataFrame, check_date: pd.Timestamp) -> bool:
+        """Whether a split or dividend after the cached bars rescaled the cached prices"""
+        actions = fetched[[column for column in ("Dividends", "Stock Splits") if column in fetched.columns]]
+        if isinstance(actions.index, pd.DatetimeIndex) and actions.index.tz is not None:
+            actions = actions.tz_localize(None)
+        # Bars cached on an ex-date were already fetched on the adjusted scale
+        if (actions[actions.index > cached.index[-1]].fillna(0) != 0).any().any():
+            return True
+        if check_date not in new_bars.index or check_date == cached.index[-1]:
+            return False
+        cached_close, new_close = cached.at[check_date, "Close"], new_bars.at[check_date, "Close"]
+        return not np.isclose(cached_close, new_close, rtol=1e-6, equal_nan=True)
+
+    @staticmethod
+    def _normalize_history(df: pd.DataFrame) -> pd.DataFrame:
+        df = df[[column for column in PRICE_COLUMNS if column in df.columns]].copy()
+        if isinstance(df.index, pd.DatetimeIndex) and df.index.tz is not None:
+            df.index = df.index.tz_localize(None)
+        df.index.name = "Date"
+        return df
+
+    # ---- storage ----
+
+    def _lock_for(self, key: CacheKey) -> Lock:
+        with self._locks_lock:
+            if key not in self._locks:
+                self._locks[key] = Lock()
+            return self._locks[key]
+
+    def _count(self, dataset: str, hit: bool):
+        with self._stats_lock:
+            counts = self._hits if hit else self._misses
+            counts[dataset] = counts.get(dataset, 0) + 1
+
+    @staticmethod
+    def _is_fresh(fetched_at: Optional[float], ttl: int) -> bool:
+        return fetched_at is not None and time.time() - fetched_at < ttl
+
+    def _path(self, key: CacheKey) -> str:
+        ticker, dataset, period, interval = key
+        extension = "json" if dataset == "info" else "parquet"
+        name = f"{ticker}__{dataset}__{period}__{interval}.{extension}"
+        return os.path.join(self.cache_dir, re.sub(r"[^A-Za-z0-9_.^=-]", "_", name))
+
+    def _load(self, key: CacheKey) -> Tuple[Optional[float], Any]:
+        if key in self._memory:
+            return self._memory[key]
+
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None, None
+
+        try:
+            if key[1] == "info":
+                with open(path) as file:
+                    value = json.load(file)
+            elif key[1] in STATEMENTS:
+                # Statements are stored transposed: one row per period, one column per line item
+                value = pd.read_parquet(path).T
+            else:
+                value = pd.read_parquet(path)
+        except Exception as e:
+            logger.warning("Discarding unreadable market data cache file %s: %s", path, e)
+            return None, None
+
+        entry = (os.path.getmtime(path), value)
+        self._memory[key] = entry
+        return entry
+
+    def _store(self, key: CacheKey, value: Any):
+        self._memory[key] = (time.time(), value)
+
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            if key[1] == "info":
+                with open(tmp_path, "w") as file:
+                    json.dump(value, file, default=str)
+            elif key[1] in STATEMENTS:
+                frame = value.T
+                frame.columns = [str(column) for column in frame.columns]
+                frame.to_parquet(tmp_path)
+            else:
+                value.to_parquet(tmp_path)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning("Could not persist market data cache file %s: %s", path, e)
+
+
+market_data = MarketDataCache()
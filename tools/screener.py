@@ -0,0 +1,427 @@
+import ast
+import functools
+import json
+import logging
+import operator
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from tools.market_data import PRICE_COLUMNS, market_data
+
+logger = logging.getLogger(__name__)
+
+# Tickers scanned when a request does not name any: SCREENER_UNIVERSE (comma separated), otherwise
+# the symbols in SCREENER_UNIVERSE_PATH, a ticker index JSON file or a text file with one per line
+SCREENER_UNIVERSE = [ticker.strip().upper() for ticker in os.getenv("SCREENER_UNIVERSE", "").split(",") if ticker.strip()]
+SCREENER_UNIVERSE_PATH = os.getenv(
+    "SCREENER_UNIVERSE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "tickers.json")
+)
+# Daily history loaded per ticker; SMA_200 needs at least 200 bars
+SCREENER_PERIOD = os.getenv("SCREENER_PERIOD", "1y")
+# Seconds a loaded price matrix is reused before the histories are read again
+SCREENER_MATRIX_TTL = int(os.getenv("SCREENER_MATRIX_TTL", os.getenv("MARKET_DATA_HISTORY_TTL", "900")))
+SCREENER_MAX_MATRICES = int(os.getenv("SCREENER_MAX_MATRICES", "8"))
+SCREENER_MAX_RESULTS = int(os.getenv("SCREENER_MAX_RESULTS", "200"))
+# Tickers of a custom list scanned per admission token; universe scans share one cached matrix
+SCREENER_TICKERS_PER_TOKEN = float(os.getenv("SCREENER_TICKERS_PER_TOKEN", "200"))
+
+SR_WINDOW = 20
+# Bars averaged for the doji body threshold, as pandas_ta's cdl_doji
+DOJI_LENGTH = 10
+
+COMPARISONS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+ARITHMETIC = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+}
+FIELDS = (
+    "Open", "High", "Low", "Close", "Volume", "change_pct",
+    "SMA_50", "SMA_200", "SR_high", "SR_low", "trend", "golden_cross", "death_cross",
+    "CDL_DOJI", "CDL_INSIDE", "CDL_ENGULFING", "CDL_HAMMER",
+)
+PATTERN_FIELDS = [field for field in FIELDS if field.startswith("CDL")]
+# Fields holding strings, which can only be compared
+STRING_FIELDS = {"trend"}
+
+
+class ScreenerFilterError(ValueError):
+    """A filter expression that is not valid"""
+
+
+def load_universe(path: str = SCREENER_UNIVERSE_PATH) -> List[str]:
+    """Symbols of a ticker index JSON file or of a text file with one ticker per line"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            if path.endswith(".json"):
+                return [entry["symbol"].upper() for entry in json.load(f)]
+            return [line.strip().upper() for line in f if line.strip() and not line.startswith("#")]
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning("Screener universe not loaded from %s: %s", path, e)
+        return []
+
+
+# ---- filter expressions ----
+
+@functools.lru_cache(maxsize=256)
+def compile_filter(expression: str) -> ast.Expression:
+    """
+    Parse a filter such as `SMA_50 > SMA_200 and High >= SR_high`.
+
+    Allowed are the screener fields, numbers and strings, comparisons (chained too), `+ - * /`,
+    `and`, `or` and `not`. Arithmetic needs a numeric field on one side, so strings and
+    constant expressions such as `'a' * 4000000000` or `1 / 0` are rejected. Raises
+    ScreenerFilterError for anything else.
+    """
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+    except SyntaxError as e:
+        raise ScreenerFilterError(f"Invalid filter: {e.msg}") from e
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            if node.id not in FIELDS:
+                raise ScreenerFilterError(f"Unknown field {node.id}, expected one of {', '.join(FIELDS)}")
+        elif isinstance(node, ast.Constant):
+            if not isinstance(node.value, (int, float, str)):
+                raise ScreenerFilterError(f"Unsupported value {node.value!r}")
+        elif isinstance(node, ast.UnaryOp):
+            if not isinstance(node.op, (ast.Not, ast.USub)):
+                raise ScreenerFilterError("Unsupported operator")
+            if isinstance(node.op, ast.USub) and _is_string(node.operand):
+                raise ScreenerFilterError("Arithmetic on strings is not supported")
+        elif isinstance(node, ast.Compare):
+            if not all(type(op) in COMPARISONS for op in node.ops):
+                raise ScreenerFilterError("Unsupported comparison")
+        elif isinstance(node, ast.BinOp):
+            if type(node.op) not in ARITHMETIC:
+                raise ScreenerFilterError("Unsupported operator")
+            if _is_string(node.left) or _is_string(node.right):
+                raise ScreenerFilterError("Arithmetic on strings is not supported")
+            if _is_constant(node.left) and _is_constant(node.right):
+                raise ScreenerFilterError("Arithmetic needs a field, write constant expressions as their result")
+        elif not isinstance(node, (ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.Load, *COMPARISONS, *ARITHMETIC, ast.Not, ast.USub)):
+            raise ScreenerFilterError(f"Unsupported syntax: {type(node).__name__}")
+    return tree
+
+
+def _is_string(node: ast.AST) -> bool:
+    if isinstance(node, ast.Constant):
+        return isinstance(node.value, str)
+    return isinstance(node, ast.Name) and node.id in STRING_FIELDS
+
+
+def _is_constant(node: ast.AST) -> bool:
+    """A number, also negated; fields and nested expressions are not"""
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        return _is_constant(node.operand)
+    return isinstance(node, ast.Constant)
+
+
+def _truth(value: np.ndarray) -> np.ndarray:
+    value = np.asarray(value)
+    if value.dtype == bool:
+        return value
+    if value.dtype.kind not in "iuf":
+        raise ScreenerFilterError("Only numbers and conditions can be combined with and, or, not")
+    return np.nan_to_num(value.astype(float)) != 0
+
+
+def _evaluate(node: ast.AST, fields: Dict[str, np.ndarray]) -> Any:
+    """Evaluate a compiled filter over whole columns; comparisons with NaN are False"""
+    if isinstance(node, ast.Expression):
+        return _evaluate(node.body, fields)
+    if isinstance(node, ast.Name):
+        return fields[node.id]
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.BoolOp):
+        combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+        return functools.reduce(combine, (_truth(_evaluate(value, fields)) for value in node.values))
+    if isinstance(node, ast.UnaryOp):
+        value = _evaluate(node.operand, fields)
+        return np.logical_not(_truth(value)) if isinstance(node.op, ast.Not) else -value
+    if isinstance(node, ast.BinOp):
+        return ARITHMETIC[type(node.op)](_evaluate(node.left, fields), _evaluate(node.right, fields))
+    if isinstance(node, ast.Compare):
+        left = _evaluate(node.left, fields)
+        result = True
+        for op, comparator in zip(node.ops, node.comparators):
+            right = _evaluate(comparator, fields)
+            result = np.logical_and(result, COMPARISONS[type(op)](left, right))
+            left = right
+        return result
+    raise ScreenerFilterError(f"Unsupported syntax: {type(node).__name__}")
+
+
+# ---- price matrix ----
+
+def _tail_mean(values: np.ndarray, length: int, offset: int = 0) -> np.ndarray:
+    """Mean of the `length` bars ending `offset` bars before the latest, NaN without enough bars"""
+    end = values.shape[1] - offset
+    if end < length:
+        return np.full(values.shape[0], np.nan)
+    return values[:, end - length:end].mean(axis=1)
+
+
+class PriceMatrix():
+    """
+    Daily OHLCV bars of a universe as one (tickers x bars) array per column.
+
+    Rows are aligned on each ticker's own latest bar, so the last column is every ticker's
+    latest bar and shorter histories are padded with NaN on the left. Indicators of the
+    latest bar are computed for all tickers at once and kept in `fields`, so a scan only
+    evaluates its filter.
+    """
+
+    def __init__(self, tickers: List[str], prices: np.ndarray, as_of: List[Optional[str]]):
+        self.tickers = tickers
+        self.prices = prices
+        self.as_of = np.array(as_of, dtype=object)
+        self.loaded_at = time.time()
+        self.fields = self._indicators()
+
+    @classmethod
+    def from_histories(cls, histories: Dict[str, pd.DataFrame]) -> "PriceMatrix":
+        tickers = list(histories)
+        bars = max((len(df) for df in histories.values()), default=0)
+        prices = np.full((len(PRICE_COLUMNS), len(tickers), bars), np.nan)
+        as_of: List[Optional[str]] = []
+        for row, ticker in enumerate(tickers):
+            df = histories[ticker]
+            if not df.empty:
+                prices[:, row, bars - len(df):] = df[PRICE_COLUMNS].to_numpy(dtype=float).T
+            as_of.append(df.index[-1].strftime("%Y-%m-%d") if not df.empty else None)
+        return cls(tickers, prices, as_of)
+
+    def __len__(self) -> int:
+        return len(self.tickers)
+
+    def column(self, name: str) -> np.ndarray:
+        return self.prices[PRICE_COLUMNS.index(name)]
+
+    def _indicators(self) -> Dict[str, np.ndarray]:
+        """The get_chart_patterns indicators of every ticker's latest bar"""
+        open_, high, low, close, volume = (self.column(name) for name in PRICE_COLUMNS)
+        bars = self.prices.shape[2]
+        latest = {name: self.column(name)[:, -1] if bars else np.full(len(self), np.nan) for name in PRICE_COLUMNS}
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            sma_50, sma_200 = _tail_mean(close, 50), _tail_mean(close, 200)
+            previous_50, previous_200 = _tail_mean(close, 50, offset=1), _tail_mean(close, 200, offset=1)
+            # np.max/np.min propagate NaN, so tickers with fewer than SR_WINDOW bars get NaN
+            if bars >= SR_WINDOW:
+                sr_high, sr_low = high[:, -SR_WINDOW:].max(axis=1), low[:, -SR_WINDOW:].min(axis=1)
+            else:
+                sr_high = sr_low = np.full(len(self), np.nan)
+            previous_close = close[:, -2] if bars >= 2 else np.full(len(self), np.nan)
+
+            fields = {
+                **latest,
+                "change_pct": (latest["Close"] / previous_close - 1) * 100,
+                "SMA_50": sma_50,
+                "SMA_200": sma_200,
+                "SR_high": sr_high,
+                "SR_low": sr_low,
+                "trend": np.where(sma_50 > sma_200, "up", "down"),
+                "golden_cross": (sma_50 > sma_200) & (previous_50 <= previous_200),
+                "death_cross": (sma_50 < sma_200) & (previous_50 >= previous_200),
+                **self._patterns(open_, high, low, close),
+            }
+        return fields
+
+    @staticmethod
+    def _patterns(open_: np.ndarray, high: np.ndarray, low: np.ndarray, close: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Candlestick patterns of the latest bar, 100 bullish, -100 bearish and 0 none like
+        pandas_ta. Doji and inside bar follow pandas_ta; engulfing and hammer use the textbook
+        rules, without TA-Lib's averaged body and shadow thresholds.
+        """
+        count = open_.shape[0]
+        if open_.shape[1] <= DOJI_LENGTH:
+            return {name: np.zeros(count) for name in PATTERN_FIELDS}
+
+        o, h, l, c = open_[:, -1], high[:, -1], low[:, -1], close[:, -1]
+        prev_o, prev_h, prev_l, prev_c = open_[:, -2], high[:, -2], low[:, -2], close[:, -2]
+        body = np.abs(c - o)
+        bar_range = h - l
+        color = np.where(c >= o, 100, -100)
+
+        doji = body < 0.1 * (high[:, -DOJI_LENGTH:] - low[:, -DOJI_LENGTH:]).mean(axis=1)
+        inside = (h < prev_h) & (l > prev_l)
+        bullish_engulfing = (prev_c < prev_o) & (c > o) & (o <= prev_c) & (c >= prev_o) & (body > np.abs(prev_c - prev_o))
+        bearish_engulfing = (prev_c > prev_o) & (c < o) & (o >= prev_c) & (c <= prev_o) & (body > np.abs(prev_c - prev_o))
+        hammer = (
+            (bar_range > 0)
+            & (body <= 0.3 * bar_range)
+            & (np.minimum(o, c) - l >= 2 * body)
+            & (h - np.maximum(o, c) <= 0.1 * bar_range)
+        )
+        return {
+            "CDL_DOJI": np.where(doji, 100, 0),
+            "CDL_INSIDE": np.where(inside, color, 0),
+            "CDL_ENGULFING": np.select([bullish_engulfing, bearish_engulfing], [100, -100], 0),
+            "CDL_HAMMER": np.where(hammer, 100, 0),
+        }
+
+
+# ---- screener ----
+
+def _value(value: Any) -> Any:
+    if isinstance(value, (np.bool_, bool)):
+        return bool(value)
+    if isinstance(value, (np.floating, float)):
+        return None if np.isnan(value) else round(float(value), 2)
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+
+class Screener():
+    """
+    Universe wide technical screener, without an LLM.
+
+    Price histories come from the market data cache (one bulk download for the stale ones)
+    and are loaded into a PriceMatrix, reused for `matrix_ttl` seconds per ticker list.
+    Filters are evaluated as vectorised expressions over all tickers at once.
+    """
+
+    def __init__(
+        self,
+        universe: Iterable[str] = SCREENER_UNIVERSE,
+        period: str = SCREENER_PERIOD,
+        matrix_ttl: int = SCREENER_MATRIX_TTL,
+        max_matrices: int = SCREENER_MAX_MATRICES,
+    ):
+        self.universe = list(universe) or load_universe()
+        self.period = period
+        self.matrix_ttl = matrix_ttl
+        self.max_matrices = max_matrices
+        self._matrices: "OrderedDict[Tuple[str, ...], PriceMatrix]" = OrderedDict()
+        self._lock = Lock()
+        self._load_lock = Lock()
+
+    def load(self, tickers: Optional[Iterable[str]] = None) -> PriceMatrix:
+        """Price matrix of the tickers (the universe by default), loaded when missing or expired"""
+        key = tuple(dict.fromkeys(ticker.upper() for ticker in (tickers or self.universe)))
+        matrix = self._cached(key)
+        if matrix is not None:
+            return matrix
+
+        # Concurrent scans of a cold universe wait for one load instead of each reading it
+        with self._load_lock:
+            matrix = self._cached(key)
+            if matrix is not None:
+                return matrix
+
+            start = time.perf_counter()
+            try:
+                market_data.prefetch_histories(list(key), period=self.period)
+            except Exception as e:
+                logger.warning("Bulk download for the screener failed, loading histories one by one: %s", e)
+
+            histories = {}
+            for ticker in key:
+                try:
+                    histories[ticker] = market_data.get_history(ticker, period=self.period)
+                except Exception as e:
+                    logger.warning("Screener skipped %s: %s", ticker, e)
+            matrix = PriceMatrix.from_histories(histories)
+            logger.info(
+                "Loaded screener matrix of %s tickers x %s bars in %.2fs",
+                len(matrix), matrix.prices.shape[2], time.perf_counter() - start
+            )
+
+        with self._lock:
+            self._matrices[key] = matrix
+            while len(self._matrices) > self.max_matrices:
+                self._matrices.popitem(last=False)
+        return matrix
+
+    def scan(
+        self,
+        matrix: PriceMatrix,
+        expression: str,
+        sort_by: Optional[str] = None,
+        ascending: bool = False,
+        limit: int = SCREENER_MAX_RESULTS,
+    ) -> Dict[str, Any]:
+        """Tickers of the matrix whose latest bar matches the filter expression"""
+        start = time.perf_counter()
+        tree = compile_filter(expression)
+        if sort_by is not None and sort_by not in FIELDS:
+            raise ScreenerFilterError(f"Unknown sort field {sort_by}")
+
+        if sort_by is not None and matrix.fields[sort_by].dtype.kind not in "biuf":
+            raise ScreenerFilterError(f"Cannot sort by {sort_by}")
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            try:
+                matched = np.broadcast_to(_truth(_evaluate(tree, matrix.fields)), (len(matrix),))
+            except (TypeError, ArithmeticError, ValueError) as e:
+                raise ScreenerFilterError(f"Invalid filter: {e}") from e
+        rows = np.flatnonzero(matched)
+        if sort_by is not None:
+            keys = matrix.fields[sort_by][rows].astype(float)
+            # argsort puts NaN last in both directions
+            rows = rows[np.argsort(keys if ascending else -keys, kind="stable")]
+
+        results = []
+        for row in rows[:limit]:
+            result = {"ticker": matrix.tickers[row], "date": matrix.as_of[row]}
+            for field in FIELDS:
+                if field not in PATTERN_FIELDS:
+                    result[field] = _value(matrix.fields[field][row])
+            result["patterns"] = {
+                field.removeprefix("CDL_"): int(matrix.fields[field][row])
+                for field in PATTERN_FIELDS if matrix.fields[field][row]
+            }
+            results.append(result)
+
+        return {
+            "filter": expression,
+            "scanned": len(matrix),
+            "matched": len(rows),
+            "results": results,
+            "tickers": [result["ticker"] for result in results],
+            "data_age_seconds": round(time.time() - matrix.loaded_at, 1),
+            "scan_ms": round((time.perf_counter() - start) * 1000, 2),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "universe": len(self.universe),
+                "matrices": len(self._matrices),
+                "tickers": sum(len(matrix) for matrix in self._matrices.values()),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._matrices.clear()
+
+    def _cached(self, key: Tuple[str, ...]) -> Optional[PriceMatrix]:
+        with self._lock:
+            matrix = self._matrices.get(key)
+            if matrix is None or time.time() - matrix.loaded_at > self.matrix_ttl:
+                return None
+            self._matrices.move_to_end(key)
+            return matrix
+
+
+screener = Screener()
@@ -1,14 +1,27 @@
 import logging
-import yfinance as yf
-import numpy as np
-import pandas as pd
-import pandas_ta as ta
+import os
 from langchain.tools import tool
+from tools.formatting import format_chart_patterns
+from tools.indicators import indicator_engine
+from tools.market_data import market_data
+from utils.cache import TTLCache
+from utils.executors import run_blocking
 
 logger = logging.getLogger(__name__)
 
+# compact - summarised, token budgeted JSON, full - complete indicator table
+TECHNICAL_OUTPUT_FORMAT = os.getenv("TECHNICAL_OUTPUT_FORMAT", "compact")
+TECHNICAL_TOKEN_BUDGET = int(os.getenv("TECHNICAL_TOKEN_BUDGET", "600"))
+# Tool output per ticker, also filled ahead of time by services/precompute.py
+chart_patterns_cache = TTLCache(
+    "chart_patterns",
+    ttl=int(os.getenv("CHART_PATTERNS_CACHE_TTL", os.getenv("MARKET_DATA_HISTORY_TTL", "900"))),
+    max_entries=int(os.getenv("TICKER_CACHE_MAX_ENTRIES", "1024")),
+)
+
+
 @tool("get_chart_patterns")
-def get_chart_patterns(ticker: str) -> str:
+async def get_chart_patterns(ticker: str) -> str:
     """
     Returns a string of chart patterns for a given ticker for last 20 days.
     
@@ -17,23 +30,20 @@ def get_chart_patterns(ticker: str) -> str:
     Returns:
         A string of chart patterns.
     """
-    logger.info(f"Fetching chart patterns for {ticker}")
-    df = yf.download(ticker, period="1y", multi_level_index=False, interval="1d")
-    cdl = df.ta.cdl_pattern(name="all", append=True)
-    
-    # SMA
-    df["SMA_50"] = df.ta.sma(length=50)
-    df["SMA_200"] = df.ta.sma(length=200)
-    
-    # Support Resistance
-    df["SR_high"] = df["High"].rolling(20).max()
-    df["SR_low"] = df["Low"].rolling(20).min()
-    
-    # trend
-    df["trend"] = np.where(df["SMA_50"] > df["SMA_200"], "up", "down")
+    logger.info("Fetching chart patterns for %s", ticker)
+    return await chart_patterns_cache.aget_or_compute(ticker.upper(), lambda: chart_patterns(ticker.upper()))
+
+
+async def chart_patterns(ticker: str) -> str:
+    df = await run_blocking("yfinance", market_data.get_history, ticker, period="1y", interval="1d")
+
+    # Candlestick patterns, SMA_50/SMA_200, 20 day support/resistance and trend for the last 20 days
+    result = await run_blocking("compute", indicator_engine.compute, ticker, df)
 
-    logger.info(f"Successfully fetched chart patterns for {ticker}")
-    return df[-20:].to_string()
+    logger.info("Successfully fetched chart patterns for %s", ticker)
+    if TECHNICAL_OUTPUT_FORMAT == "full":
+        return result.to_string()
+    return format_chart_patterns(ticker, result, TECHNICAL_TOKEN_BUDGET)
 
 
 technical_tools = [
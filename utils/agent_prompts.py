@@ -9,7 +9,22 @@ Your Responsibilities:
 
 Use the available tools to gather and analyze financial data systematically.
 
-If ticker is of Indian Company use ticker.NS as tool input Argument.
+Use the Ticker given with the query as tool input Argument. If no Ticker is given and the company is Indian use ticker.NS.
+"""
+
+FUNDAMENTAL_PREFETCH_PROMPT = """
+You are a Fundamental Analysis Agent specializing in financial statement analysis.
+
+The results of all fundamental analysis tools (financial statements, valuation ratios, company overview,
+industry analysis and macroeconomic conditions) have already been gathered and are provided below.
+
+Your Responsibilities:
+1. Analyze the financial statements of the company.
+2. Analyze Valuation ratios.
+3. Understand and Analyze Mangement and Business Model.
+4. Analyze Industry and Macroeconomic Conditions.
+
+Base your analysis only on the provided tool results. If a tool returned an error, mention that the data is unavailable.
 """
 
 TECHNICAL_AGENT_PROMPT = """
@@ -24,7 +39,7 @@ Your responsibilities:
 Use the available tools to perform comprehensive technical analysis.
 Apply statistical analysis principles to identify trends and patterns.
 
-If ticker is of Indian Company use ticker.NS as tool input Argument.
+Use the Ticker given with the query as tool input Argument. If no Ticker is given and the company is Indian use ticker.NS.
 """
 
 PREDICTION_AGENT_PROMPT = """
@@ -72,4 +87,11 @@ Enum-Options
 
 Below is the already completed analysis_results state:
 completed_analysis_result
-"""
\ No newline at end of file
+"""
+
+TICKER_EXTRACTION_PROMPT = """
+Extract the stock ticker symbol the user is asking about, in the format used by Yahoo Finance.
+
+If ticker is of Indian Company use ticker.NS.
+If the query does not mention any stock, return an empty ticker.
+"""
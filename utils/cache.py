@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from utils.executors import run_blocking
+from utils.shared_store import deserialize, serialize, shared_store
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class TTLCache():
+    """
+    Thread safe in-memory cache with a per-entry TTL and LRU eviction.
+
+    When a shared store is configured (SHARED_STORE_URL), entries are also written to it and
+    local misses are looked up there, so the worker processes share their results. The async
+    methods do the shared store I/O in the default executor; local hits stay synchronous.
+
+    Each entry keeps the time it was stored, see `timestamps`. Hit, miss and eviction counts
+    are kept for the stats endpoint. Caches register themselves by name in `CACHES`.
+    """
+
+    def __init__(self, name: str, ttl: float, max_entries: int, shared: bool = True):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.shared = shared_store if shared else None
+        # key -> (expires_at, value, stored_at)
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any, float]]" = OrderedDict()
+        self._lock = Lock()
+        self._key_locks: Dict[Hashable, Lock] = {}
+        self._async_key_locks: Dict[Hashable, asyncio.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.shared_hits = 0
+        CACHES[name] = self
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        value = self._get_local(key)
+        if value is _MISSING:
+            value = self._count_shared(self._get_shared(key))
+        return default if value is _MISSING else value
+
+    async def aget(self, key: Hashable, default: Any = None) -> Any:
+        """get without blocking the event loop on the shared store"""
+        value = self._get_local(key)
+        if value is _MISSING:
+            if self.shared is not None:
+                value = await run_blocking("default", self._get_shared, key)
+            value = self._count_shared(value)
+        return default if value is _MISSING else value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        stored_at = time.time()
+        self._set_local(key, value, stored_at + ttl, stored_at)
+        if self.shared is not None:
+            self._set_shared(key, value, ttl, stored_at)
+
+    async def aset(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """set without blocking the event loop on the shared store"""
+        ttl = self.ttl if ttl is None else ttl
+        stored_at = time.time()
+        self._set_local(key, value, stored_at + ttl, stored_at)
+        if self.shared is not None:
+            await run_blocking("default", self._set_shared, key, value, ttl, stored_at)
+
+    def timestamps(self, key: Hashable) -> Optional[Tuple[float, float]]:
+        """(stored_at, expires_at) of a live entry, None when there is none; not counted as a lookup"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() < entry[0]:
+                return entry[2], entry[0]
+
+        if self._get_shared(key) is _MISSING:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            return (entry[2], entry[0]) if entry is not None else None
+
+    def _get_local(self, key: Hashable) -> Any:
+        """Live local value counted as a hit, _MISSING otherwise"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() < entry[0]:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            if entry is not None:
+                del self._entries[key]
+        return _MISSING
+
+    def _count_shared(self, value: Any) -> Any:
+        """Count the shared store lookup that followed a local miss"""
+        with self._lock:
+            if value is _MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.shared_hits += 1
+        return value
+
+    def _set_local(self, key: Hashable, value: Any, expires_at: float, stored_at: float):
+        with self._lock:
+            self._entries[key] = (expires_at, value, stored_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _get_shared(self, key: Hashable) -> Any:
+        """Look a key up in the shared store and keep a local copy until it expires"""
+        if self.shared is None:
+            return _MISSING
+        try:
+            found = self.shared.get(self.name, repr(key))
+            if found is None:
+                return _MISSING
+            stored_at, value = deserialize(found[0])
+        except Exception as e:
+            logger.warning("Could not read %s from the shared store: %s", self.name, e)
+            return _MISSING
+        self._set_local(key, value, found[1], stored_at)
+        return value
+
+    def _set_shared(self, key: Hashable, value: Any, ttl: float, stored_at: float):
+        try:
+            self.shared.set(self.name, repr(key), serialize((stored_at, value)), ttl)
+        except Exception as e:
+            logger.warning("Could not write %s to the shared store: %s", self.name, e)
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Return the cached value or compute it once, even when several threads miss together"""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, Lock())
+
+        try:
+            with key_lock:
+                with self._lock:
+                    entry = self._entries.get(key)
+                    if entry is not None and time.time() < entry[0]:
+                        # Computed by a concurrent caller while waiting, count it as a hit
+                        self.misses -= 1
+                        self.hits += 1
+                        return entry[1]
+
+                value = compute()
+                self.set(key, value)
+        finally:
+            # Also when compute raises, so keys that keep failing do not pile up locks
+            with self._lock:
+                self._key_locks.pop(key, None)
+        return value
+
+    async def aget_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        """Async variant of get_or_compute, concurrent misses for a key await a single computation"""
+        value = await self.aget(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        key_lock = self._async_key_locks.setdefault(key, asyncio.Lock())
+        try:
+            async with key_lock:
+                with self._lock:
+                    entry = self._entries.get(key)
+                    if entry is not None and time.time() < entry[0]:
+                        self.misses -= 1
+                        self.hits += 1
+                        return entry[1]
+
+                value = await compute()
+                await self.aset(key, value)
+        finally:
+            if not key_lock.locked():
+                self._async_key_locks.pop(key, None)
+        return value
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+        if self.shared is not None:
+            self.shared.delete(self.name, None if key is None else repr(key))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "shared_hits": self.shared_hits,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+CACHES: Dict[str, TTLCache] = {}
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Return the stats of every registered cache"""
+    return {name: cache.stats() for name, cache in CACHES.items()}
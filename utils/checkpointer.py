@@ -0,0 +1,436 @@
+import logging
+import os
+import random
+import sqlite3
+import time
+from threading import Lock
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+from utils.executors import run_blocking
+from utils.shared_store import SHARED_STORE_URL, connect_sqlite, sqlite_path
+
+logger = logging.getLogger(__name__)
+
+# ":memory:" keeps checkpoints in process, a file path persists them on local disk and shares them
+# between worker processes. Defaults to the file of a sqlite:/// SHARED_STORE_URL.
+CHECKPOINT_DB_PATH = os.getenv("CHECKPOINT_DB_PATH") or (
+    sqlite_path(SHARED_STORE_URL) if SHARED_STORE_URL.startswith("sqlite:") else ":memory:"
+)
+CHECKPOINT_MAX_BYTES = int(os.getenv("CHECKPOINT_MAX_BYTES", str(256 * 1024 * 1024)))
+CHECKPOINT_MAX_COUNT = int(os.getenv("CHECKPOINT_MAX_COUNT", "10000"))
+CHECKPOINT_MAX_PER_THREAD = int(os.getenv("CHECKPOINT_MAX_PER_THREAD", "5"))
+CHECKPOINT_TTL = int(os.getenv("CHECKPOINT_TTL", "3600"))
+CHECKPOINT_GC_INTERVAL = int(os.getenv("CHECKPOINT_GC_INTERVAL", "60"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    checkpoint_type TEXT,
+    checkpoint BLOB,
+    metadata_type TEXT,
+    metadata BLOB,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    value_type TEXT,
+    value BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    size INTEGER NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+CREATE TABLE IF NOT EXISTS threads (
+    thread_id TEXT PRIMARY KEY,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS threads_updated_at ON threads (updated_at);
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    stored_bytes INTEGER NOT NULL,
+    checkpoints INTEGER NOT NULL
+);
+"""
+
+# Running totals for the size limits, kept by triggers so that they also count the rows written
+# by other worker processes. Seeded from the tables the first time, e.g. for an existing file.
+TOTALS = """
+INSERT OR IGNORE INTO totals
+SELECT 0, (SELECT COALESCE(SUM(size), 0) FROM checkpoints) + (SELECT COALESCE(SUM(size), 0) FROM writes),
+       (SELECT COUNT(*) FROM checkpoints);
+CREATE TRIGGER IF NOT EXISTS checkpoints_insert AFTER INSERT ON checkpoints BEGIN
+    UPDATE totals SET stored_bytes = stored_bytes + NEW.size, checkpoints = checkpoints + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS checkpoints_delete AFTER DELETE ON checkpoints BEGIN
+    UPDATE totals SET stored_bytes = stored_bytes - OLD.size, checkpoints = checkpoints - 1;
+END;
+CREATE TRIGGER IF NOT EXISTS writes_insert AFTER INSERT ON writes BEGIN
+    UPDATE totals SET stored_bytes = stored_bytes + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS writes_delete AFTER DELETE ON writes BEGIN
+    UPDATE totals SET stored_bytes = stored_bytes - OLD.size;
+END;
+"""
+
+
+class SQLiteCheckpointSaver(BaseCheckpointSaver[str]):
+    """
+    Bounded LangGraph checkpointer backed by SQLite, in memory or on local disk.
+
+    Only the latest `max_per_thread` checkpoints of each thread are kept. Threads that
+    were not updated for `ttl` seconds are garbage collected, and the least recently
+    updated threads are evicted when the stored bytes or checkpoint count exceed
+    their limits. The async methods run the sync ones in the default executor.
+    """
+
+    def __init__(
+        self,
+        path: str = CHECKPOINT_DB_PATH,
+        max_bytes: int = CHECKPOINT_MAX_BYTES,
+        max_count: int = CHECKPOINT_MAX_COUNT,
+        max_per_thread: int = CHECKPOINT_MAX_PER_THREAD,
+        ttl: int = CHECKPOINT_TTL,
+        gc_interval: int = CHECKPOINT_GC_INTERVAL,
+        **kwargs: Any,
+    ):
+        super().__init__(**kwargs)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_count = max_count
+        # the parent of the latest checkpoint is needed to resume a thread
+        self.max_per_thread = max(2, max_per_thread)
+        self.ttl = ttl
+        self.gc_interval = gc_interval
+        self.evicted_threads = 0
+        self._last_gc = 0.0
+        self._lock = Lock()
+
+        if path == ":memory:":
+            self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        else:
+            self.conn = connect_sqlite(path)
+        # Rows replaced by INSERT OR REPLACE only fire the delete triggers with recursive triggers on
+        self.conn.execute("PRAGMA recursive_triggers=ON")
+        self.conn.executescript(SCHEMA)
+        self.conn.executescript(f"BEGIN IMMEDIATE; {TOTALS} COMMIT;")
+
+    # ---- reads ----
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+
+        query = "SELECT checkpoint_id, parent_checkpoint_id, checkpoint_type, checkpoint, metadata_type, metadata " \
+                "FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?"
+        params: Tuple[Any, ...] = (thread_id, checkpoint_ns)
+        if checkpoint_id:
+            query += " AND checkpoint_id = ?"
+            params += (checkpoint_id,)
+        else:
+            query += " ORDER BY checkpoint_id DESC LIMIT 1"
+
+        with self._lock:
+            row = self.conn.execute(query, params).fetchone()
+            if row is None:
+                return None
+            return self._to_tuple(thread_id, checkpoint_ns, row)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        yield from self._list(config, filter=filter, before=before, limit=limit)
+
+    def _list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> List[CheckpointTuple]:
+        query = "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, checkpoint_type, " \
+                "checkpoint, metadata_type, metadata FROM checkpoints"
+        clauses, params = [], []
+        if config:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(config["configurable"]["checkpoint_ns"])
+            if checkpoint_id := get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            clauses.append("checkpoint_id < ?")
+            params.append(before_id)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY checkpoint_id DESC"
+
+        with self._lock:
+            rows = self.conn.execute(query, params).fetchall()
+            results = []
+            for thread_id, checkpoint_ns, *row in rows:
+                checkpoint_tuple = self._to_tuple(thread_id, checkpoint_ns, row)
+                if filter and not all(
+                    checkpoint_tuple.metadata.get(key) == value for key, value in filter.items()
+                ):
+                    continue
+                results.append(checkpoint_tuple)
+                if limit is not None and len(results) >= limit:
+                    break
+        return results
+
+    def _to_tuple(self, thread_id: str, checkpoint_ns: str, row: Sequence[Any]) -> CheckpointTuple:
+        checkpoint_id, parent_checkpoint_id, checkpoint_type, checkpoint, metadata_type, metadata = row
+        writes = self.conn.execute(
+            "SELECT task_id, channel, value_type, value FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint=self.serde.loads_typed((checkpoint_type, checkpoint)),
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_checkpoint_id,
+                    }
+                }
+                if parent_checkpoint_id
+                else None
+            ),
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed((value_type, value)))
+                for task_id, channel, value_type, value in writes
+            ],
+        )
+
+    # ---- writes ----
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_type, checkpoint_bytes = self.serde.dumps_typed(checkpoint)
+        metadata_type, metadata_bytes = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        now = time.time()
+
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint["id"],
+                    config["configurable"].get("checkpoint_id"),
+                    checkpoint_type,
+                    checkpoint_bytes,
+                    metadata_type,
+                    metadata_bytes,
+                    len(checkpoint_bytes) + len(metadata_bytes),
+                    now,
+                ),
+            )
+            self.conn.execute("INSERT OR REPLACE INTO threads VALUES (?, ?)", (thread_id, now))
+            self._trim_thread(thread_id, checkpoint_ns)
+            self._enforce_limits(thread_id, now)
+
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+
+        # Special writes (errors, interrupts) replace earlier ones, regular writes are only stored once
+        verb = "INSERT OR REPLACE" if all(channel in WRITES_IDX_MAP for channel, _ in writes) else "INSERT OR IGNORE"
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            value_type, value_bytes = self.serde.dumps_typed(value)
+            rows.append((
+                thread_id,
+                checkpoint_ns,
+                checkpoint_id,
+                task_id,
+                WRITES_IDX_MAP.get(channel, idx),
+                channel,
+                value_type,
+                value_bytes,
+                task_path,
+                len(value_bytes),
+            ))
+
+        with self._lock:
+            self.conn.executemany(f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._delete_thread(thread_id)
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await run_blocking("default", self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        for checkpoint_tuple in await run_blocking(
+            "default", self._list, config, filter=filter, before=before, limit=limit
+        ):
+            yield checkpoint_tuple
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await run_blocking("default", self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        return await run_blocking("default", self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await run_blocking("default", self.delete_thread, thread_id)
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # ---- eviction ----
+
+    def _delete_thread(self, thread_id: str):
+        self.conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+        self.conn.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+        self.conn.execute("DELETE FROM threads WHERE thread_id = ?", (thread_id,))
+
+    def _trim_thread(self, thread_id: str, checkpoint_ns: str):
+        """Keep only the latest checkpoints of a thread"""
+        stale = self.conn.execute(
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?",
+            (thread_id, checkpoint_ns, self.max_per_thread),
+        ).fetchall()
+        for (checkpoint_id,) in stale:
+            params = (thread_id, checkpoint_ns, checkpoint_id)
+            self.conn.execute(
+                "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", params
+            )
+            self.conn.execute(
+                "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", params
+            )
+
+    def _enforce_limits(self, current_thread_id: str, now: float):
+        if now - self._last_gc >= self.gc_interval:
+            self._last_gc = now
+            expired = self.conn.execute(
+                "SELECT thread_id FROM threads WHERE updated_at < ?", (now - self.ttl,)
+            ).fetchall()
+            for (thread_id,) in expired:
+                self._delete_thread(thread_id)
+            if expired:
+                logger.info("Checkpointer garbage collected %s expired threads", len(expired))
+
+        while True:
+            stored_bytes, count = self._totals()
+            if stored_bytes <= self.max_bytes and count <= self.max_count:
+                break
+
+            oldest = self.conn.execute(
+                "SELECT thread_id FROM threads WHERE thread_id != ? ORDER BY updated_at LIMIT 1",
+                (current_thread_id,),
+            ).fetchone()
+            if oldest is None:
+                break
+            self._delete_thread(oldest[0])
+            self.evicted_threads += 1
+
+    def _totals(self) -> Tuple[int, int]:
+        return self.conn.execute("SELECT stored_bytes, checkpoints FROM totals").fetchone()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stored_bytes, count = self._totals()
+            (threads,) = self.conn.execute("SELECT COUNT(*) FROM threads").fetchone()
+            (writes,) = self.conn.execute("SELECT COUNT(*) FROM writes").fetchone()
+        return {
+            "path": self.path,
+            "threads": threads,
+            "checkpoints": count,
+            "writes": writes,
+            "stored_bytes": stored_bytes,
+            "max_bytes": self.max_bytes,
+            "max_count": self.max_count,
+            "evicted_threads": self.evicted_threads,
+        }
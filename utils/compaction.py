@@ -0,0 +1,130 @@
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, List
+
+from langchain_core.messages import BaseMessage, HumanMessage
+
+from utils.tokens import estimate_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+# Token budget of the digest stored for each analysis
+COMPACTION_DIGEST_TOKENS = int(os.getenv("COMPACTION_DIGEST_TOKENS", "500"))
+# Token budget of the compacted history sent to each node, e.g. supervisor=300,final_analysis=1200
+COMPACTION_NODE_BUDGETS = os.getenv("COMPACTION_NODE_BUDGETS", "")
+COMPACTION_DEFAULT_BUDGET = int(os.getenv("COMPACTION_DEFAULT_BUDGET", "1000"))
+
+KEY_POINT_PATTERN = re.compile(r"^\s*(?:[-*•]|\d+[.)]|#+)\s+|\d")
+
+
+def _parse_budgets(value: str) -> Dict[str, int]:
+    budgets = {}
+    for pair in filter(None, (item.strip() for item in value.split(","))):
+        node, budget = pair.split("=")
+        budgets[node.strip()] = int(budget)
+    return budgets
+
+
+NODE_BUDGETS = _parse_budgets(COMPACTION_NODE_BUDGETS)
+
+
+def node_budget(node: str) -> int:
+    return NODE_BUDGETS.get(node, COMPACTION_DEFAULT_BUDGET)
+
+
+def _render(digest: Dict[str, Any]) -> str:
+    return json.dumps(digest, separators=(",", ":"), ensure_ascii=False)
+
+
+def message_text(message: BaseMessage) -> str:
+    """Text of a message whose content may be a list of content parts"""
+    if isinstance(message.content, str):
+        return message.content
+    return "".join(
+        part if isinstance(part, str) else part.get("text", "")
+        for part in message.content
+    )
+
+
+def build_digest(analysis: str, text: str, budget: int = COMPACTION_DIGEST_TOKENS) -> Dict[str, Any]:
+    """
+    Reduce an analysis to a bounded structured digest.
+
+    Bullet, numbered and heading lines and lines with figures are kept as key points,
+    the remaining prose becomes a truncated summary.
+    """
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    key_lines = [line for line in lines if KEY_POINT_PATTERN.search(line)]
+    prose = " ".join(line for line in lines if line not in key_lines)
+
+    digest = {"analysis": analysis, "key_points": [], "summary": ""}
+    key_point_budget = budget * 3 // 5
+    for line in key_lines:
+        candidate = re.sub(r"^\s*(?:[-*•]|#+)\s+", "", line).replace("**", "")
+        if estimate_tokens(_render(digest)) + estimate_tokens(candidate) > key_point_budget:
+            break
+        digest["key_points"].append(candidate)
+
+    remaining = budget - estimate_tokens(_render(digest))
+    if remaining > 0:
+        digest["summary"] = truncate_to_tokens(prose or text, remaining)
+    return shrink_digest(digest, budget)
+
+
+def shrink_digest(digest: Dict[str, Any], budget: int) -> Dict[str, Any]:
+    """Drop trailing key points, then shorten the summary, until the digest fits the budget"""
+    digest = {**digest, "key_points": list(digest.get("key_points", []))}
+    while estimate_tokens(_render(digest)) > budget and digest["key_points"]:
+        digest["key_points"].pop()
+
+    overflow = estimate_tokens(_render(digest)) - budget
+    if overflow > 0 and digest.get("summary"):
+        digest["summary"] = truncate_to_tokens(
+            digest["summary"], max(0, estimate_tokens(digest["summary"]) - overflow)
+        )
+    return digest
+
+
+def compact_messages(state: Dict[str, Any], node: str) -> List[BaseMessage]:
+    """
+    Compacted history for a node: the user query and resolved ticker followed by one digest
+    per completed analysis and the names of the analyses that timed out or failed.
+
+    Intermediate agent and tool messages are dropped. The node's token budget is split
+    between the digests.
+    """
+    query = state.get("metadata", {}).get("query")
+    messages = state.get("messages", [])
+    if not query:
+        query = next((message.content for message in messages if isinstance(message, HumanMessage)), "")
+
+    ticker = state.get("metadata", {}).get("ticker")
+    if ticker:
+        query = f"{query}\n\nTicker: {ticker}"
+
+    digests = [
+        result["digest"] for result in state.get("analysis_results", {}).values()
+        if isinstance(result, dict) and result.get("digest")
+    ]
+
+    content = query
+    if digests:
+        per_digest = max(1, (node_budget(node) - estimate_tokens(query)) // len(digests))
+        rendered = "\n".join(_render(shrink_digest(digest, per_digest)) for digest in digests)
+        content = f"{query}\n\nCompleted analyses:\n{rendered}"
+
+    # Analyses that timed out or failed, so the reader knows the picture is partial
+    unavailable = [
+        f"{name} ({result['status'].replace('_', ' ')})"
+        for name, result in state.get("analysis_results", {}).items()
+        if isinstance(result, dict) and result.get("status") in ("timed_out", "failed")
+    ]
+    if unavailable:
+        content = f"{content}\n\nUnavailable analyses: {', '.join(unavailable)}"
+
+    logger.info(
+        "Compacted %s messages to ~%s tokens for %s", len(messages), estimate_tokens(content), node
+    )
+    return [HumanMessage(content=content)]
@@ -0,0 +1,62 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Callable, Dict
+
+from utils.metrics import record
+from utils.resilience import within_deadline
+
+logger = logging.getLogger(__name__)
+
+# Bounded thread pools that isolate blocking library calls from the event loop
+EXECUTOR_WORKERS = {
+    "yfinance": int(os.getenv("YFINANCE_EXECUTOR_WORKERS", "8")),
+    "compute": int(os.getenv("COMPUTE_EXECUTOR_WORKERS", str(os.cpu_count() or 4))),
+    "default": int(os.getenv("DEFAULT_EXECUTOR_WORKERS", "16")),
+}
+
+_executors: Dict[str, ThreadPoolExecutor] = {}
+_executors_lock = Lock()
+
+
+def get_executor(name: str) -> ThreadPoolExecutor:
+    with _executors_lock:
+        if name not in _executors:
+            workers = EXECUTOR_WORKERS.get(name, EXECUTOR_WORKERS["default"])
+            logger.info("Creating %s executor with %s workers", name, workers)
+            _executors[name] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{name}-executor")
+        return _executors[name]
+
+
+async def run_blocking(executor: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run a blocking call in the named bounded executor, keeping the caller's context variables.
+
+    The caller stops waiting at the request deadline; the thread finishes the call regardless.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    start = time.perf_counter()
+    error = False
+    try:
+        return await within_deadline(loop.run_in_executor(
+            get_executor(executor),
+            functools.partial(context.run, func, *args, **kwargs)
+        ))
+    except BaseException:
+        error = True
+        raise
+    finally:
+        record("blocking", executor, time.perf_counter() - start, error)
+
+
+def shutdown_executors():
+    with _executors_lock:
+        for executor in _executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        _executors.clear()
@@ -0,0 +1,197 @@
+import asyncio
+import itertools
+import logging
+import os
+import time
+from functools import lru_cache
+from threading import BoundedSemaphore, Lock
+from typing import Dict
+
+import httpx
+from google import genai
+from google.genai import types
+
+from utils.metrics import record, record_llm_usage
+from utils.resilience import DeadlineExceeded, bounded_timeout, circuit_breaker, hedger
+
+logger = logging.getLogger(__name__)
+
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+
+GEMINI_CLIENT_POOL_SIZE = int(os.getenv("GEMINI_CLIENT_POOL_SIZE", "2"))
+GEMINI_MAX_CONNECTIONS = int(os.getenv("GEMINI_MAX_CONNECTIONS", "32"))
+GEMINI_KEEPALIVE_EXPIRY = float(os.getenv("GEMINI_KEEPALIVE_EXPIRY", "120"))
+GEMINI_DEFAULT_CONCURRENCY = int(os.getenv("GEMINI_DEFAULT_CONCURRENCY", "8"))
+# grounded (Google Search) calls have their own, lower quota and are limited separately
+GEMINI_SEARCH_CONCURRENCY = int(os.getenv("GEMINI_SEARCH_CONCURRENCY", "4"))
+# comma separated upstream=limit pairs, e.g. gemini-2.0-flash=8,gemini-2.0-flash+search=2
+GEMINI_MODEL_CONCURRENCY = os.getenv("GEMINI_MODEL_CONCURRENCY", "")
+# Seconds a single call may take, grounded calls search the web first and get longer; both
+# are cut short by the request deadline
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "30"))
+GEMINI_SEARCH_TIMEOUT = float(os.getenv("GEMINI_SEARCH_TIMEOUT", "45"))
+
+
+def parse_model_limits(value: str) -> Dict[str, int]:
+    limits = {}
+    for pair in filter(None, (item.strip() for item in value.split(","))):
+        model, limit = pair.split("=")
+        limits[model.strip()] = int(limit)
+    return limits
+
+
+def record_response_usage(model: str, seconds: float, response: types.GenerateContentResponse):
+    usage = response.usage_metadata
+    record_llm_usage(
+        model,
+        seconds,
+        (usage.prompt_token_count or 0) if usage else 0,
+        (usage.candidates_token_count or 0) if usage else 0,
+    )
+
+
+def upstream(model: str, config: types.GenerateContentConfig) -> str:
+    """Name of the upstream a call is limited by: the model, or model+search for grounded calls"""
+    grounded = any(tool.google_search is not None for tool in (config.tools or []))
+    return f"{model}+search" if grounded else model
+
+
+def call_timeout(name: str) -> float:
+    return GEMINI_SEARCH_TIMEOUT if name.endswith("+search") else GEMINI_TIMEOUT
+
+
+class GenAIClientPool:
+    """
+    Process wide pool of google-genai clients.
+
+    Clients are created once and reused so their httpx connections stay alive between tool
+    calls. Sync and async calls are limited per upstream (model, grounded search) by semaphores,
+    time out after GEMINI_TIMEOUT / GEMINI_SEARCH_TIMEOUT or at the request deadline, and fail
+    fast while the upstream's circuit breaker is open. Async calls slower than usual are
+    hedged when LLM_HEDGING is enabled.
+    """
+    _instance = None
+    _lock = Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    logger.info("Initializing GenAIClientPool instance...")
+                    instance = super().__new__(cls)
+                    limits = httpx.Limits(
+                        max_connections=GEMINI_MAX_CONNECTIONS,
+                        max_keepalive_connections=GEMINI_MAX_CONNECTIONS,
+                        keepalive_expiry=GEMINI_KEEPALIVE_EXPIRY,
+                    )
+                    # Upper bound for calls that are not cut short by a deadline, e.g. sync calls
+                    http_options = types.HttpOptions(
+                        timeout=int(max(GEMINI_TIMEOUT, GEMINI_SEARCH_TIMEOUT) * 1000),
+                        client_args={"limits": limits},
+                        async_client_args={"limits": limits},
+                    )
+                    instance.clients = [
+                        genai.Client(api_key=GEMINI_API_KEY, http_options=http_options)
+                        for _ in range(max(1, GEMINI_CLIENT_POOL_SIZE))
+                    ]
+                    instance._next_client = itertools.count()
+                    instance._model_limits = parse_model_limits(GEMINI_MODEL_CONCURRENCY)
+                    instance._sync_semaphores = {}
+                    instance._async_semaphores = {}
+                    instance._semaphores_lock = Lock()
+                    cls._instance = instance
+                    logger.info("GenAIClientPool instance initialized.")
+        return cls._instance
+
+    def get_client(self) -> genai.Client:
+        """Return the next client of the pool (round robin)"""
+        return self.clients[next(self._next_client) % len(self.clients)]
+
+    def _limit(self, name: str) -> int:
+        default = GEMINI_SEARCH_CONCURRENCY if name.endswith("+search") else GEMINI_DEFAULT_CONCURRENCY
+        return self._model_limits.get(name, default)
+
+    def _sync_semaphore(self, name: str) -> BoundedSemaphore:
+        with self._semaphores_lock:
+            if name not in self._sync_semaphores:
+                self._sync_semaphores[name] = BoundedSemaphore(self._limit(name))
+            return self._sync_semaphores[name]
+
+    def _async_semaphore(self, name: str) -> asyncio.Semaphore:
+        with self._semaphores_lock:
+            if name not in self._async_semaphores:
+                self._async_semaphores[name] = asyncio.Semaphore(self._limit(name))
+            return self._async_semaphores[name]
+
+    def generate_content(
+        self, model: str, contents: str, config: types.GenerateContentConfig
+    ) -> types.GenerateContentResponse:
+        name = upstream(model, config)
+        queued_at = time.perf_counter()
+        with circuit_breaker(f"gemini:{name}").guard(), self._sync_semaphore(name):
+            start = time.perf_counter()
+            record("outbound_wait", name, start - queued_at)
+            try:
+                response = self.get_client().models.generate_content(
+                    model=model,
+                    contents=contents,
+                    config=config,
+                )
+            except Exception:
+                record_llm_usage(model, time.perf_counter() - start, 0, 0, error=True)
+                raise
+            record_response_usage(model, time.perf_counter() - start, response)
+            return response
+
+    async def agenerate_content(
+        self, model: str, contents: str, config: types.GenerateContentConfig
+    ) -> types.GenerateContentResponse:
+        name = upstream(model, config)
+        timeout = bounded_timeout(call_timeout(name))
+        with circuit_breaker(f"gemini:{name}").guard():
+            try:
+                return await asyncio.wait_for(
+                    hedger.run(name, lambda: self._agenerate_content(name, model, contents, config)),
+                    timeout
+                )
+            except asyncio.TimeoutError as e:
+                if timeout < call_timeout(name):
+                    # Cut short by the request deadline, not a sign the upstream is unhealthy
+                    raise DeadlineExceeded(f"{name} did not respond before the request deadline") from e
+                raise TimeoutError(f"{name} did not respond within {timeout:.1f}s") from e
+
+    async def _agenerate_content(
+        self, name: str, model: str, contents: str, config: types.GenerateContentConfig
+    ) -> types.GenerateContentResponse:
+        queued_at = time.perf_counter()
+        async with self._async_semaphore(name):
+            start = time.perf_counter()
+            record("outbound_wait", name, start - queued_at)
+            try:
+                response = await self.get_client().aio.models.generate_content(
+                    model=model,
+                    contents=contents,
+                    config=config,
+                )
+            except Exception:
+                record_llm_usage(model, time.perf_counter() - start, 0, 0, error=True)
+                raise
+            record_response_usage(model, time.perf_counter() - start, response)
+            return response
+
+
+@lru_cache(maxsize=256)
+def generation_config(
+    system_instruction: str,
+    max_output_tokens: int,
+    temperature: float = 0.9,
+    google_search: bool = False,
+) -> types.GenerateContentConfig:
+    """Build (once) the generation config of a tool"""
+    tools = [types.Tool(google_search=types.GoogleSearch())] if google_search else None
+    return types.GenerateContentConfig(
+        tools=tools,
+        max_output_tokens=max_output_tokens,
+        system_instruction=system_instruction,
+        temperature=temperature,
+    )
@@ -1,10 +1,8 @@
 import logging
-from langchain_openai import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.rate_limiters import InMemoryRateLimiter
 from threading import Lock
-from dotenv import load_dotenv
 import os
-load_dotenv()
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +15,44 @@ GEMINI_MODEL=os.getenv("GEMINI_MODEL")
 
 LLM_TYPE=os.getenv("LLM_TYPE")
 
+# Provider retries multiply load exactly when the provider is overloaded, keep them low
+LLM_MAX_RETRIES=int(os.getenv("LLM_MAX_RETRIES", "1"))
+# outbound token bucket for chat model calls of this process, 0 disables it
+LLM_REQUESTS_PER_SECOND=float(os.getenv("LLM_REQUESTS_PER_SECOND", "0"))
+LLM_MAX_BURST=float(os.getenv("LLM_MAX_BURST", "4"))
+
+def create_rate_limiter():
+    if LLM_REQUESTS_PER_SECOND <= 0:
+        return None
+    return InMemoryRateLimiter(
+        requests_per_second=LLM_REQUESTS_PER_SECOND,
+        check_every_n_seconds=min(0.1, 1 / LLM_REQUESTS_PER_SECOND),
+        max_bucket_size=LLM_MAX_BURST
+    )
+
+def create_llm() -> BaseChatModel:
+    """Create the chat model, importing only the provider package that is configured"""
+    if LLM_TYPE == "openai":
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(
+            api_key=OPENAI_API_KEY,
+            model=LLM_MODEL,
+            base_url=MODEL_ENDPOINT,
+            temperature=0,
+            top_p=1,
+            max_retries=LLM_MAX_RETRIES,
+            rate_limiter=create_rate_limiter()
+        )
+
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(
+        model=GEMINI_MODEL,
+        temperature=0,
+        top_p=1,
+        max_retries=LLM_MAX_RETRIES,
+        rate_limiter=create_rate_limiter()
+    )
+
 class LLMConnection:
     _instance = None
     _lock = Lock()
@@ -26,25 +62,9 @@ class LLMConnection:
             with cls._lock:
                 if cls._instance is None:
                     logger.info("Initializing LLMConnection instance...")
-                    cls._instance = super().__new__(cls)
-                    if LLM_TYPE == "openai":
-                        cls._instance.llm = ChatOpenAI(
-                            api_key=OPENAI_API_KEY,
-                            model=LLM_MODEL,
-                            base_url=MODEL_ENDPOINT,
-                            temperature=0,
-                            top_p=1,
-                            max_retries=2
-                        )
-                    else:
-                        print("gemini")
-                        cls._instance.llm = ChatGoogleGenerativeAI(
-                            model=GEMINI_MODEL,
-                            temperature=0,
-                            top_p=1,
-                            max_retries=2
-                        )
-
+                    instance = super().__new__(cls)
+                    instance.llm = create_llm()
+                    cls._instance = instance
                     logger.info("LLMConnection instance initialized.")
         return cls._instance
     
@@ -53,4 +73,7 @@ class LLMConnection:
         return self._instance.llm
     
     def ask_llm(self, query: str):
-        return self._instance.llm.invoke(query)
\ No newline at end of file
+        return self._instance.llm.invoke(query)
+
+    async def aask_llm(self, query: str):
+        return await self._instance.llm.ainvoke(query)
\ No newline at end of file
@@ -0,0 +1,146 @@
+import atexit
+import logging
+import os
+import queue
+import random
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional
+
+from utils.serialization import dumps
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Per module levels, e.g. agents=DEBUG,httpx=WARNING
+LOG_LEVELS = os.getenv("LOG_LEVELS", "httpx=WARNING,httpcore=WARNING,yfinance=WARNING")
+# json - one JSON object per line, text - the previous plain text format
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_FILE = os.getenv("LOG_FILE", "app.log")
+LOG_FILE_MAX_BYTES = int(os.getenv("LOG_FILE_MAX_BYTES", str(50 * 1024 * 1024)))
+LOG_FILE_BACKUP_COUNT = int(os.getenv("LOG_FILE_BACKUP_COUNT", "5"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Messages longer than this are truncated, except for a sampled fraction that is kept in full
+LOG_MAX_MESSAGE_CHARS = int(os.getenv("LOG_MAX_MESSAGE_CHARS", "2000"))
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.01"))
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+# LogRecord attributes, anything else on a record was passed through `extra`
+RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+
+
+class PayloadFilter(logging.Filter):
+    """Truncate oversized messages, keeping a sampled fraction of them in full"""
+
+    def __init__(self, max_chars: int = LOG_MAX_MESSAGE_CHARS, sample_rate: float = LOG_PAYLOAD_SAMPLE_RATE):
+        super().__init__()
+        self.max_chars = max_chars
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message = record.getMessage()
+        if len(message) > self.max_chars:
+            if random.random() < self.sample_rate:
+                record.sampled = True
+            else:
+                message = f"{message[:self.max_chars]}... [truncated {len(message) - self.max_chars} chars]"
+                record.truncated = True
+        record.msg, record.args = message, None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record with the standard fields and any `extra` fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in RESERVED_ATTRS})
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return dumps(entry).decode()
+
+
+class NonFormattingQueueHandler(QueueHandler):
+    """
+    Queue handler that leaves formatting to the listener thread.
+
+    The message is already rendered and bounded by PayloadFilter, so the record only
+    needs to be made safe to pass between threads. Records are dropped rather than
+    blocking the caller when the queue is full.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _parse_levels(value: str) -> Dict[str, str]:
+    levels = {}
+    for pair in filter(None, (item.strip() for item in value.split(","))):
+        name, level = pair.split("=")
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging() -> QueueListener:
+    """
+    Route all logging through a queue to a background listener thread that writes to
+    stdout and a rotating log file. Safe to call more than once.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    formatter = JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if LOG_FILE:
+        handlers.append(RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUP_COUNT, encoding="utf-8"
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    queue_handler = NonFormattingQueueHandler(log_queue)
+    queue_handler.addFilter(PayloadFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL.upper())
+    for name, level in _parse_levels(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,230 @@
+import contextvars
+import functools
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from threading import Lock
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+logger = logging.getLogger(__name__)
+
+# Latency samples kept per metric for the percentiles
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", "1024"))
+
+
+class LatencyStats():
+    """Count, error count and latency distribution of one instrumented operation"""
+
+    def __init__(self, window: int = METRICS_WINDOW):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float, error: bool = False):
+        self.count += 1
+        self.errors += int(error)
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> float:
+        samples = sorted(self.samples)
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg": round(self.total / self.count, 4) if self.count else 0.0,
+            "p50": round(self.percentile(0.50), 4),
+            "p95": round(self.percentile(0.95), 4),
+            "p99": round(self.percentile(0.99), 4),
+            "max": round(self.max, 4),
+        }
+
+
+class MetricsRegistry():
+    """
+    Process wide latency, counter and gauge metrics.
+
+    Latencies are grouped by kind (node, tool, llm, blocking) and name, counters hold
+    token totals and gauges the in-flight requests.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self.latencies: Dict[Tuple[str, str], LatencyStats] = {}
+        self.counters: Dict[str, float] = defaultdict(float)
+        self.gauges: Dict[str, int] = defaultdict(int)
+
+    def observe(self, kind: str, name: str, seconds: float, error: bool = False):
+        with self._lock:
+            stats = self.latencies.get((kind, name))
+            if stats is None:
+                stats = self.latencies[(kind, name)] = LatencyStats()
+            stats.record(seconds, error)
+
+    def increment(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] += value
+
+    def add_gauge(self, name: str, delta: int):
+        with self._lock:
+            self.gauges[name] += delta
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies: Dict[str, Dict[str, Any]] = defaultdict(dict)
+            for (kind, name), stats in sorted(self.latencies.items()):
+                latencies[kind][name] = stats.snapshot()
+            return {
+                "latency": dict(latencies),
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+            }
+
+
+class RequestMetrics():
+    """Timings and token counts of a single request, attached to its response metadata"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.events: List[Dict[str, Any]] = []
+
+    def record(self, kind: str, name: str, seconds: float, error: bool = False, **fields):
+        with self._lock:
+            self.events.append({"kind": kind, "name": name, "duration": seconds, "error": error, **fields})
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            events = list(self.events)
+
+        summary: Dict[str, Dict[str, Dict[str, Any]]] = defaultdict(dict)
+        tokens = {"input": 0, "output": 0}
+        for event in events:
+            entry = summary[event["kind"]].setdefault(event["name"], {"count": 0, "errors": 0, "total": 0.0})
+            entry["count"] += 1
+            entry["errors"] += int(event["error"])
+            entry["total"] = round(entry["total"] + event["duration"], 4)
+            tokens["input"] += event.get("input_tokens", 0)
+            tokens["output"] += event.get("output_tokens", 0)
+        return {**summary, "tokens": tokens}
+
+
+metrics = MetricsRegistry()
+current_request_metrics: contextvars.ContextVar[Optional[RequestMetrics]] = contextvars.ContextVar(
+    "current_request_metrics", default=None
+)
+
+
+def record(kind: str, name: str, seconds: float, error: bool = False, **fields):
+    """Record an operation in the process metrics and in the current request's metrics"""
+    metrics.observe(kind, name, seconds, error)
+    request_metrics = current_request_metrics.get()
+    if request_metrics is not None:
+        request_metrics.record(kind, name, seconds, error, **fields)
+
+
+def timed(kind: str, name: str) -> Callable[[Callable[..., Awaitable[Any]]], Callable[..., Awaitable[Any]]]:
+    """Decorator recording the duration and failures of a coroutine function"""
+    def decorator(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            error = False
+            try:
+                return await func(*args, **kwargs)
+            except BaseException:
+                error = True
+                raise
+            finally:
+                record(kind, name, time.perf_counter() - start, error)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def track_in_flight(name: str):
+    """Gauge of operations currently running"""
+    metrics.add_gauge(name, 1)
+    try:
+        yield
+    finally:
+        metrics.add_gauge(name, -1)
+
+
+def record_llm_usage(model: str, seconds: float, input_tokens: int, output_tokens: int, error: bool = False):
+    record("llm", model, seconds, error, input_tokens=input_tokens, output_tokens=output_tokens)
+    metrics.increment(f"llm.{model}.input_tokens", input_tokens)
+    metrics.increment(f"llm.{model}.output_tokens", output_tokens)
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """LangChain callback timing chat model and tool runs and counting tokens"""
+
+    # Called in the caller's context, so the request metrics context variable is visible
+    run_inline = True
+
+    def __init__(self):
+        self._lock = Lock()
+        self._runs: Dict[UUID, Tuple[str, str, float]] = {}
+
+    def _start(self, run_id: UUID, kind: str, name: str):
+        with self._lock:
+            self._runs[run_id] = (kind, name, time.perf_counter())
+
+    def _finish(self, run_id: UUID) -> Optional[Tuple[str, str, float]]:
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return None
+        kind, name, start = run
+        return kind, name, time.perf_counter() - start
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, metadata=None, **kwargs):
+        model = (metadata or {}).get("ls_model_name") or (serialized or {}).get("name", "chat_model")
+        self._start(run_id, "llm", model)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs):
+        run = self._finish(run_id)
+        if run is None:
+            return
+        _, model, seconds = run
+        input_tokens, output_tokens = 0, 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                input_tokens += usage.get("input_tokens", 0)
+                output_tokens += usage.get("output_tokens", 0)
+        record_llm_usage(model, seconds, input_tokens, output_tokens)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        run = self._finish(run_id)
+        if run is not None:
+            record_llm_usage(run[1], run[2], 0, 0, error=True)
+
+    def on_tool_start(self, serialized, input_str, *, run_id: UUID, **kwargs):
+        self._start(run_id, "tool", (serialized or {}).get("name", "tool"))
+
+    def on_tool_end(self, output, *, run_id: UUID, **kwargs):
+        run = self._finish(run_id)
+        if run is not None:
+            record(*run)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        run = self._finish(run_id)
+        if run is not None:
+            record(*run, error=True)
+
+
+metrics_callback = MetricsCallbackHandler()
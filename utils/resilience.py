@@ -0,0 +1,349 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import time
+from contextlib import contextmanager
+from threading import Lock
+from typing import Any, Awaitable, Callable, Dict, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from utils.metrics import LatencyStats, metrics
+
+logger = logging.getLogger(__name__)
+
+# Seconds a request may take end to end, 0 disables the deadline
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "90"))
+# Seconds of the deadline held back for each step still to come after the current one, so the
+# analyses stop early enough for the final analysis to run on whatever they produced
+DEADLINE_RESERVE_SECONDS = float(os.getenv("DEADLINE_RESERVE_SECONDS", "10"))
+
+# An upstream whose calls fail CIRCUIT_FAILURE_THRESHOLD times in a row is not called for
+# CIRCUIT_RESET_TIMEOUT seconds, then a single trial call decides whether it is back
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
+# Send a duplicate of a Gemini call that is slower than the upstream's LLM_HEDGE_PERCENTILE
+# latency and use whichever answers first. At most LLM_HEDGE_MAX_RATIO of the calls are
+# duplicated, and only once LLM_HEDGE_MIN_SAMPLES latencies have been measured
+LLM_HEDGING = os.getenv("LLM_HEDGING", "false").lower() == "true"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_MAX_RATIO = float(os.getenv("LLM_HEDGE_MAX_RATIO", "0.1"))
+
+current_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "current_deadline", default=None
+)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request deadline passed, or left too little time, before an operation finished"""
+
+
+class CircuitOpenError(Exception):
+    """An upstream is not called because its circuit breaker is open"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is unavailable, retrying in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+# ---- deadlines ----
+
+def new_deadline(seconds: float = REQUEST_DEADLINE_SECONDS) -> Optional[float]:
+    """Epoch time a request started now has to finish by, None without a deadline"""
+    return time.time() + seconds if seconds > 0 else None
+
+
+def request_deadline(state: Dict[str, Any]) -> Optional[float]:
+    """Deadline of the request a workflow state belongs to"""
+    return state.get("metadata", {}).get("deadline")
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[float]):
+    """Make `deadline` the deadline of the tool and upstream calls made in this context"""
+    token = current_deadline.set(deadline)
+    try:
+        yield
+    finally:
+        current_deadline.reset(token)
+
+
+def with_request_deadline(node: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """Wrap a workflow node so the tools and upstream calls it makes keep the deadline in its state"""
+    @functools.wraps(node)
+    async def wrapper(state, *args, **kwargs):
+        with deadline_scope(request_deadline(state)):
+            return await node(state, *args, **kwargs)
+    return wrapper
+
+
+def remaining(reserve_steps: int = 0, deadline: Optional[float] = None) -> Optional[float]:
+    """
+    Seconds left until the deadline (the current one by default), less the reserve of the
+    `reserve_steps` steps still to come. None when there is no deadline.
+    """
+    deadline = current_deadline.get() if deadline is None else deadline
+    if deadline is None:
+        return None
+    return deadline - time.time() - reserve_steps * DEADLINE_RESERVE_SECONDS
+
+
+def bounded_timeout(timeout: Optional[float], reserve_steps: int = 0) -> Optional[float]:
+    """The smaller of `timeout` and the time left until the current deadline"""
+    left = remaining(reserve_steps)
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return left if timeout is None else min(timeout, left)
+
+
+async def within_deadline(awaitable: Awaitable[Any], reserve_steps: int = 0, timeout: Optional[float] = None) -> Any:
+    """Await within the current deadline (and `timeout`), raising DeadlineExceeded when it passes"""
+    try:
+        timeout = bounded_timeout(timeout, reserve_steps)
+    except DeadlineExceeded:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise
+    if timeout is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError as e:
+        raise DeadlineExceeded(f"Did not finish within {timeout:.1f}s") from e
+
+
+# ---- circuit breakers ----
+
+class CircuitBreaker():
+    """
+    Circuit breaker of one upstream: closed, open after `failure_threshold` consecutive
+    failures, and half open `reset_timeout` seconds later, when one trial call is let through.
+
+    Thread safe; calls are wrapped in `guard()`. Cancelled calls and calls cut short by the
+    request deadline count as neither success nor failure.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_timeout: float = CIRCUIT_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.rejected = 0
+        self._lock = Lock()
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may be made now"""
+        with self._lock:
+            if self.state == "open":
+                retry_after = self.opened_at + self.reset_timeout - time.time()
+                if retry_after > 0:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, retry_after)
+                self.state = "half_open"
+                logger.info("Circuit %s half open, letting a trial call through", self.name)
+
+            if self.state == "half_open":
+                if self.trial_in_flight:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, self.reset_timeout)
+                self.trial_in_flight = True
+
+    def on_success(self):
+        with self._lock:
+            if self.state != "closed":
+                logger.info("Circuit %s closed", self.name)
+            self.state = "closed"
+            self.failures = 0
+            self.trial_in_flight = False
+
+    def on_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning("Circuit %s open after %s failures", self.name, self.failures)
+                    metrics.increment(f"circuit.{self.name}.opened")
+                self.state = "open"
+                self.opened_at = time.time()
+
+    def on_cancel(self):
+        with self._lock:
+            self.trial_in_flight = False
+
+    @contextmanager
+    def guard(self):
+        self.before_call()
+        try:
+            yield
+        except (asyncio.CancelledError, DeadlineExceeded):
+            self.on_cancel()
+            raise
+        except BaseException:
+            self.on_failure()
+            raise
+        self.on_success()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"state": self.state, "failures": self.failures, "rejected": self.rejected}
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = Lock()
+
+
+def circuit_breaker(name: str) -> CircuitBreaker:
+    """Process wide circuit breaker of an upstream, created on first use"""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def circuit_stats() -> Dict[str, Dict[str, Any]]:
+    with _breakers_lock:
+        return {name: breaker.snapshot() for name, breaker in sorted(_breakers.items())}
+
+
+class CircuitBreakerCallbackHandler(BaseCallbackHandler):
+    """
+    LangChain callback guarding chat model calls with a circuit breaker per model.
+
+    Raises CircuitOpenError from on_chat_model_start (raise_error), which aborts the call
+    before it reaches the provider.
+    """
+
+    raise_error = True
+    run_inline = True
+
+    def __init__(self):
+        self._lock = Lock()
+        self._runs: Dict[UUID, CircuitBreaker] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, metadata=None, **kwargs):
+        model = (metadata or {}).get("ls_model_name") or (serialized or {}).get("name", "chat_model")
+        breaker = circuit_breaker(f"llm:{model}")
+        breaker.before_call()
+        with self._lock:
+            self._runs[run_id] = breaker
+
+    def _finish(self, run_id: UUID) -> Optional[CircuitBreaker]:
+        with self._lock:
+            return self._runs.pop(run_id, None)
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs):
+        breaker = self._finish(run_id)
+        if breaker is not None:
+            breaker.on_success()
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        breaker = self._finish(run_id)
+        if breaker is None:
+            return
+        if isinstance(error, (asyncio.CancelledError, DeadlineExceeded)):
+            breaker.on_cancel()
+        else:
+            breaker.on_failure()
+
+
+circuit_breaker_callback = CircuitBreakerCallbackHandler()
+
+
+# ---- hedging ----
+
+class Hedger():
+    """
+    Hedged calls: when a call has not answered within the recent `percentile` latency of its
+    upstream, a duplicate is sent and the first successful answer wins, the other is cancelled.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = LLM_HEDGING,
+        percentile: float = LLM_HEDGE_PERCENTILE,
+        min_samples: int = LLM_HEDGE_MIN_SAMPLES,
+        max_ratio: float = LLM_HEDGE_MAX_RATIO,
+    ):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_ratio = max_ratio
+        self._latencies: Dict[str, LatencyStats] = {}
+        self._calls = 0
+        self._hedges = 0
+        self._lock = Lock()
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            self._latencies.setdefault(name, LatencyStats()).record(seconds)
+
+    def hedge_delay(self, name: str) -> Optional[float]:
+        """Seconds after which a call to the upstream is hedged, None when it is not"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            stats = self._latencies.get(name)
+            if stats is None or len(stats.samples) < self.min_samples:
+                return None
+            return stats.percentile(self.percentile)
+
+    def _take_hedge(self) -> bool:
+        with self._lock:
+            if self._hedges + 1 > self.max_ratio * self._calls:
+                return False
+            self._hedges += 1
+            return True
+
+    async def run(self, name: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Await `call()`, duplicating it once if it is slower than the upstream usually is"""
+        with self._lock:
+            self._calls += 1
+
+        async def attempt() -> Any:
+            start = time.perf_counter()
+            result = await call()
+            self.observe(name, time.perf_counter() - start)
+            return result
+
+        delay = self.hedge_delay(name)
+        first = asyncio.ensure_future(attempt())
+        if delay is None:
+            return await first
+
+        pending = {first}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done or not self._take_hedge():
+                return await first
+
+            logger.info("Hedging %s call after %.2fs", name, delay)
+            metrics.increment(f"hedge.{name}.sent")
+            pending.add(asyncio.ensure_future(call()))
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            metrics.increment(f"hedge.{name}.won")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+hedger = Hedger()
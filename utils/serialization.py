@@ -0,0 +1,25 @@
+from typing import Any
+
+import orjson
+from langchain_core.messages import BaseMessage
+from pydantic import BaseModel
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, BaseMessage):
+        return {"type": obj.type, "content": obj.content}
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    return str(obj)
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize to JSON bytes with orjson, messages and models are reduced to plain data"""
+    return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+
+
+def sse_event(obj: Any) -> bytes:
+    """Format an object as a Server-Sent Events data frame"""
+    return b"data: " + dumps(obj) + b"\n\n"
@@ -0,0 +1,308 @@
+import logging
+import os
+import pickle
+import sqlite3
+import time
+from threading import Lock
+from typing import Any, Optional, Tuple
+from urllib.parse import urlparse
+
+from limits.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+# memory:// - state stays in each worker process, sqlite:///path/shared.db - shared by the workers
+# of one host, redis://host:6379/0 - shared by every worker that can reach the Redis-compatible server
+SHARED_STORE_URL = os.getenv("SHARED_STORE_URL", "memory://")
+SHARED_STORE_BUSY_TIMEOUT_MS = int(os.getenv("SHARED_STORE_BUSY_TIMEOUT_MS", "5000"))
+SHARED_STORE_GC_INTERVAL = int(os.getenv("SHARED_STORE_GC_INTERVAL", "60"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE TABLE IF NOT EXISTS counters (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_expires_at ON entries (expires_at);
+"""
+
+
+def sqlite_path(url: str) -> str:
+    """File path of a sqlite:///path URL (sqlite:////abs/path for absolute paths)"""
+    path = url.split("://", 1)[1]
+    return path[1:] if path.startswith("/") else path
+
+
+def connect_sqlite(path: str) -> sqlite3.Connection:
+    """Connection to a SQLite file shared by several processes: WAL, and writers wait for the lock"""
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=SHARED_STORE_BUSY_TIMEOUT_MS / 1000)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={SHARED_STORE_BUSY_TIMEOUT_MS}")
+    return conn
+
+
+class SQLiteSharedStore():
+    """
+    Key-value entries with an expiry and expiring counters in a SQLite WAL file.
+
+    Every worker process opens the same file, so cached results and rate limit counters are
+    shared by all workers of a host. Expired rows are deleted every `gc_interval` seconds.
+    """
+
+    def __init__(self, path: str, gc_interval: int = SHARED_STORE_GC_INTERVAL):
+        self.path = path
+        self.gc_interval = gc_interval
+        self._last_gc = 0.0
+        self._lock = Lock()
+        self.conn = connect_sqlite(path)
+        self.conn.executescript(SCHEMA)
+
+    def get(self, namespace: str, key: str) -> Optional[Tuple[bytes, float]]:
+        """Return (value, expires_at) of a live entry"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT value, expires_at FROM entries WHERE namespace = ? AND key = ? AND expires_at > ?",
+                (namespace, key, time.time()),
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set(self, namespace: str, key: str, value: bytes, ttl: float):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                (namespace, key, value, time.time() + ttl),
+            )
+            self._maybe_gc()
+
+    def delete(self, namespace: str, key: Optional[str] = None):
+        with self._lock:
+            if key is None:
+                self.conn.execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+            else:
+                self.conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def incr(self, key: str, expiry: float, amount: int = 1) -> int:
+        """Increment a counter, starting a new window of `expiry` seconds when it has expired"""
+        now = time.time()
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute(
+                    "INSERT INTO counters VALUES (?, ?, ?) ON CONFLICT (key) DO UPDATE SET "
+                    "value = CASE WHEN expires_at > ? THEN value + excluded.value ELSE excluded.value END, "
+                    "expires_at = CASE WHEN expires_at > ? THEN expires_at ELSE excluded.expires_at END",
+                    (key, amount, now + expiry, now, now),
+                )
+                (value,) = self.conn.execute("SELECT value FROM counters WHERE key = ?", (key,)).fetchone()
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return value
+
+    def counter(self, key: str) -> Tuple[int, float]:
+        """Return (value, expires_at) of a counter, (0, now) when it does not exist or has expired"""
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT value, expires_at FROM counters WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+        return (row[0], row[1]) if row else (0, now)
+
+    def clear_counter(self, key: Optional[str] = None) -> int:
+        with self._lock:
+            if key is None:
+                return self.conn.execute("DELETE FROM counters").rowcount
+            return self.conn.execute("DELETE FROM counters WHERE key = ?", (key,)).rowcount
+
+    def take_tokens(self, key: str, cost: float, rate: float, capacity: float) -> float:
+        """
+        Take `cost` tokens from a token bucket refilled at `rate` per second up to `capacity`.
+
+        Returns 0 when the tokens were taken, otherwise the seconds until enough are available.
+        """
+        now = time.time()
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+                wait = 0.0
+                if tokens >= cost:
+                    tokens -= cost
+                else:
+                    wait = (cost - tokens) / rate
+                self.conn.execute("INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)", (key, tokens, now))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return wait
+
+    def _maybe_gc(self):
+        now = time.time()
+        if now - self._last_gc < self.gc_interval:
+            return
+        self._last_gc = now
+        self.conn.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+        self.conn.execute("DELETE FROM counters WHERE expires_at <= ?", (now,))
+        # Buckets idle for a day are full again anyway
+        self.conn.execute("DELETE FROM buckets WHERE updated_at <= ?", (now - 86400,))
+
+
+# Token bucket update, atomic on the server: KEYS[1] bucket, ARGV rate, capacity, cost, now
+TAKE_TOKENS_SCRIPT = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local rate, capacity, cost, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local tokens = tonumber(bucket[1]) or capacity
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + (now - updated_at) * rate)
+local wait = 0
+if tokens >= cost then tokens = tokens - cost else wait = (cost - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+class RedisSharedStore():
+    """Key-value entries with an expiry in a Redis-compatible server (Redis, Valkey, KeyDB, ...)"""
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("SHARED_STORE_URL=redis://... requires the redis package: pip install redis") from e
+        self.url = url
+        self.client = redis.Redis.from_url(url)
+        self._take_tokens = self.client.register_script(TAKE_TOKENS_SCRIPT)
+
+    @staticmethod
+    def _key(namespace: str, key: str) -> str:
+        return f"stock-agents:{namespace}:{key}"
+
+    def get(self, namespace: str, key: str) -> Optional[Tuple[bytes, float]]:
+        pipeline = self.client.pipeline()
+        pipeline.get(self._key(namespace, key))
+        pipeline.pttl(self._key(namespace, key))
+        value, ttl_ms = pipeline.execute()
+        if value is None or ttl_ms <= 0:
+            return None
+        return value, time.time() + ttl_ms / 1000
+
+    def set(self, namespace: str, key: str, value: bytes, ttl: float):
+        self.client.set(self._key(namespace, key), value, px=max(1, int(ttl * 1000)))
+
+    def delete(self, namespace: str, key: Optional[str] = None):
+        if key is not None:
+            self.client.delete(self._key(namespace, key))
+            return
+        for stored_key in self.client.scan_iter(match=self._key(namespace, "*")):
+            self.client.delete(stored_key)
+
+    def incr(self, key: str, expiry: float, amount: int = 1) -> int:
+        """Increment a counter, see SQLiteSharedStore.incr"""
+        pipeline = self.client.pipeline()
+        pipeline.set(self._key("counters", key), 0, px=max(1, int(expiry * 1000)), nx=True)
+        pipeline.incrby(self._key("counters", key), amount)
+        return pipeline.execute()[1]
+
+    def take_tokens(self, key: str, cost: float, rate: float, capacity: float) -> float:
+        """Token bucket, see SQLiteSharedStore.take_tokens"""
+        wait = self._take_tokens(keys=[self._key("buckets", key)], args=[rate, capacity, cost, time.time()])
+        return float(wait)
+
+
+def create_shared_store(url: str = SHARED_STORE_URL):
+    """Shared store for the URL, None for memory:// (state stays in the process)"""
+    scheme = urlparse(url).scheme
+    if scheme in ("", "memory"):
+        return None
+    if scheme == "sqlite":
+        return SQLiteSharedStore(sqlite_path(url))
+    if scheme in ("redis", "rediss"):
+        return RedisSharedStore(url)
+    raise ValueError(f"Unsupported SHARED_STORE_URL scheme: {scheme}")
+
+
+class SQLiteLimiterStorage(Storage):
+    """
+    `limits` storage for sqlite:/// URLs, so the slowapi limiter counts requests across workers.
+
+    Registered for the "sqlite" scheme by subclassing `limits.storage.Storage`.
+    """
+
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.store = SQLiteSharedStore(sqlite_path(uri))
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        return self.store.incr(key, expiry, amount)
+
+    def get(self, key: str) -> int:
+        return self.store.counter(key)[0]
+
+    def get_expiry(self, key: str) -> float:
+        return self.store.counter(key)[1]
+
+    def check(self) -> bool:
+        try:
+            self.store.counter("healthcheck")
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self) -> Optional[int]:
+        return self.store.clear_counter()
+
+    def clear(self, key: str) -> None:
+        self.store.clear_counter(key)
+
+
+def serialize(value: Any) -> bytes:
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def deserialize(data: bytes) -> Any:
+    return pickle.loads(data)
+
+
+shared_store = create_shared_store()
+
+
+async def take_lease(key: str, ttl: float) -> bool:
+    """
+    Whether this process is the first to take the lease `key` in the shared store within `ttl`
+    seconds, so that only one of several workers runs a scheduled job. Always True without a
+    shared store, and when the store fails, since running twice only repeats work.
+    """
+    if shared_store is None:
+        return True
+    from utils.executors import run_blocking
+
+    try:
+        return await run_blocking("default", shared_store.incr, f"lease:{key}", ttl) == 1
+    except Exception as e:
+        logger.warning("Could not take the lease %s, running anyway: %s", key, e)
+        return True
@@ -0,0 +1,164 @@
+import json
+import logging
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from models.structured_agent_response import TickerExtraction
+from tools.exchanges import EXCHANGE_COUNTRIES
+from utils.agent_prompts import TICKER_EXTRACTION_PROMPT
+from utils.llm_connection import LLMConnection
+from utils.metrics import metrics_callback
+
+logger = logging.getLogger(__name__)
+
+# Company names, aliases and exchange-qualified symbols used to resolve tickers without the LLM
+TICKER_INDEX_PATH = os.getenv(
+    "TICKER_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "tickers.json")
+)
+
+WORD_PATTERN = re.compile(r"[a-z0-9&]+")
+SYMBOL_PATTERN = re.compile(r"\$?[A-Za-z0-9&-]+(?:\.[A-Za-z]{1,2})?")
+# Trailing words dropped from company names, e.g. "Apple Inc." is indexed as "apple"
+NAME_SUFFIXES = {"inc", "ltd", "limited", "corp", "corporation", "co", "company", "plc", "group", "holdings", "and", "&"}
+_END = "$"
+# Upper case words that are finance jargon rather than tickers unless written as $EPS; bare
+# symbols of two letters or less (MA, MS, GS) also need the $ or an exchange suffix
+SYMBOL_STOPWORDS = {
+    "ATH", "ATL", "CEO", "CFO", "EBIT", "EPS", "ETF", "GDP", "IPO", "MACD", "NAV", "RSI", "SMA", "EMA",
+    "USA", "USD", "INR", "EUR", "YOY", "QOQ", "TTM", "FCF", "ROE", "ROI", "ROA", "DCF", "BUY", "SELL", "HOLD",
+}
+
+
+def _words(text: str) -> List[str]:
+    return WORD_PATTERN.findall(re.sub(r"'s\b|'", "", text.lower()))
+
+
+class TickerIndex():
+    """
+    In-memory index resolving a query to a canonical Yahoo Finance ticker.
+
+    Company names and aliases are stored in a word trie and matched longest first anywhere
+    in the query. Symbols are matched when written as symbols: prefixed with `$` or
+    exchange-qualified, which wins over names, or upper case, which only counts when no name
+    matched.
+    """
+
+    def __init__(self):
+        self._trie: Dict[str, Any] = {}
+        self._symbols: Dict[str, str] = {}
+
+    @classmethod
+    def load(cls, path: str) -> "TickerIndex":
+        index = cls()
+        try:
+            with open(path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Ticker index not loaded from %s: %s", path, e)
+            return index
+
+        for entry in entries:
+            index.add(entry["symbol"], [entry["name"], *entry.get("aliases", [])])
+        logger.info("Loaded ticker index with %s symbols from %s", len(index), path)
+        return index
+
+    def __len__(self) -> int:
+        return len(set(self._symbols.values()))
+
+    def add(self, symbol: str, names: Iterable[str]):
+        symbol = symbol.upper()
+        self._symbols[symbol] = symbol
+        base, _, suffix = symbol.rpartition(".")
+        if base and suffix in EXCHANGE_COUNTRIES:
+            self._symbols.setdefault(base, symbol)
+
+        for name in names:
+            words = _words(name)
+            while len(words) > 1 and words[-1] in NAME_SUFFIXES:
+                words.pop()
+            for variant in {tuple(words), tuple("and" if word == "&" else word for word in words)}:
+                if not variant:
+                    continue
+                node = self._trie
+                for word in variant:
+                    node = node.setdefault(word, {})
+                node[_END] = symbol
+
+    def lookup_symbol(self, token: str, explicit_only: bool = False) -> Optional[str]:
+        """
+        Canonical ticker for a token written as a symbol, e.g. $AAPL, RELIANCE.NS or TCS; a
+        bare upper case token only when `explicit_only` is False
+        """
+        explicit = token.startswith("$")
+        token = token.lstrip("$")
+        base, _, suffix = token.rpartition(".")
+        if base and suffix.upper() in EXCHANGE_COUNTRIES:
+            return token.upper()
+        if explicit:
+            return self._symbols.get(token.upper())
+        if not explicit_only and token.isupper() and len(token) > 2 and token not in SYMBOL_STOPWORDS:
+            return self._symbols.get(token)
+        return None
+
+    def match_name(self, query: str) -> Optional[str]:
+        """Ticker of the first company name or alias in the query, preferring the longest match"""
+        words = _words(query)
+        for start in range(len(words)):
+            node, symbol = self._trie, None
+            for word in words[start:]:
+                node = node.get(word)
+                if node is None:
+                    break
+                symbol = node.get(_END, symbol)
+            if symbol:
+                return symbol
+        return None
+
+    def resolve(self, query: str) -> Optional[str]:
+        """$ or exchange-qualified symbols first, then company names, then bare upper case symbols"""
+        tokens = SYMBOL_PATTERN.findall(query or "")
+        for explicit_only in (True, False):
+            for token in tokens:
+                symbol = self.lookup_symbol(token, explicit_only=explicit_only)
+                if symbol:
+                    return symbol
+            if explicit_only:
+                symbol = self.match_name(query or "")
+                if symbol:
+                    return symbol
+        return None
+
+
+ticker_index = TickerIndex.load(TICKER_INDEX_PATH)
+
+
+async def extract_ticker(query: str) -> Optional[str]:
+    """Ask the LLM for the ticker symbol a query is about"""
+    llm = LLMConnection().get_llm().with_structured_output(TickerExtraction)
+    try:
+        response = await llm.ainvoke([
+            SystemMessage(content=TICKER_EXTRACTION_PROMPT),
+            HumanMessage(content=query),
+        ], config={"callbacks": [metrics_callback]})
+    except Exception as e:
+        logger.error("Ticker extraction failed: %s", e)
+        return None
+
+    ticker = response.ticker.strip().upper() if response else ""
+    logger.info("Extracted ticker %s from query", ticker or None)
+    return ticker or None
+
+
+async def resolve_ticker(query: str) -> Tuple[Optional[str], Optional[str]]:
+    """Resolve the ticker of a query from the local index, asking the LLM only when that fails"""
+    ticker = ticker_index.resolve(query)
+    if ticker:
+        logger.info("Resolved ticker %s from the index", ticker)
+        return ticker, "index"
+
+    ticker = await extract_ticker(query)
+    return ticker, "llm" if ticker else None
@@ -0,0 +1,21 @@
+import math
+
+# Rough average for English text and JSON with both Gemini and OpenAI tokenizers
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens of a text without loading a tokenizer"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, suffix: str = "...") -> str:
+    """Truncate a text to roughly `max_tokens` tokens, cutting at a word boundary"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    limit = max(0, max_tokens * CHARS_PER_TOKEN - len(suffix))
+    truncated = text[:limit]
+    if " " in truncated:
+        truncated = truncated.rsplit(" ", 1)[0]
+    return truncated + suffix